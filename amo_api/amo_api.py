@@ -3,158 +3,35 @@ from typing import Optional, Any
 import dotenv
 import jwt
 import requests
+from requests.adapters import HTTPAdapter
+from collections.abc import AsyncIterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import aclosing
 from datetime import datetime
+import contextvars
 import logging
+import threading
+import time
 
 from pydantic import json
 from requests.exceptions import JSONDecodeError
 
 from db import User
+from amo_api.circuit_breaker import AmoUnavailableError, CircuitBreaker
+from amo_api.models import Contact, Customer, Lead
+from amo_api.pagination import iter_amo_entities, iter_amo_pages
+from service.metrics.outbound import endpoint_label, record_outbound
+from services.json_codec import dumps, loads
+from services.utils import phone_variants
 
 # from db import User
 
 logger = logging.getLogger(__name__)
 
+# Тело запросов сериализуем сами (orjson, если установлен), поэтому Content-Type ставим явно
+JSON_HEADERS = {"Content-Type": "application/json"}
 
 
-class Contact:
-    def __init__(self, **kwargs):
-        self.name = kwargs.get('name')
-        self.custom_fields_values = kwargs.get('custom_fields_values')
-        self.phone_list = self._get_contact_data_list(field_name='Телефон')
-        self.mail_list = self._get_contact_data_list(field_name='Email')
-
-    def _get_contact_data_list(self, field_name) -> list:
-        data = []
-        for field in self.custom_fields_values:
-            if field.get('field_name') == field_name:
-                for arg in field.get('values'):
-                    data.append(arg.get('value'))
-
-        return data
-
-    def __str__(self):
-        contact_message = f'\n{self.name}\n'
-
-        for number in self.phone_list:
-            value = f'📞 {number}\n'
-            contact_message = contact_message + value
-
-        for email in self.mail_list:
-            value = f'📧 {email}\n'
-            contact_message = contact_message + value
-
-        return contact_message
-
-
-class Customer:
-    # Список доступных статусов партнёра
-    partner_status_dct: dict[str, list] = {
-        'Отсутствует': ['скидка 0%', 0],
-        'Старт': ['скидка 15%', 0],
-        'База': ['скидка 20%', 100000],
-        'Бронза': ['скидка 25%', 200000],
-        'Серебро': ['скидка 30%', 500000],
-        'Золото': ['скидка 35%',],
-        'Платина': ['скидка 40%',],
-        'Бизнес': ['скидка 40%',],
-        'Эксклюзив': ['Индивидуальные условия',]
-    }
-
-    partner_status_list: list = [
-        'Отсутствует', 'Старт', 'База', 'Бронза', 'Серебро', 'Золото', 'Платина', 'Бизнес', 'Эксклюзив'
-    ]
-
-    def __init__(self, fields_id: dict[str, int]):
-        self.fields_id = fields_id
-
-    def __call__(self, customer_dct: dict):
-        self.id = customer_dct.get('id')
-        self.name = customer_dct['name']
-        self.itv = customer_dct.get('itv')  # Сумма покупок партнёра
-        self.custom_fields = customer_dct['custom_fields_values']
-        self.manager = customer_dct.get('manager').get('name')
-        self.status = self.get_status(self.custom_fields)
-        self.bye_in_this_period = self.bye_this_period(self.custom_fields)
-        self.bonuses = self.get_bonuses(self.custom_fields)
-        self.town = self.get_town(self.custom_fields)
-        self.next_status = self.get_next_status(self.status)
-        self.tg_id: bool = self.get_customer_tg_id(self.custom_fields)
-        self.full_price = self.get_customer_full_price(self.custom_fields)
-
-
-        return self
-
-    def get_customer_full_price(self, values: list):
-        if values is None:
-            return 0
-        full_price_list = [res for res in values if res['field_id'] == self.fields_id.get('full_price')]
-        if not full_price_list:
-            return 0
-        full_price = full_price_list[0].get('values')[0].get('value')
-        full_price = f'{int(full_price):,}'.replace(',', ' ')
-        return full_price
-
-    def get_customer_tg_id(self, values: list):
-        if values is None:  # Если нет записанного id_tg у партнёра, то True иначе False
-            return True
-
-        tg_id = [res for res in values if res['field_id'] == self.fields_id.get('tg_id_field')]
-        if tg_id:
-            return False
-        return True
-
-
-    def get_status(self, values: list):
-        if values is None:
-            return f'Отсутствует, {self.partner_status_dct.get("Отсутствует")[0]}'
-        status = [res for res in values if res['field_id'] == self.fields_id.get('status_id_field')]
-        if not status:
-            return f'Отсутствует, {self.partner_status_dct.get("Отсутствует")[0]}'
-        status_value: str = status[0].get('values')[0].get('value').split()[0]
-        return f'{status_value}, {self.partner_status_dct.get(status_value)[0]}'
-
-    def bye_this_period(self, values: list):
-        if values is None:
-            return 0
-        summ = [res for res in values if res['field_id'] == self.fields_id.get('by_this_period_id_field')]
-        if not summ:
-            return 0
-        summ_value = summ[0].get('values')[0].get('value')
-        return summ_value
-
-    def get_bonuses(self, values: list):
-        if values is None:
-            return 0
-        bonuses = [res for res in values if res['field_id'] == self.fields_id.get('bonuses_id_field')]
-        if not bonuses:
-            return 0
-        bonuses_value = bonuses[0].get('values')[0].get('value')
-        bonuses_value = f'{int(bonuses_value):,}'.replace(',', ' ')
-        return bonuses_value
-
-    def get_town(self, values: list):
-        if values is None:
-            return 'Отсутствует'
-        town = [res for res in values if res['field_id'] == self.fields_id.get('town_id_field')]
-        if not town:
-            return 'Отсутствует'
-        town_value = town[0].get('values')[0].get('value')
-        return town_value
-
-    def get_next_status(self, partner_status):
-        ind = 1
-        for index, status in enumerate(self.partner_status_list):
-            if status in partner_status.split()[0]:
-                ind = index
-
-        if len(self.partner_status_list) == ind + 1:
-            next_status = self.partner_status_list[ind]
-        else:
-            next_status = self.partner_status_list[ind+1]
-
-        return f'{next_status}, {self.partner_status_dct.get(next_status)[0]}'
-
 
 class AmoCRMWrapper:
     def __init__(self,
@@ -165,7 +42,11 @@ class AmoCRMWrapper:
                  amocrm_redirect_url: str,
                  amocrm_access_token: str | None,
                  amocrm_refresh_token: str | None,
-                 amocrm_secret_code: str
+                 amocrm_secret_code: str,
+                 http_pool_size: int = 10,
+                 request_timeout: float = 10.0,
+                 breaker: CircuitBreaker | None = None,
+                 base_url: str | None = None,
                  ):
         self.path_to_env = path
         self.amocrm_subdomain = amocrm_subdomain
@@ -175,7 +56,21 @@ class AmoCRMWrapper:
         self.amocrm_access_token = amocrm_access_token
         self.amocrm_refresh_token = amocrm_refresh_token
         self.amocrm_secret_code = amocrm_secret_code
-
+        # Адрес аккаунта; для нагрузочных прогонов подменяется на локальный bench.fake_amo
+        self.base_url = (base_url or "https://{}.amocrm.ru".format(amocrm_subdomain)).rstrip('/')
+
+        # Общая HTTP-сессия: соединения с amoCRM переиспользуются между запросами (keep-alive)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=http_pool_size)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        # Пул для параллельных запросов внутри одного метода (например, поиск по вариантам телефона)
+        self._lookup_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='amo-lookup')
+        # refresh_token одноразовый: обновлять токены должен только один поток
+        self._token_lock = threading.Lock()
+        # (connect, read) таймаут для каждого запроса: без него зависший amoCRM держит хендлеры бесконечно
+        self.request_timeout = (min(request_timeout, 5.0), request_timeout)
+        self.breaker = breaker or CircuitBreaker()
 
     @staticmethod
     def _is_expire(token: str):
@@ -202,8 +97,9 @@ class AmoCRMWrapper:
             "refresh_token": self.amocrm_refresh_token,
             "redirect_uri": self.amocrm_redirect_url
         }
-        response = requests.post("https://{}.amocrm.ru/oauth2/access_token".format(self.amocrm_subdomain),
-                                 json=data).json()
+        response = loads(self._session.post(self.base_url + "/oauth2/access_token",
+                                            data=dumps(data), headers=JSON_HEADERS,
+                                            timeout=self.request_timeout).content)
         try:
             access_token = response["access_token"]
             refresh_token = response["refresh_token"]
@@ -222,8 +118,9 @@ class AmoCRMWrapper:
             "redirect_uri": self.amocrm_redirect_url
         }
 
-        response = requests.post("https://{}.amocrm.ru/oauth2/access_token".format(self.amocrm_subdomain),
-                                 json=data).json()
+        response = loads(self._session.post(self.base_url + "/oauth2/access_token",
+                                            data=dumps(data), headers=JSON_HEADERS,
+                                            timeout=self.request_timeout).content)
         logger.error(f'{response}')
 
         access_token = response["access_token"]
@@ -232,66 +129,119 @@ class AmoCRMWrapper:
         self._save_tokens(access_token, refresh_token)
 
     def _base_request(self, **kwargs) -> json:
+        self.breaker.before_call()
+        operation = f'{kwargs.get("type")} {endpoint_label(kwargs.get("endpoint") or "")}'
+        started = time.perf_counter()
+        try:
+            response = self._send_request(**kwargs)
+        except requests.RequestException as error:
+            record_outbound('amocrm', operation, type(error).__name__, time.perf_counter() - started)
+            self.breaker.record_failure()
+            raise AmoUnavailableError(f'Запрос к amoCRM {kwargs.get("endpoint")} не выполнен: {error!r}') from error
+        except BaseException as error:
+            # Любой выход должен отпустить пробный запрос, иначе предохранитель навсегда останется полуоткрытым
+            record_outbound('amocrm', operation, type(error).__name__, time.perf_counter() - started)
+            self.breaker.record_failure()
+            raise
+        record_outbound('amocrm', operation, response.status_code, time.perf_counter() - started,
+                        kwargs.get('endpoint') or '')
+
+        # 5xx и 429 - признак перегрузки или аварии на стороне amoCRM, 4xx - ошибки самого запроса
+        if response.status_code >= 500 or response.status_code == 429:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    @staticmethod
+    def _raise_if_unavailable(response, endpoint: str) -> None:
+        if response.status_code >= 500 or response.status_code == 429:
+            raise AmoUnavailableError(f'amoCRM вернул {response.status_code} на {endpoint}')
+
+    def _send_request(self, **kwargs):
         if self._is_expire(self._get_access_token()):
-            self._get_new_tokens()
+            with self._token_lock:
+                if self._is_expire(self._get_access_token()):
+                    self._get_new_tokens()
 
         access_token = "Bearer " + self._get_access_token()
 
         headers = {"Authorization": access_token}
         req_type = kwargs.get("type")
+        timeout = self.request_timeout
         response = ""
         if req_type == "get":
-            response = requests.get("https://{}.amocrm.ru{}".format(
-                self.amocrm_subdomain, kwargs.get("endpoint")), headers=headers)
+            response = self._session.get("{}{}".format(
+                self.base_url, kwargs.get("endpoint")), headers=headers, timeout=timeout)
 
         elif req_type == "get_param":
-            url = "https://{}.amocrm.ru{}?{}".format(
-                self.amocrm_subdomain,
+            url = "{}{}?{}".format(
+                self.base_url,
                 kwargs.get("endpoint"), kwargs.get("parameters"))
-            response = requests.get(str(url), headers=headers)
+            response = self._session.get(str(url), headers=headers, timeout=timeout)
 
         elif req_type == "post":
-            response = requests.post("https://{}.amocrm.ru{}".format(
-                self.amocrm_subdomain,
-                kwargs.get("endpoint")), headers=headers, json=kwargs.get("data"))
+            response = self._session.post("{}{}".format(
+                self.base_url,
+                kwargs.get("endpoint")), headers={**headers, **JSON_HEADERS}, data=dumps(kwargs.get("data")), timeout=timeout)
 
         elif req_type == 'patch':
-            response = requests.patch("https://{}.amocrm.ru{}".format(
-                self.amocrm_subdomain,
-                kwargs.get("endpoint")), headers=headers, json=kwargs.get("data"))
+            response = self._session.patch("{}{}".format(
+                self.base_url,
+                kwargs.get("endpoint")), headers={**headers, **JSON_HEADERS}, data=dumps(kwargs.get("data")), timeout=timeout)
         return response
 
-    def get_contact_by_phone(self, phone_number) -> tuple[bool, dict|str]:
+    def check_connection(self) -> bool:
+        """Лёгкий запрос к аккаунту: открывает соединение в пуле сессии и проверяет токен."""
+        response = self._base_request(type='get', endpoint='/api/v4/account')
+        return response.status_code == 200
+
+    def get_contact_by_phone(self, phone_number) -> tuple[bool, Contact|str]:
 
         logger.info(f'Получен телефон клиента: {[phone_number]}')
 
         url = '/api/v4/contacts'
-        query = str(f'query={phone_number}')
-        contact = self._base_request(endpoint=url, type="get_param", parameters=query)
-
-        if contact.status_code == 200:
-            contacts_list = contact.json()['_embedded']['contacts']
+        # Номер может храниться в amoCRM как 7... или 8..., поэтому ищем оба варианта одновременно
+        # и берём первый найденный, а не ждём 204 на первый запрос
+        variants = phone_variants(phone_number) or [str(phone_number)]
+        # Каждый запрос идёт со своей копией контекста, чтобы его время попало в трейс вызвавшего обновления
+        futures = [
+            self._lookup_pool.submit(contextvars.copy_context().run, self._base_request,
+                                     endpoint=url, type="get_param", parameters=f'query={variant}')
+            for variant in variants
+        ]
 
-            return True, contacts_list[0]
-        elif contact.status_code == 204:
-            logger.info(f'Номер телефона {[phone_number]} не найден, пробуем найти через 8')
-            phone_number = '8' + phone_number[1:]
-            logger.info(f"Пробуем найти номер {phone_number}")
+        server_error = False
+        unavailable = None
+        for future in as_completed(futures):
+            try:
+                contact = future.result()
+            except AmoUnavailableError as error:
+                unavailable = error
+                continue
+            except Exception as error:
+                logger.error(f'Ошибка запроса контакта по телефону {[phone_number]}: {error!r}')
+                server_error = True
+                continue
 
-            query = str(f'query={phone_number}')
-            contact = self._base_request(endpoint=url, type="get_param", parameters=query)
             if contact.status_code == 200:
-                contacts_list = contact.json()['_embedded']['contacts']
-                return True, contacts_list[0]
-            else:
-                return False, 'Контакт не найден'
-
-        else:
+                for pending in futures:
+                    pending.cancel()
+                contacts_list = loads(contact.content)['_embedded']['contacts']
+                return True, Contact.from_api(contacts_list[0])
+            elif contact.status_code != 204:
+                server_error = True
+
+        if unavailable is not None:
+            # Не знаем, есть ли контакт: пусть вызывающий код переходит в режим без amoCRM
+            raise unavailable
+
+        if server_error:
             logger.error('Нет авторизации в AMO_API')
             return False, 'Произошла ошибка на сервере!'
 
-
-
+        logger.info(f'Номер телефона {[phone_number]} не найден ни в одном из вариантов: {variants}')
+        return False, 'Контакт не найден'
 
     def get_customer_by_id(self, customer_id, with_contacts=False) -> tuple:
         url = f'/api/v4/customers/{customer_id}'
@@ -304,7 +254,7 @@ class AmoCRMWrapper:
         except Exception:
             return False, "Произошла ошибка на сервере"
         if customer.status_code == 200:
-            return True, customer.json()
+            return True, loads(customer.content)
         elif customer.status_code == 204:
             return False, 'Партнёр не найден!'
         else:
@@ -331,7 +281,7 @@ class AmoCRMWrapper:
         response = self._base_request(endpoint=url, type='get_param', parameters=query)
 
         if response.status_code == 200:
-            customer_list = response.json()['_embedded']['customers']
+            customer_list = loads(response.content)['_embedded']['customers']
 
             if len(customer_list) > 1:
                 return {'status_code': False,
@@ -362,7 +312,7 @@ class AmoCRMWrapper:
         query = str(f'filter[custom_fields_values][{field_id}][]={tg_id}')
         response = self._base_request(endpoint=url, type='get_param', parameters=query)
         if response.status_code == 200:
-            contacts_list = response.json()['_embedded']['contacts']
+            contacts_list = loads(response.content)['_embedded']['contacts']
 
             if len(contacts_list) > 1:
                 return {'status_code': False,
@@ -525,7 +475,55 @@ class AmoCRMWrapper:
             }
         ]
         response = self._base_request(type='post', endpoint=url, data=data)
-        return response.json()
+        return loads(response.content)
+
+    def add_notes_to_leads(self, notes: list[dict]) -> tuple[int, list[dict]]:
+        """Пакетное добавление примечаний: notes - список {'lead_id': ..., 'text': ...}, не больше 50 за раз.
+        Возвращает HTTP-статус и созданные примечания в порядке входного списка (если пакет отклонён, все пустые).
+        Бросает AmoUnavailableError на 5xx и 429: пакет не виноват, делить его бессмысленно."""
+        url = '/api/v4/leads/notes'
+        data = [
+            {
+                'entity_id': int(note['lead_id']),
+                'note_type': 'common',
+                'request_id': str(index),
+                'params': {
+                    'text': note['text']
+                }
+            }
+            for index, note in enumerate(notes)
+        ]
+        response = self._base_request(type='post', endpoint=url, data=data)
+        self._raise_if_unavailable(response, url)
+        if response.status_code != 200:
+            logger.warning(f'amoCRM вернул {response.status_code} на пакет примечаний: {response.text}')
+            return response.status_code, [{} for _ in notes]
+
+        created = loads(response.content).get('_embedded', {}).get('notes', [])
+        by_request_id = {str(note.get('request_id')): note for note in created}
+        return response.status_code, [by_request_id.get(str(index), {}) for index in range(len(notes))]
+
+    def push_leads_to_statuses(self, leads: list[dict]) -> tuple[int, bool]:
+        """Пакетный перевод сделок по этапам: leads - список {'lead_id', 'pipeline_id', 'status_id'},
+        не больше 50 за раз. Возвращает HTTP-статус и признак успеха; на 5xx и 429 бросает AmoUnavailableError."""
+        url = '/api/v4/leads'
+        data = [
+            {
+                'id': int(lead['lead_id']),
+                'pipeline_id': int(lead['pipeline_id']),
+                'status_id': int(lead['status_id']),
+                'updated_by': 0,
+            }
+            for lead in leads
+        ]
+        response = self._base_request(type='patch', endpoint=url, data=data)
+        self._raise_if_unavailable(response, url)
+
+        if response.status_code == 200:
+            return response.status_code, True
+        else:
+            logger.warning(f'amoCRM вернул {response.status_code} на пакетный перевод сделок: {response.text}')
+            return response.status_code, False
 
     def add_catalog_elements_to_lead(self, lead_id, catalog_id: int, elements: list[dict,]):
         url = f'/api/v4/leads/{lead_id}/link'
@@ -543,7 +541,7 @@ class AmoCRMWrapper:
             }
             data.append(element_for_record)
         response = self._base_request(type='post', endpoint=url, data=data)
-        return response.json()
+        return loads(response.content)
 
     # def get_catalog_by_id(self, catalog_id: int, page: int, limit:int):
     #     url = f'/api/v4/catalogs/{catalog_id}/elements'
@@ -560,47 +558,64 @@ class AmoCRMWrapper:
         filter = str(f'filter[custom_fields][1105082][from]={partner_id}&filter[custom_fields][1105082][to]={partner_id}')
         response = self._base_request(type='get_param', endpoint=url, parameters=filter)
         print(response.url)
-        return response.json()
+        return loads(response.content)
 
 
     def get_contact_by_id(self, contact_id) -> dict:
         url = f'/api/v4/contacts/{contact_id}'
         response = self._base_request(type='get', endpoint=url)
 
-        return response.json()
+        return loads(response.content)
 
     def get_responsible_user_by_id(self, manager_id: int):
         url = f'/api/v4/users/{manager_id}'
 
         responsible_manager = self._base_request(endpoint=url, type='get')
         if responsible_manager.status_code == 200:
-            return responsible_manager.json()
+            return loads(responsible_manager.content)
         else:
             raise JSONDecodeError
 
     def get_lead_by_id(self, lead_id):
         url = f'/api/v4/leads/{lead_id}'
         response = self._base_request(type='get', endpoint=url)
-        return response.json()
+        return loads(response.content)
 
     @staticmethod
     def get_customer_params(customer_dct: dict[str, str], fields_id: dict) -> Customer:
-        customer = Customer(fields_id)
-        customer = customer(customer_dct)
-        return customer
-
-
-    def get_customers_list_if_tg(self):
-        url = f'/api/v4/customers/'
-        limit = 250
-        page = 1
-        filter = {
-            'filter[custom_fields][5B1104992][from]': '1',
-            # 'page': '1'
-        }
-        response = self._base_request(type='get_param', endpoint=url, parameters=filter)
-        logger.info(f'Статус код запроса записей покупателя: {response.status_code}')
-        return response.json()
+        return Customer.from_api(customer_dct, fields_id)
+
+
+    async def get_customers_list_if_tg(self) -> AsyncIterator[dict]:
+        """Покупатели с заполненным полем 1104992, по одному, без загрузки всего списка в память."""
+        query = 'filter[custom_fields][1104992][from]=1'
+        async for customer in iter_amo_entities(self, '/api/v4/customers', 'customers', query):
+            yield customer
+
+    @staticmethod
+    def _build_phone_fields(phone: str) -> list[dict]:
+        return [
+            {"field_id": 671750,
+             "values": [
+                 {'enum_code': 'WORK',
+                  "value": str(phone)
+                  },]
+             },
+        ]
+
+    @staticmethod
+    def _build_utm_fields(utm_metriks_fields: dict, user: User) -> list[dict]:
+        custom_fields_values = []
+        for metrik, metrika_id in utm_metriks_fields.items():
+            custom_fields_values.append({
+                'field_id': metrika_id,
+                'values': [
+                    {
+                        'value': getattr(user, metrik)
+                    }
+                ]
+            })
+        return custom_fields_values
 
     def create_new_contact(self, first_name: str, last_name: str, phone: str
                            ):
@@ -609,19 +624,45 @@ class AmoCRMWrapper:
             'first_name': first_name,
             'last_name': last_name,
             'responsible_user_id': 453498,
-            'custom_fields_values': [
-                {"field_id": 671750,
-                 "values": [
-                     {'enum_code': 'WORK',
-                      "value": str(phone)
-                      },]
-                 },
-            ],
+            'custom_fields_values': self._build_phone_fields(phone),
         }]
         response = self._base_request(type='post', endpoint=url, data=data)
-        contact_id = response.json().get('_embedded').get('contacts')[0].get('id')
+        contact_id = loads(response.content).get('_embedded').get('contacts')[0].get('id')
         return contact_id
 
+    def create_contact_with_lead(self, first_name: str, last_name: str, phone: str, pipeline_id: int, status_id: int,
+                                 utm_metriks_fields: dict, user: User) -> tuple[int, int]:
+        """
+        Создать контакт и сделку с UTM метками одним запросом через /api/v4/leads/complex.
+
+        :return: (id контакта, id сделки)
+        """
+        url = '/api/v4/leads/complex'
+        data = [{
+            'name': 'Автосделка из бота MAX',
+            'pipeline_id': int(pipeline_id),
+            'created_by': 0,
+            'status_id': int(status_id),
+            'responsible_user_id': 453498,
+            'custom_fields_values': self._build_utm_fields(utm_metriks_fields, user),
+            '_embedded': {
+                'contacts': [
+                    {
+                        'first_name': first_name,
+                        'last_name': last_name,
+                        'responsible_user_id': 453498,
+                        'custom_fields_values': self._build_phone_fields(phone),
+                    }
+                ]
+            }
+        }]
+        response = self._base_request(type='post', endpoint=url, data=data)
+        if response.status_code >= 400:
+            raise RuntimeError(f"amoCRM error {response.status_code}: {response.text}")
+
+        created = loads(response.content)[0]
+        return created.get('contact_id'), created.get('id')
+
     def add_tg_to_contact(self, contact_id: int, tg_id_field: int, tg_id: str, username_id: int, username: str):
         url = f'/api/v4/contacts/{contact_id}'
         data = {
@@ -651,8 +692,8 @@ class AmoCRMWrapper:
     def _find_lead_by_contact_in_pipeline_stage_old(
             self,
             contact_id: str,
-            pipeline_id: int,
-            status_id: int,
+            pipeline_id: int | str,
+            status_id: int | str,
             *,
             with_entities: bool = True
     ) -> Optional[int]:
@@ -690,7 +731,7 @@ class AmoCRMWrapper:
             # тут можно логировать response.text
             raise RuntimeError(f"amoCRM error {response.status_code}: {response.text}")
 
-        payload = response.json()
+        payload = loads(response.content)
         pprint(payload, indent=4)
 
         # Если сделок нет, amoCRM обычно возвращает {} или {"_page":..., "_embedded": {...}}
@@ -721,7 +762,22 @@ class AmoCRMWrapper:
 
         return None
 
-    def find_lead_by_contact_in_pipeline_stage(
+    def get_page(self, endpoint: str, entity: str, query: str, page: int, limit: int = 250) -> tuple[list[dict], bool]:
+        """Одна страница списка amoCRM. Возвращает сущности из _embedded[entity] и признак следующей страницы."""
+        parameters = f'{query}&' if query else ''
+        parameters += f'limit={limit}&page={page}'
+        response = self._base_request(type="get_param", endpoint=endpoint, parameters=parameters)
+        if response.status_code == 204:
+            return [], False
+        if response.status_code >= 400:
+            raise RuntimeError(f"amoCRM error {response.status_code}: {response.text}")
+
+        payload = loads(response.content)
+        items = payload.get("_embedded", {}).get(entity, []) or []
+        has_next = bool(payload.get("_links", {}).get("next"))
+        return items, has_next
+
+    async def find_lead_by_contact_in_pipeline_stage(
             self,
             contact_id: str,
             pipeline_id: int,
@@ -729,107 +785,45 @@ class AmoCRMWrapper:
             *,
             with_entities: bool = True
     ) -> Optional[int]:
-        page = 1
-        limit = 250
         target_contact_id = int(contact_id)
         target_pipeline_id = int(pipeline_id)
         target_status_id = int(status_id)
+        query = (
+            f'filter[pipeline_id][]={target_pipeline_id}&'
+            f'filter[statuses][0][pipeline_id]={target_pipeline_id}&'
+            f'filter[statuses][0][status_id]={target_status_id}&'
+            f'with=contacts'
+        )
 
-        while True:
-            query = (
-                f'filter[pipeline_id][]=3616530&'
-                f'filter[statuses][0][pipeline_id]=3616530&'
-                f'filter[statuses][0][status_id]=47244117&'
-                f'with=contacts&'
-                f'limit={limit}&'
-                f'page={page}'
-            )
-
-            response = self._base_request(
-                type="get_param",
-                endpoint="/api/v4/leads",
-                parameters=query,
-            )
-            if response.status_code >= 400:
-                raise RuntimeError(f"amoCRM error {response.status_code}: {response.text}")
-
-            payload = response.json()
-
-            leads = payload.get("_embedded", {}).get("leads", []) or []
-            if not leads:
-                return None
-
-            for lead in leads:
-                if int(lead.get("pipeline_id", -1)) != target_pipeline_id:
-                    continue
-                if int(lead.get("status_id", -1)) != target_status_id:
-                    continue
-
-                lead_contacts = lead.get("_embedded", {}).get("contacts", []) or []
-                if not lead_contacts:
-                    continue
-
-                main_contact = None
-                for lead_contact in lead_contacts:
-                    is_main = lead_contact.get("is_main")
-                    if is_main is True or str(is_main).lower() in {"1", "true"}:
-                        main_contact = lead_contact
-                        break
-
-                if main_contact is None and len(lead_contacts) == 1:
-                    main_contact = lead_contacts[0]
-                if main_contact is None:
-                    continue
-
-                try:
-                    main_contact_id = int(main_contact.get("id", -1))
-                except (TypeError, ValueError):
+        # Страницы читаются с опережением и перебор прекращается на первой подходящей сделке
+        async with aclosing(iter_amo_entities(self, "/api/v4/leads", "leads", query)) as leads:
+            async for lead_dct in leads:
+                lead = Lead.from_api(lead_dct)
+                if lead.pipeline_id != target_pipeline_id or lead.status_id != target_status_id:
                     continue
+                if lead.main_contact_id == target_contact_id:
+                    return lead.id
+        return None
 
-                if main_contact_id == target_contact_id:
-                    return lead.get("id")
-
-            if not payload.get("_links", {}).get("next"):
-                return None
+    # Прежнее имя: вызывается из amo_service и бенчмарков
+    find_lead_by_contact_in_pipeline_stage_new = find_lead_by_contact_in_pipeline_stage
 
+    async def test(self):
+        query = (
+            f'filter[pipeline_id][]=3616530&'
+            f'filter[statuses][0][pipeline_id]=3616530&'
+            f'filter[statuses][0][status_id]=47244117&'
+            f'with=contacts'
+        )
+        page = 0
+        async for page_items in iter_amo_pages(self, "/api/v4/leads", "leads", query):
             page += 1
-
-
-    def test(self):
-        endpoint = "/api/v4/leads"
-        page = 1
-        limit = 250
-        while True:
             logger.info(f'Запрос сделок, страница: {page}')
-            query = (
-                f'filter[pipeline_id][]=3616530&'
-                f'filter[statuses][0][pipeline_id]=3616530&'
-                f'filter[statuses][0][status_id]=47244117&'
-                f'with=contacts&'
-                f'limit={limit}&'
-                f'page={page}'
-            )
-
-            response = self._base_request(endpoint=endpoint, type='get_param', parameters=query)
-
-            page_items = response.json().get('_embedded', {}).get('leads', [])
-            if len(page_items) < limit:
-                break
-            page += 1
             pprint(page_items, indent=4)
 
     def send_lead_to_amo(self, pipeline_id: int, status_id: int, contact_id: int, utm_metriks_fields: dict,
                          user: User):
-        custom_fields_values = []
-        for metrik, metrika_id in utm_metriks_fields.items():
-            custom_fields_values.append({
-                'field_id': metrika_id,
-                'values': [
-                    {
-                        'value': getattr(user, metrik)
-                    }
-                ]
-            })
+        custom_fields_values = self._build_utm_fields(utm_metriks_fields, user)
         url = f'/api/v4/leads'
         data = [{
             'name': 'Автосделка из бота MAX',
@@ -848,82 +842,9 @@ class AmoCRMWrapper:
 
         }, ]
         response = self._base_request(type='post', endpoint=url, data=data)
-        lead_id = response.json().get('_embedded').get('leads')[0].get('id')
+        lead_id = loads(response.content).get('_embedded').get('leads')[0].get('id')
         return lead_id
 
-    def find_lead_by_contact_in_pipeline_stage_new(
-            self,
-            contact_id: str,
-            pipeline_id: str,
-            status_id: str,
-            *,
-            with_entities: bool = True
-    ) -> Optional[int]:
-        page = 1
-        limit = 250
-        target_contact_id = int(contact_id)
-        target_pipeline_id = int(pipeline_id)
-        target_status_id = int(status_id)
-
-        while True:
-            query = (
-                f'filter[pipeline_id][]=3616530&'
-                f'filter[statuses][0][pipeline_id]=3616530&'
-                f'filter[statuses][0][status_id]=47244117&'
-                f'with=contacts&'
-                f'limit={limit}&'
-                f'page={page}'
-            )
-
-            response = self._base_request(
-                type="get_param",
-                endpoint="/api/v4/leads",
-                parameters=query,
-            )
-            if response.status_code >= 400:
-                raise RuntimeError(f"amoCRM error {response.status_code}: {response.text}")
-
-            payload = response.json()
-
-            leads = payload.get("_embedded", {}).get("leads", []) or []
-            if not leads:
-                return None
-
-            for lead in leads:
-                if int(lead.get("pipeline_id", -1)) != target_pipeline_id:
-                    continue
-                if int(lead.get("status_id", -1)) != target_status_id:
-                    continue
-
-                lead_contacts = lead.get("_embedded", {}).get("contacts", []) or []
-                if not lead_contacts:
-                    continue
-
-                main_contact = None
-                for lead_contact in lead_contacts:
-                    is_main = lead_contact.get("is_main")
-                    if is_main is True or str(is_main).lower() in {"1", "true"}:
-                        main_contact = lead_contact
-                        break
-
-                if main_contact is None and len(lead_contacts) == 1:
-                    main_contact = lead_contacts[0]
-                if main_contact is None:
-                    continue
-
-                try:
-                    main_contact_id = int(main_contact.get("id", -1))
-                except (TypeError, ValueError):
-                    continue
-
-                if main_contact_id == target_contact_id:
-                    return lead.get("id")
-
-            if not payload.get("_links", {}).get("next"):
-                return None
-
-            page += 1
-
 
 
 
@@ -1,35 +1,57 @@
+import asyncio
+import logging
+
 from amo_api.amo_api import AmoCRMWrapper
+from amo_api.batcher import AmoWriteBatcher
+from amo_api.contact_cache import get_cached_contact, invalidate_cached_contact, save_cached_contact
+from amo_api.lead_status import push_lead_status, save_lead_status
+from amo_api.models import Contact
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from db.models import User
+from db.models import AmoOutbox, User, HpLessonResult as LessonResult
+from services.utils import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+
+async def processing_contact(amo_api: AmoCRMWrapper,
+                             session: AsyncSession,
+                             contact_phone_number: str,) -> dict|None:
+    phone = normalize_phone(contact_phone_number) or contact_phone_number
 
+    cached = await get_cached_contact(session, phone)
+    if cached is not None: # Контакт уже находили по этому номеру
+        return {
+            "first_name": cached.first_name or "",
+            "last_name": cached.last_name or "",
+            "phone_number": contact_phone_number,
+            "amo_contact_id": cached.amo_contact_id,
+        }
 
-def processing_contact(amo_api: AmoCRMWrapper,
-                       contact_phone_number: str,) -> dict|None:
-    contact_amo: tuple[bool, dict|str] = amo_api.get_contact_by_phone(phone_number=contact_phone_number)
+    contact_amo: tuple[bool, Contact|str] = await asyncio.to_thread(amo_api.get_contact_by_phone, phone_number=phone)
     if contact_amo[0]: # Контакт найден
         contact = contact_amo[1]
-        first_name = contact.get("first_name", "")
-        last_name = contact.get("last_name", "")
-        amo_id = contact.get('id', '')
-        tg_id = [field for field in contact.get('custom_fields_values') if field.get('field_id') == 1097296]
+        first_name = contact.first_name
+        last_name = contact.last_name
+        amo_id = contact.id
+        await save_cached_contact(session, phone, amo_contact_id=amo_id, first_name=first_name, last_name=last_name)
 
         return {
             "first_name": first_name,
             "last_name": last_name,
             "phone_number": contact_phone_number,
             "amo_contact_id": amo_id,
-            'tg_id': tg_id
         }
     else:
         return None
 
 
-def processing_lead(amo_api: AmoCRMWrapper,
-                    contact_id: str,
-                    pipeline_id: str,
-                    status_id: str) -> dict|None:
+async def processing_lead(amo_api: AmoCRMWrapper,
+                          contact_id: str,
+                          pipeline_id: str,
+                          status_id: str) -> dict|None:
 
-    lead_id = amo_api.find_lead_by_contact_in_pipeline_stage_new(contact_id=str(contact_id),
+    lead_id = await amo_api.find_lead_by_contact_in_pipeline_stage_new(contact_id=str(contact_id),
                                                           pipeline_id=pipeline_id,
                                                           status_id=status_id)
     if lead_id is not None:
@@ -39,3 +61,206 @@ def processing_lead(amo_api: AmoCRMWrapper,
     else:
         return None
 
+
+
+async def _get_user_by_max_id(session: AsyncSession, max_id: int) -> User | None:
+    result = await session.execute(select(User).where(User.max_user_id == max_id))
+    return result.scalar_one_or_none()
+
+
+async def authorize_locally(session: AsyncSession, max_id: int, phone: str | None, client_type: str | None,
+                            utm_data: dict) -> User:
+    """Авторизация без amoCRM: заводим или обновляем запись USER только в БД.
+    Контакт и сделку догонит очередь синхронизации, когда amoCRM снова станет доступен."""
+    user = await _get_user_by_max_id(session, max_id)
+    if user is None:
+        user = User(
+            max_user_id=max_id,
+            utm_campaign=utm_data.get("utm_campaign", ''),
+            utm_medium=utm_data.get("utm_medium", ''),
+            utm_content=utm_data.get("utm_content", ''),
+            utm_term=utm_data.get("utm_term", ''),
+            utm_source=utm_data.get("utm_source", ''),
+            yclid=utm_data.get("yclid", ''),
+        )
+        session.add(user)
+    user.phone_number = phone
+    if client_type:
+        user.client_type = client_type
+    await session.commit()
+    await session.refresh(user)
+    return user
+
+
+async def _merge_local_user(session: AsyncSession, local_user: User | None, user: User) -> None:
+    # Запись, заведённая без amoCRM, и найденная по контакту запись - один и тот же человек:
+    # переносим пройденные уроки и отложенные записи в amoCRM и освобождаем max_user_id для основной записи.
+    # Без переноса amo_outbox удалится каскадом вместе с local_user, и результаты уроков не дойдут до amoCRM
+    if local_user is None or local_user is user or local_user.amo_contact_id is not None:
+        return
+    await session.execute(
+        update(LessonResult).where(LessonResult.user_id == local_user.id).values(user_id=user.id)
+    )
+    await session.execute(
+        update(AmoOutbox).where(AmoOutbox.user_id == local_user.id).values(user_id=user.id)
+    )
+    await session.delete(local_user)
+    await session.flush()
+
+
+async def authorize_in_amo(session: AsyncSession,
+                           amo_api: AmoCRMWrapper,
+                           amo_batcher: AmoWriteBatcher,
+                           amo_fields: dict,
+                           max_id: int,
+                           phone: str | None,
+                           client_type: str | None,
+                           utm_data: dict) -> User:
+    """Находит или создаёт контакт и сделку обучения в amoCRM и связывает их с записью USER.
+    Бросает AmoUnavailableError, если amoCRM не отвечает."""
+    pipelines = amo_fields.get('pipelines')
+    status_fields = amo_fields.get('statuses')
+    utm_metriks = amo_fields.get('fields_id').get('utm_metriks')
+
+    local_user = await _get_user_by_max_id(session, max_id)
+
+    contact_data = await processing_contact(amo_api=amo_api, session=session, contact_phone_number=str(phone))
+    if contact_data is not None:
+        """Если контакт в АМО найден, то ищем в БД запись USER по полю amo_deal_id"""
+        amo_contact_id = contact_data.get("amo_contact_id")
+        result = await session.execute(select(User).where(User.amo_contact_id == amo_contact_id))
+        user = result.scalar_one_or_none()
+
+        if user is not None:
+            await _merge_local_user(session, local_user, user)
+            user.max_user_id = max_id
+            await session.commit()
+            await session.refresh(user)
+            """Если запись в БД найдена, то проверяем есть ли в user id сделки в обучении, если нет создаём новую"""
+            if not user.amo_deal_id:
+                lead_data = await processing_lead(amo_api=amo_api, contact_id=contact_data["amo_contact_id"],
+                                                  pipeline_id=pipelines["hite_pro_education"],
+                                                  status_id=status_fields['admitted_to_training'], )
+
+                if lead_data:  # Данные сделки найдены в амосрм
+                    user.amo_deal_id = lead_data["amo_deal_id"]
+                    logger.info(
+                        f'Для пользователя телефон: {phone}, max_id: {max_id} найдена сделка в амосрм')
+
+                else:  # Сделка не найдена, создаём новую сразу в этапе "Авторизовался в боте"
+                    logger.info(
+                        f'Для пользователя телефон: {phone}, max_id: {max_id} не найдена сделка в амосрм')
+                    user.client_type = client_type
+                    new_lead_id = await asyncio.to_thread(amo_api.send_lead_to_amo,
+                                                          pipeline_id=pipelines.get('hite_pro_education'),
+                                                          status_id=status_fields.get('authorized_in_bot'),
+                                                          contact_id=contact_data.get("amo_contact_id"),
+                                                          utm_metriks_fields=utm_metriks,
+                                                          user=user
+                                                          )
+                    user.amo_deal_id = new_lead_id
+                    await save_lead_status(session, new_lead_id, status_fields.get('authorized_in_bot'),
+                                           pipelines.get('hite_pro_education'))
+                await session.commit()
+                await session.refresh(user)
+                if lead_data:
+                    response = await push_lead_status(session=session, amo_batcher=amo_batcher,
+                                                      pipeline_id=pipelines.get('hite_pro_education'),
+                                                      status_id=status_fields.get('authorized_in_bot'),
+                                                      lead_id=str(user.amo_deal_id))
+                    if response:
+                        logger.info(f'Сделка {user.amo_deal_id} перемещена в следующий этап - Авторизовался в боте')
+                    else:
+                        logger.info(f'Не получилось переместить сделку id: {user.amo_deal_id} дальше по воронке')
+
+            else:
+                logger.info(f'У контакта {user.amo_contact_id} найдена сделка в БД {user.amo_deal_id}')
+
+
+        else:
+            logger.info(f'В БД не найден контакт с номером {phone}, создаём новую запись в БД')
+
+            user = local_user or User(max_user_id=max_id)
+            user.phone_number = phone
+            user.first_name = contact_data.get("first_name")
+            user.last_name = contact_data.get("last_name")
+            user.amo_contact_id = contact_data.get("amo_contact_id")
+            user.utm_campaign = utm_data.get("utm_campaign", '')
+            user.utm_medium = utm_data.get("utm_medium", '')
+            user.utm_content = utm_data.get("utm_content", '')
+            user.utm_term = utm_data.get("utm_term", '')
+            user.utm_source = utm_data.get("utm_source", '')
+            user.yclid = utm_data.get("yclid", '')
+            session.add(user)
+            await session.commit()
+            await session.refresh(user)
+            lead_data = await processing_lead(amo_api=amo_api, contact_id=contact_data["amo_contact_id"],
+                                              pipeline_id=pipelines["hite_pro_education"],
+                                              status_id=status_fields['admitted_to_training'], )
+
+            if lead_data:  # Данные сделки найдены в амосрм
+                user.amo_deal_id = lead_data["amo_deal_id"]
+                await session.commit()
+                await session.refresh(user)
+                logger.info(
+                    f'Для пользователя телефон: {phone}, max_id: {max_id} найдена сделка в амосрм')
+
+            else:  # Сделка не найдена, создаём новую сразу в этапе "Авторизовался в боте"
+                logger.info(
+                    f'Для пользователя телефон: {phone}, max_id: {max_id} не найдена сделка в амосрм')
+                user.client_type = client_type
+                new_lead_id = await asyncio.to_thread(amo_api.send_lead_to_amo,
+                                                      pipeline_id=pipelines.get('hite_pro_education'),
+                                                      status_id=status_fields.get('authorized_in_bot'),
+                                                      contact_id=contact_data.get("amo_contact_id"),
+                                                      utm_metriks_fields=utm_metriks,
+                                                      user=user
+                                                      )
+                user.amo_deal_id = new_lead_id
+                await save_lead_status(session, new_lead_id, status_fields.get('authorized_in_bot'),
+                                       pipelines.get('hite_pro_education'))
+
+                await session.commit()
+                await session.refresh(user)
+
+    else:
+        """Если контакт в АМО не найден, то создаём новый контакт, сделку, запись USER в таблице"""
+        logger.info(f'В амо не найден контакт для пользователя max_id: {max_id}, телефон: {phone}')
+        user = local_user or User(max_user_id=max_id)
+        user.phone_number = phone
+        user.utm_campaign = utm_data.get("utm_campaign", '')
+        user.utm_medium = utm_data.get("utm_medium", '')
+        user.utm_content = utm_data.get("utm_content", '')
+        user.utm_term = utm_data.get("utm_term", '')
+        user.utm_source = utm_data.get("utm_source", '')
+        user.yclid = utm_data.get("yclid", '')
+        session.add(user)
+        user.client_type = client_type
+        # Контакт и сделка создаются одним запросом, сделка сразу в этапе "Авторизовался в боте"
+        new_contact_id, new_lead_id = await asyncio.to_thread(
+            amo_api.create_contact_with_lead,
+            first_name='Новый контакт из бота MAX',
+            last_name=str(phone),
+            phone=phone,
+            pipeline_id=pipelines.get('hite_pro_education'),
+            status_id=status_fields.get('authorized_in_bot'),
+            utm_metriks_fields=utm_metriks,
+            user=user,
+        )
+        user.amo_deal_id = new_lead_id
+        user.amo_contact_id = new_contact_id
+        await save_lead_status(session, new_lead_id, status_fields.get('authorized_in_bot'),
+                               pipelines.get('hite_pro_education'))
+        # Номер теперь принадлежит новому контакту: старые записи кеша по нему недействительны
+        await invalidate_cached_contact(session, str(phone))
+        await save_cached_contact(session, str(phone), amo_contact_id=new_contact_id)
+
+        logger.info(f'Для пользователя max_id: {max_id}, телефон: {phone} создан новый контакт {new_contact_id} и '
+                    f'новая сделка {new_lead_id}')
+
+    if client_type and not user.client_type:
+        user.client_type = client_type
+
+    await session.commit()
+    await session.refresh(user)
+    return user
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from http import HTTPStatus
+from typing import Any, Callable
+
+from amo_api.amo_api import AmoCRMWrapper
+from amo_api.circuit_breaker import AmoUnavailableError
+
+logger = logging.getLogger(__name__)
+
+AMO_BATCH_LIMIT = 50  # Максимум сущностей в одном запросе к API amoCRM
+AMO_BATCH_WINDOW = 0.25  # Сколько секунд копим записи перед отправкой
+AMO_BATCH_SENDERS = 2  # Сколько пачек одной очереди может быть в полёте одновременно
+
+
+def _validate_note(item: dict) -> None:
+    _validate_ids(item, 'lead_id')
+    if not isinstance(item.get('text'), str) or not item['text']:
+        raise ValueError(f'Пустое примечание для сделки {item.get("lead_id")}')
+
+
+def _validate_status(item: dict) -> None:
+    _validate_ids(item, 'lead_id', 'pipeline_id', 'status_id')
+
+
+def _validate_ids(item: dict, *keys: str) -> None:
+    for key in keys:
+        try:
+            int(item.get(key))
+        except (TypeError, ValueError):
+            raise ValueError(f'Некорректный {key}={item.get(key)!r} в записи для amoCRM') from None
+
+
+class _WriteQueue:
+    """Очередь однотипных записей: копит элементы и отправляет их одной пачкой.
+
+    flush возвращает HTTP-статус и результаты по записям. amoCRM принимает или отклоняет пачку целиком:
+    на 400 пачка делится пополам и отправляется заново, пока плохая запись не останется одна,
+    так ошибку получает только её автор. Остальные ошибки (авторизация, недоступность amoCRM) получают все сразу.
+    """
+
+    def __init__(self, name: str, flush: Callable[[list[dict]], tuple[int, list[Any]]],
+                 validate: Callable[[dict], None], window: float, limit: int,
+                 senders: int = AMO_BATCH_SENDERS) -> None:
+        self.name = name
+        self._flush_items = flush
+        self._validate = validate
+        self._window = window
+        self._limit = limit
+        self._items: list[tuple[dict, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        # Пачки ждут здесь, а не в пуле потоков: в amoCRM одновременно уходит не больше senders запросов
+        self._senders = asyncio.Semaphore(senders)
+
+    def put(self, item: dict) -> asyncio.Future:
+        # Некорректную запись отклоняем сразу: в пачке она сорвала бы запросы остальных
+        self._validate(item)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._items.append((item, future))
+
+        if len(self._items) >= self._limit:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._window, self._start_flush)
+        return future
+
+    def _start_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._items:
+            return
+
+        batch, self._items = self._items[:self._limit], self._items[self._limit:]
+        task = asyncio.create_task(self._send(batch), name=f'amo-batch-{self.name}')
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        if self._items:
+            self._timer = asyncio.get_running_loop().call_later(self._window, self._start_flush)
+
+    async def _send(self, batch: list[tuple[dict, asyncio.Future]]) -> None:
+        try:
+            async with self._senders:
+                status, results = await asyncio.to_thread(self._flush_items, [item for item, _ in batch])
+        except Exception as error:
+            logger.warning(f'Не удалось отправить в amoCRM пакет {self.name} из {len(batch)} записей: {error!r}')
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        # 400 - amoCRM забраковал содержимое пакета: ищем плохую запись делением пополам.
+        # 401, 403 и прочие ошибки касаются всего пакета, деление только потратило бы лимит запросов
+        if status == HTTPStatus.BAD_REQUEST and len(batch) > 1:
+            middle = len(batch) // 2
+            logger.warning(f'amoCRM отклонил пакет {self.name} из {len(batch)} записей, отправляем по частям')
+            await asyncio.gather(self._send(batch[:middle]), self._send(batch[middle:]))
+            return
+
+        if status == HTTPStatus.OK:
+            logger.info(f'Отправлен в amoCRM пакет {self.name} из {len(batch)} записей')
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self) -> None:
+        self._start_flush()
+        while self._items:
+            self._start_flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+class AmoWriteBatcher:
+    """Собирает примечания и смены этапов от параллельных хендлеров и отправляет их
+    пакетными запросами amoCRM. Каждый вызов ждёт результата своей записи."""
+
+    def __init__(self, amo_api: AmoCRMWrapper, window: float = AMO_BATCH_WINDOW,
+                 limit: int = AMO_BATCH_LIMIT) -> None:
+        self._amo_api = amo_api
+        self._notes = _WriteQueue('notes', amo_api.add_notes_to_leads, _validate_note, window, limit)
+        self._statuses = _WriteQueue('statuses', self._push_statuses, _validate_status, window, limit)
+
+    def _push_statuses(self, leads: list[dict]) -> tuple[int, list[bool]]:
+        # Одна сделка может попасть в пачку дважды: в amoCRM уходит последний этап
+        latest = {int(lead['lead_id']): lead for lead in leads}
+        status, pushed = self._amo_api.push_leads_to_statuses(list(latest.values()))
+        return status, [pushed] * len(leads)
+
+    async def add_note(self, lead_id: int | str, text: str) -> dict:
+        return await self._notes.put({'lead_id': lead_id, 'text': text})
+
+    async def push_status(self, lead_id: int | str, pipeline_id: int, status_id: int) -> bool:
+        return await self._statuses.put({'lead_id': lead_id, 'pipeline_id': pipeline_id, 'status_id': status_id})
+
+    async def close(self) -> None:
+        """Отправляет всё, что накопилось, и дожидается ответов."""
+        await self._notes.close()
+        await self._statuses.close()
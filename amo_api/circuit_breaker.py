@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AmoUnavailableError(Exception):
+    """amoCRM не отвечает или предохранитель разомкнут - запрос не выполнен."""
+
+
+class CircuitBreaker:
+    """Предохранитель для запросов к amoCRM.
+
+    closed    - запросы идут как обычно, считаем подряд идущие ошибки;
+    open      - после failure_threshold ошибок запросы сразу отклоняются reset_timeout секунд;
+    half_open - по истечении паузы пропускаем один пробный запрос: успех замыкает цепь, ошибка снова размыкает.
+
+    Вызывается из потоков requests, поэтому состояние защищено блокировкой.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.OPEN and time.monotonic() - self._opened_at < self.reset_timeout:
+                raise AmoUnavailableError('amoCRM временно недоступен (предохранитель разомкнут)')
+            # Пауза прошла: пропускаем ровно один пробный запрос, остальные отклоняем до его результата
+            if self._probe_in_flight:
+                raise AmoUnavailableError('amoCRM временно недоступен (идёт пробный запрос)')
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info('amoCRM снова отвечает, предохранитель замкнут')
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f'amoCRM не отвечает ({self._failures} ошибок подряд), '
+                                   f'предохранитель разомкнут на {self.reset_timeout} с')
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
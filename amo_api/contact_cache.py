@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import AmoPhoneContact
+from services.utils import normalize_phone, phone_variants
+
+CONTACT_CACHE_TTL = timedelta(days=7)
+
+
+async def get_cached_contact(session: AsyncSession, phone: str) -> AmoPhoneContact | None:
+    normalized = normalize_phone(phone)
+    if normalized is None:
+        return None
+
+    result = await session.execute(
+        select(AmoPhoneContact).where(AmoPhoneContact.phone == normalized)
+    )
+    cached = result.scalar_one_or_none()
+    if cached is None or datetime.utcnow() - cached.updated_at > CONTACT_CACHE_TTL:
+        return None
+    return cached
+
+
+async def save_cached_contact(
+    session: AsyncSession,
+    phone: str,
+    amo_contact_id: int,
+    first_name: str | None = None,
+    last_name: str | None = None,
+) -> None:
+    normalized = normalize_phone(phone)
+    if normalized is None:
+        return
+
+    await session.merge(
+        AmoPhoneContact(
+            phone=normalized,
+            amo_contact_id=int(amo_contact_id),
+            first_name=first_name,
+            last_name=last_name,
+            updated_at=datetime.utcnow(),
+        )
+    )
+
+
+async def invalidate_cached_contact(session: AsyncSession, phone: str) -> None:
+    variants = phone_variants(phone)
+    if not variants:
+        return
+
+    await session.execute(
+        delete(AmoPhoneContact).where(AmoPhoneContact.phone.in_(variants))
+    )
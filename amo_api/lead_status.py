@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from amo_api.amo_api import AmoCRMWrapper
+from amo_api.batcher import AmoWriteBatcher
+from db.models import AmoLeadStatus
+
+logger = logging.getLogger(__name__)
+
+
+async def save_lead_status(
+    session: AsyncSession,
+    lead_id: int | str,
+    status_id: int | str,
+    pipeline_id: int | str | None = None,
+) -> None:
+    await session.merge(
+        AmoLeadStatus(
+            lead_id=int(lead_id),
+            pipeline_id=int(pipeline_id) if pipeline_id is not None else None,
+            status_id=int(status_id),
+            updated_at=datetime.utcnow(),
+        )
+    )
+
+
+async def get_lead_status(session: AsyncSession, amo_api: AmoCRMWrapper, lead_id: int | str) -> int | None:
+    """Этап сделки из локального зеркала. В amoCRM идём только если сделки в зеркале ещё нет."""
+    result = await session.execute(
+        select(AmoLeadStatus.status_id).where(AmoLeadStatus.lead_id == int(lead_id))
+    )
+    status_id = result.scalar_one_or_none()
+    if status_id is not None:
+        return status_id
+
+    lead = await asyncio.to_thread(amo_api.get_lead_by_id, lead_id=lead_id)
+    status_id = lead.get('status_id')
+    if status_id is None:
+        logger.warning(f'Не удалось получить этап сделки {lead_id} из amoCRM')
+        return None
+
+    await save_lead_status(session, lead_id, status_id, lead.get('pipeline_id'))
+    await session.commit()
+    return int(status_id)
+
+
+async def push_lead_status(
+    session: AsyncSession,
+    amo_batcher: AmoWriteBatcher,
+    lead_id: int | str,
+    pipeline_id: int,
+    status_id: int,
+) -> bool:
+    """Переводит сделку в этап (через общий пакетный запрос) и при успехе сразу обновляет зеркало."""
+    pushed = await amo_batcher.push_status(lead_id=lead_id, pipeline_id=pipeline_id, status_id=status_id)
+    if pushed:
+        await save_lead_status(session, lead_id, status_id, pipeline_id)
+        await session.commit()
+    return pushed
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+from typing import Any
+
+
+class CustomFields:
+    """custom_fields_values сущности amoCRM, разобранные один раз в словари по field_id и field_code/field_name."""
+
+    __slots__ = ('_by_id', '_by_name')
+
+    def __init__(self, values: list[dict] | None) -> None:
+        self._by_id: dict[int, list] = {}
+        self._by_name: dict[str, list] = {}
+        for field in values or ():
+            field_values = [value.get('value') for value in field.get('values') or ()]
+            field_id = field.get('field_id')
+            if field_id is not None:
+                self._by_id[int(field_id)] = field_values
+            for name in (field.get('field_code'), field.get('field_name')):
+                if name:
+                    self._by_name[name] = field_values
+
+    def values(self, field_id: int | None) -> list:
+        if field_id is None:
+            return []
+        return self._by_id.get(int(field_id), [])
+
+    def first(self, field_id: int | None, default: Any = None) -> Any:
+        values = self.values(field_id)
+        return values[0] if values else default
+
+    def values_by_name(self, name: str) -> list:
+        return self._by_name.get(name, [])
+
+    def __contains__(self, field_id: int) -> bool:
+        return int(field_id) in self._by_id
+
+    def __bool__(self) -> bool:
+        return bool(self._by_id)
+
+
+class Contact:
+    __slots__ = ('id', 'name', 'first_name', 'last_name', 'custom_fields', 'phone_list', 'mail_list')
+
+    def __init__(self, **kwargs):
+        self.id = kwargs.get('id')
+        self.name = kwargs.get('name')
+        self.first_name = kwargs.get('first_name') or ''
+        self.last_name = kwargs.get('last_name') or ''
+        self.custom_fields = CustomFields(kwargs.get('custom_fields_values'))
+        self.phone_list = self._get_contact_data_list(field_code='PHONE', field_name='Телефон')
+        self.mail_list = self._get_contact_data_list(field_code='EMAIL', field_name='Email')
+
+    @classmethod
+    def from_api(cls, contact_dct: dict) -> Contact:
+        return cls(**contact_dct)
+
+    def _get_contact_data_list(self, field_code: str, field_name: str) -> list:
+        return list(self.custom_fields.values_by_name(field_code) or self.custom_fields.values_by_name(field_name))
+
+    def __str__(self):
+        contact_message = f'\n{self.name}\n'
+
+        for number in self.phone_list:
+            value = f'📞 {number}\n'
+            contact_message = contact_message + value
+
+        for email in self.mail_list:
+            value = f'📧 {email}\n'
+            contact_message = contact_message + value
+
+        return contact_message
+
+
+class Lead:
+    __slots__ = ('id', 'name', 'pipeline_id', 'status_id', 'custom_fields', 'contact_ids', 'main_contact_id')
+
+    def __init__(self, **kwargs):
+        self.id = int(kwargs['id'])
+        self.name = kwargs.get('name')
+        self.pipeline_id = int(kwargs.get('pipeline_id', -1))
+        self.status_id = int(kwargs.get('status_id', -1))
+        self.custom_fields = CustomFields(kwargs.get('custom_fields_values'))
+
+        lead_contacts = (kwargs.get('_embedded') or {}).get('contacts') or []
+        self.contact_ids: tuple[int, ...] = tuple(
+            int(contact['id']) for contact in lead_contacts if str(contact.get('id', '')).isdigit()
+        )
+        self.main_contact_id = self._get_main_contact_id(lead_contacts)
+
+    @classmethod
+    def from_api(cls, lead_dct: dict) -> Lead:
+        return cls(**lead_dct)
+
+    @staticmethod
+    def _get_main_contact_id(lead_contacts: list[dict]) -> int | None:
+        main_contact = None
+        for lead_contact in lead_contacts:
+            is_main = lead_contact.get("is_main")
+            if is_main is True or str(is_main).lower() in {"1", "true"}:
+                main_contact = lead_contact
+                break
+
+        if main_contact is None and len(lead_contacts) == 1:
+            main_contact = lead_contacts[0]
+        if main_contact is None:
+            return None
+
+        try:
+            return int(main_contact.get("id", -1))
+        except (TypeError, ValueError):
+            return None
+
+
+class Customer:
+    # Список доступных статусов партнёра
+    partner_status_dct: dict[str, list] = {
+        'Отсутствует': ['скидка 0%', 0],
+        'Старт': ['скидка 15%', 0],
+        'База': ['скидка 20%', 100000],
+        'Бронза': ['скидка 25%', 200000],
+        'Серебро': ['скидка 30%', 500000],
+        'Золото': ['скидка 35%',],
+        'Платина': ['скидка 40%',],
+        'Бизнес': ['скидка 40%',],
+        'Эксклюзив': ['Индивидуальные условия',]
+    }
+
+    partner_status_list: list = [
+        'Отсутствует', 'Старт', 'База', 'Бронза', 'Серебро', 'Золото', 'Платина', 'Бизнес', 'Эксклюзив'
+    ]
+
+    __slots__ = ('fields_id', 'id', 'name', 'itv', 'custom_fields', 'manager', 'status', 'bye_in_this_period',
+                 'bonuses', 'town', 'next_status', 'tg_id', 'full_price')
+
+    def __init__(self, fields_id: dict[str, int]):
+        self.fields_id = fields_id
+
+    @classmethod
+    def from_api(cls, customer_dct: dict, fields_id: dict[str, int]) -> Customer:
+        return cls(fields_id)(customer_dct)
+
+    def __call__(self, customer_dct: dict):
+        self.id = customer_dct.get('id')
+        self.name = customer_dct['name']
+        self.itv = customer_dct.get('itv')  # Сумма покупок партнёра
+        self.custom_fields = CustomFields(customer_dct['custom_fields_values'])
+        self.manager = customer_dct.get('manager').get('name')
+        self.status = self.get_status()
+        self.bye_in_this_period = self.bye_this_period()
+        self.bonuses = self.get_bonuses()
+        self.town = self.get_town()
+        self.next_status = self.get_next_status(self.status)
+        self.tg_id: bool = self.get_customer_tg_id()
+        self.full_price = self.get_customer_full_price()
+
+        return self
+
+    def _field(self, key: str, default: Any = None) -> Any:
+        return self.custom_fields.first(self.fields_id.get(key), default)
+
+    def get_customer_full_price(self):
+        full_price = self._field('full_price')
+        if full_price is None:
+            return 0
+        return f'{int(full_price):,}'.replace(',', ' ')
+
+    def get_customer_tg_id(self):
+        # Если нет записанного id_tg у партнёра, то True иначе False
+        tg_field_id = self.fields_id.get('tg_id_field')
+        return tg_field_id is None or tg_field_id not in self.custom_fields
+
+    def get_status(self):
+        status = self._field('status_id_field')
+        if status is None:
+            return f'Отсутствует, {self.partner_status_dct.get("Отсутствует")[0]}'
+        status_value: str = status.split()[0]
+        return f'{status_value}, {self.partner_status_dct.get(status_value)[0]}'
+
+    def bye_this_period(self):
+        return self._field('by_this_period_id_field', 0)
+
+    def get_bonuses(self):
+        bonuses_value = self._field('bonuses_id_field')
+        if bonuses_value is None:
+            return 0
+        return f'{int(bonuses_value):,}'.replace(',', ' ')
+
+    def get_town(self):
+        return self._field('town_id_field', 'Отсутствует')
+
+    def get_next_status(self, partner_status):
+        ind = 1
+        for index, status in enumerate(self.partner_status_list):
+            if status in partner_status.split()[0]:
+                ind = index
+
+        if len(self.partner_status_list) == ind + 1:
+            next_status = self.partner_status_list[ind]
+        else:
+            next_status = self.partner_status_list[ind+1]
+
+        return f'{next_status}, {self.partner_status_dct.get(next_status)[0]}'
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from amo_api.amo_api import AmoCRMWrapper
+
+AMO_PAGE_LIMIT = 250  # Максимальный размер страницы в API amoCRM
+AMO_PAGE_PREFETCH = 2  # Сколько следующих страниц загружаем заранее
+
+
+async def iter_amo_pages(
+    amo_api: AmoCRMWrapper,
+    endpoint: str,
+    entity: str,
+    query: str = '',
+    *,
+    limit: int = AMO_PAGE_LIMIT,
+    prefetch: int = AMO_PAGE_PREFETCH,
+    max_pages: int | None = None,
+) -> AsyncIterator[list[dict]]:
+    """Постранично отдаёт сущности списка amoCRM (entity - ключ в _embedded, например 'leads').
+
+    Пока вызывающий код обрабатывает страницу N, в фоне уже загружаются до prefetch следующих,
+    поэтому в памяти одновременно не больше prefetch + 1 страниц. Конец списка определяется по _links.next.
+    Если перебор нужно прервать раньше, оборачивайте генератор в contextlib.aclosing,
+    тогда незавершённые запросы будут отменены сразу, а не при сборке мусора.
+    """
+    def _fetch(page: int) -> asyncio.Task:
+        return asyncio.create_task(
+            asyncio.to_thread(amo_api.get_page, endpoint, entity, query, page, limit),
+            name=f'amo-page-{entity}-{page}',
+        )
+
+    last_page = max_pages if max_pages is not None else float('inf')
+    next_page = 1
+    pending: list[asyncio.Task] = []
+    try:
+        while next_page <= min(prefetch + 1, last_page):
+            pending.append(_fetch(next_page))
+            next_page += 1
+
+        while pending:
+            items, has_next = await pending.pop(0)
+            if items:
+                yield items
+            if not has_next:
+                break
+            if next_page <= last_page:
+                pending.append(_fetch(next_page))
+                next_page += 1
+    finally:
+        for task in pending:
+            task.cancel()
+        # Дожидаемся отменённых загрузок: иначе ошибка уже упавшей страницы попадёт в лог как never retrieved
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def iter_amo_entities(
+    amo_api: AmoCRMWrapper,
+    endpoint: str,
+    entity: str,
+    query: str = '',
+    *,
+    limit: int = AMO_PAGE_LIMIT,
+    prefetch: int = AMO_PAGE_PREFETCH,
+    max_pages: int | None = None,
+) -> AsyncIterator[dict]:
+    """То же, что iter_amo_pages, но по одной сущности."""
+    pages = iter_amo_pages(amo_api, endpoint, entity, query,
+                           limit=limit, prefetch=prefetch, max_pages=max_pages)
+    try:
+        async for items in pages:
+            for item in items:
+                yield item
+    finally:
+        await pages.aclose()
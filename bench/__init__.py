@@ -0,0 +1 @@
+"""Инструменты для замеров и нагрузочных прогонов бота. В рабочем процессе не импортируются."""
@@ -0,0 +1,90 @@
+"""Время поиска контактов и сделок AmoCRMWrapper на объёмах боевого аккаунта, без обращения к нему.
+
+Поднимает bench.fake_amo в фоновом потоке и гоняет через обёртку те же запросы, что делает бот:
+    python -m bench.amo_lookups --leads 200000 --repeat 5
+    python -m bench.amo_lookups --leads 200000 --rps 7 --latency 0.15   # с лимитом и задержкой как у amoCRM
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+import jwt
+
+from amo_api.amo_api import AmoCRMWrapper
+from bench.fake_amo import EDU_PIPELINE_ID, FakeAmoData, FakeAmoServer, TOKEN_KEY, bench_phone
+from config.config import amo_fields
+
+
+def _make_wrapper(url: str, env_path: str) -> AmoCRMWrapper:
+    # Просроченный токен: первый запрос пройдёт через обновление токенов, как после рестарта бота
+    expired = jwt.encode({'exp': int(time.time()) - 60}, TOKEN_KEY, algorithm='HS256')
+    return AmoCRMWrapper(path=env_path, amocrm_subdomain='fake', amocrm_client_id='bench',
+                         amocrm_client_secret='bench', amocrm_redirect_url='http://localhost/',
+                         amocrm_access_token=expired, amocrm_refresh_token='bench', amocrm_secret_code='bench',
+                         base_url=url)
+
+
+def _measure(name: str, repeat: int, func) -> None:
+    timings, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        try:
+            result = func()
+        except Exception as error:
+            result = f'ошибка: {error!r}'
+        timings.append(time.perf_counter() - started)
+    print(f'{name:<48} min {min(timings) * 1000:9.1f} мс  медиана {statistics.median(timings) * 1000:9.1f} мс'
+          f'  -> {str(result)[:40]}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Бенчмарк поиска в amoCRM на локальной замене')
+    parser.add_argument('--leads', type=int, default=200_000)
+    parser.add_argument('--contacts', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--port', type=int, default=8202)
+    parser.add_argument('--rps', type=float, default=0.0, help='лимит запросов в секунду на стороне заглушки')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа заглушки, секунды')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    data = FakeAmoData.seed(args.leads, args.contacts)
+    print(f'Засеяно {len(data.leads)} сделок и {len(data.contacts)} контактов за {time.perf_counter() - started:.1f} с')
+
+    server = FakeAmoServer(data, port=args.port, rps=args.rps, latency=args.latency)
+    server.start_in_thread()
+    env_file = tempfile.NamedTemporaryFile(prefix='fake-amo-', suffix='.env')
+    amo_api = _make_wrapper(server.url, env_file.name)
+    try:
+        status_id = amo_fields['statuses']['admitted_to_training']
+        stage_leads = data.find_leads([EDU_PIPELINE_ID], [(EDU_PIPELINE_ID, status_id)], [])
+        first_lead, last_lead = data.leads[stage_leads[0]], data.leads[stage_leads[-1]]
+        print(f'Сделок на этапе admitted_to_training: {len(stage_leads)}')
+
+        def find_lead(contact_id):
+            return asyncio.run(amo_api.find_lead_by_contact_in_pipeline_stage_new(
+                contact_id, EDU_PIPELINE_ID, status_id))
+
+        _measure('check_connection', args.repeat, amo_api.check_connection)
+        _measure('get_contact_by_phone (найден)', args.repeat,
+                 lambda: amo_api.get_contact_by_phone(bench_phone(first_lead[2]))[0])
+        _measure('get_contact_by_phone (не найден)', args.repeat,
+                 lambda: amo_api.get_contact_by_phone('+79999999999')[0])
+        _measure('find_lead_..._new (первая страница)', args.repeat, lambda: find_lead(first_lead[2]))
+        _measure('find_lead_..._new (последняя страница)', args.repeat, lambda: find_lead(last_lead[2]))
+        _measure('find_lead_..._new (нет сделки)', args.repeat, lambda: find_lead(-1))
+    finally:
+        server.stop_thread()
+        env_file.close()
+
+    print(f'Запросов к заглушке: {sum(server.requests.values())}, из них 429: {server.throttled}')
+    for key, count in sorted(server.requests.items(), key=lambda item: -item[1]):
+        print(f'  {count:8d}  {key}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,545 @@
+"""Локальная замена amoCRM с объёмами как у боевого аккаунта.
+
+Покрывает то, чем пользуется AmoCRMWrapper: /oauth2/access_token, /api/v4/account, контакты (поиск по query
+и по полю MAX id, создание, PATCH), сделки (список с фильтрами по воронке/этапу/контакту, with=contacts,
+постраничная выдача с _links.next, создание, /leads/complex, PATCH одной и пачкой), примечания и link.
+Есть задержка ответа и ограничение частоты запросов с ответом 429, как у amoCRM (7 запросов в секунду).
+
+Запуск отдельным процессом:
+    python -m bench.fake_amo --port 8202 --leads 200000 --rps 7
+и бот с AMOCRM_BASE_URL=http://127.0.0.1:8202.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import logging
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from http import HTTPStatus
+from typing import Any
+
+import jwt
+from aiohttp import web
+
+from config.config import amo_fields
+from services.json_codec import dumps, loads
+from services.utils import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+EDU_PIPELINE_ID = amo_fields['pipelines']['hite_pro_education']
+MAX_ID_FIELD_ID = amo_fields['fields_id']['max_id']
+PHONE_FIELD_ID = 671750
+PAGE_LIMIT_MAX = 250
+FIRST_CONTACT_ID = 10_000_000
+FIRST_LEAD_ID = 20_000_000
+TOKEN_KEY = 'fake-amo-signing-key-for-local-benchmarks'
+
+# Доли сделок по этапам воронки обучения: большинство застревает в начале
+EDU_STATUS_WEIGHTS = {
+    'admitted_to_training': 30,
+    'authorized_in_bot': 20,
+    'compleat_lesson_1': 12,
+    'compleat_lesson_2': 9,
+    'compleat_lesson_3': 7,
+    'compleat_lesson_4': 5,
+    'compleat_lesson_5': 4,
+    'compleat_lesson_6': 3,
+    'compleat_lesson_7': 3,
+    'ready_to_exam': 3,
+    'compleat_exam': 2,
+    'compleat_training': 2,
+}
+OTHER_PIPELINES = {3000001: (40000001, 40000002, 40000003), 3000002: (40000011, 40000012)}
+
+_STATUS_FILTER_RE = re.compile(r'^filter\[statuses\]\[(\d+)\]\[(pipeline_id|status_id)\]$')
+_CF_FILTER_RE = re.compile(r'^filter\[custom_fields_values\]\[(\d+)\]\[\]$')
+
+
+def bench_phone(contact_id: int) -> str:
+    """Телефон засеянного контакта: по нему нагрузочный тест находит существующего клиента."""
+    return f'7900{contact_id % 10_000_000:07d}'
+
+
+class FakeAmoData:
+    """Сделки и контакты в памяти с индексами под фильтры, которые использует бот."""
+
+    def __init__(self) -> None:
+        # id -> [first_name, last_name, phone, max_id]
+        self.contacts: dict[int, list] = {}
+        # id -> [pipeline_id, status_id, contact_id, created_at, name]
+        self.leads: dict[int, list] = {}
+        self.notes: dict[int, list[str]] = {}
+        self._phone_index: dict[str, int] = {}
+        self._max_id_index: dict[str, int] = {}
+        self._contact_leads: dict[int, dict[int, None]] = {}
+        self._status_index: dict[tuple[int, int], dict[int, None]] = {}
+        self._contact_ids = itertools.count(FIRST_CONTACT_ID)
+        self._lead_ids = itertools.count(FIRST_LEAD_ID)
+        self._note_ids = itertools.count(1)
+        self._query_cache: OrderedDict[tuple, list[int]] = OrderedDict()
+
+    @classmethod
+    def seed(cls, leads: int, contacts: int | None = None, edu_share: float = 0.6, seed: int = 42) -> FakeAmoData:
+        """leads сделок; каждая привязана к одному из contacts контактов (по умолчанию контакт на сделку)."""
+        rng = random.Random(seed)
+        data = cls()
+        contacts = contacts or leads
+        for _ in range(contacts):
+            data.add_contact('Клиент', '', None)
+        contact_ids = list(data.contacts)
+
+        edu_statuses = [amo_fields['statuses'][key] for key in EDU_STATUS_WEIGHTS]
+        edu_weights = list(EDU_STATUS_WEIGHTS.values())
+        other = [(pipeline_id, status_id) for pipeline_id, statuses in OTHER_PIPELINES.items() for status_id in statuses]
+        for index in range(leads):
+            contact_id = contact_ids[index] if index < len(contact_ids) else rng.choice(contact_ids)
+            if rng.random() < edu_share:
+                pipeline_id, status_id = EDU_PIPELINE_ID, rng.choices(edu_statuses, edu_weights)[0]
+            else:
+                pipeline_id, status_id = rng.choice(other)
+            data.add_lead(pipeline_id, status_id, contact_id)
+        return data
+
+    # --- запись ---
+
+    def add_contact(self, first_name: str, last_name: str, phone: str | None, max_id: str | None = None) -> int:
+        contact_id = next(self._contact_ids)
+        phone = normalize_phone(phone) if phone else bench_phone(contact_id)
+        self.contacts[contact_id] = [first_name, last_name, phone, max_id]
+        self._phone_index[phone] = contact_id
+        if max_id:
+            self._max_id_index[str(max_id)] = contact_id
+        return contact_id
+
+    def add_lead(self, pipeline_id: int, status_id: int, contact_id: int | None, name: str = 'Сделка') -> int:
+        lead_id = next(self._lead_ids)
+        self.leads[lead_id] = [int(pipeline_id), int(status_id), contact_id, int(time.time()), name]
+        self._status_index.setdefault((int(pipeline_id), int(status_id)), {})[lead_id] = None
+        if contact_id is not None:
+            self._contact_leads.setdefault(contact_id, {})[lead_id] = None
+        self._query_cache.clear()
+        return lead_id
+
+    def move_lead(self, lead_id: int, pipeline_id: int | None, status_id: int | None) -> bool:
+        lead = self.leads.get(lead_id)
+        if lead is None:
+            return False
+        self._status_index.get((lead[0], lead[1]), {}).pop(lead_id, None)
+        lead[0] = int(pipeline_id) if pipeline_id is not None else lead[0]
+        lead[1] = int(status_id) if status_id is not None else lead[1]
+        self._status_index.setdefault((lead[0], lead[1]), {})[lead_id] = None
+        self._query_cache.clear()
+        return True
+
+    def update_contact_fields(self, contact_id: int, custom_fields_values: list[dict]) -> bool:
+        contact = self.contacts.get(contact_id)
+        if contact is None:
+            return False
+        for field in custom_fields_values or []:
+            if int(field.get('field_id', 0)) == MAX_ID_FIELD_ID and field.get('values'):
+                contact[3] = str(field['values'][0].get('value'))
+                self._max_id_index[contact[3]] = contact_id
+        return True
+
+    def add_note(self, lead_id: int, text: str) -> int:
+        self.notes.setdefault(lead_id, []).append(text)
+        return next(self._note_ids)
+
+    # --- чтение ---
+
+    def find_contacts(self, query: str | None, max_ids: list[str]) -> list[int]:
+        found = []
+        if query:
+            contact_id = self._phone_index.get(normalize_phone(query) or query)
+            if contact_id is not None:
+                found.append(contact_id)
+        for max_id in max_ids:
+            contact_id = self._max_id_index.get(str(max_id))
+            if contact_id is not None:
+                found.append(contact_id)
+        return found
+
+    def find_leads(self, pipelines: list[int], statuses: list[tuple[int, int]], contact_ids: list[int]) -> list[int]:
+        key = (tuple(pipelines), tuple(statuses), tuple(contact_ids))
+        cached = self._query_cache.get(key)
+        if cached is not None:
+            self._query_cache.move_to_end(key)
+            return cached
+
+        if statuses:
+            candidates = [lead_id for pair in statuses for lead_id in self._status_index.get(pair, ())]
+        elif pipelines:
+            candidates = [lead_id for (pipeline_id, _), leads in self._status_index.items()
+                          if pipeline_id in pipelines for lead_id in leads]
+        elif contact_ids:
+            candidates = [lead_id for contact_id in contact_ids for lead_id in self._contact_leads.get(contact_id, ())]
+        else:
+            candidates = list(self.leads)
+
+        if contact_ids and (statuses or pipelines):
+            allowed = {lead_id for contact_id in contact_ids for lead_id in self._contact_leads.get(contact_id, ())}
+            candidates = [lead_id for lead_id in candidates if lead_id in allowed]
+        if pipelines and statuses:
+            candidates = [lead_id for lead_id in candidates if self.leads[lead_id][0] in pipelines]
+        candidates.sort()
+
+        self._query_cache[key] = candidates
+        if len(self._query_cache) > 64:
+            self._query_cache.popitem(last=False)
+        return candidates
+
+    def contact_json(self, contact_id: int) -> dict[str, Any]:
+        first_name, last_name, phone, max_id = self.contacts[contact_id]
+        custom_fields = [{'field_id': PHONE_FIELD_ID, 'field_name': 'Телефон', 'field_code': 'PHONE', 'field_type': 'multitext',
+                          'values': [{'value': f'+{phone}', 'enum_code': 'WORK'}]}]
+        if max_id:
+            custom_fields.append({'field_id': MAX_ID_FIELD_ID, 'field_name': 'MAX id', 'field_code': None,
+                                  'field_type': 'text', 'values': [{'value': max_id}]})
+        return {'id': contact_id, 'name': f'{first_name} {last_name}'.strip(), 'first_name': first_name,
+                'last_name': last_name, 'responsible_user_id': 453498, 'custom_fields_values': custom_fields,
+                '_embedded': {'leads': [{'id': lead_id} for lead_id in self._contact_leads.get(contact_id, ())]}}
+
+    def lead_json(self, lead_id: int, with_contacts: bool) -> dict[str, Any]:
+        pipeline_id, status_id, contact_id, created_at, name = self.leads[lead_id]
+        lead = {'id': lead_id, 'name': name, 'price': 0, 'responsible_user_id': 453498, 'pipeline_id': pipeline_id,
+                'status_id': status_id, 'created_at': created_at, 'updated_at': created_at,
+                'custom_fields_values': None, '_links': {'self': {'href': f'/api/v4/leads/{lead_id}'}}}
+        if with_contacts:
+            lead['_embedded'] = {'contacts': [{'id': contact_id, 'is_main': True}] if contact_id else []}
+        return lead
+
+
+class _RateLimiter:
+    """Скользящее окно в одну секунду: сверх rps запросов в секунду - 429, как у amoCRM."""
+
+    def __init__(self, rps: float) -> None:
+        self.rps = rps
+        self._hits: list[float] = []
+
+    def allow(self) -> bool:
+        if not self.rps:
+            return True
+        now = time.monotonic()
+        self._hits = [hit for hit in self._hits if now - hit < 1.0]
+        if len(self._hits) >= self.rps:
+            return False
+        self._hits.append(now)
+        return True
+
+
+class FakeAmoServer:
+    def __init__(self, data: FakeAmoData, host: str = '127.0.0.1', port: int = 8202, *, latency: float = 0.0,
+                 jitter: float = 0.0, rps: float = 0.0, error_rate: float = 0.0) -> None:
+        self.data = data
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.limiter = _RateLimiter(rps)
+        self.requests: dict[str, int] = {}
+        self.throttled = 0
+        self._runner: web.AppRunner | None = None
+        self._thread: threading.Thread | None = None
+        self._thread_loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._emulate_limits])
+        app.router.add_post('/oauth2/access_token', self._access_token)
+        app.router.add_get('/api/v4/account', self._account)
+        app.router.add_get('/api/v4/contacts', self._list_contacts)
+        app.router.add_post('/api/v4/contacts', self._create_contacts)
+        app.router.add_get('/api/v4/contacts/{id:\\d+}', self._get_contact)
+        app.router.add_patch('/api/v4/contacts/{id:\\d+}', self._patch_contact)
+        app.router.add_get('/api/v4/leads', self._list_leads)
+        app.router.add_post('/api/v4/leads', self._create_leads)
+        app.router.add_patch('/api/v4/leads', self._patch_leads)
+        app.router.add_post('/api/v4/leads/complex', self._create_complex)
+        app.router.add_post('/api/v4/leads/notes', self._add_notes)
+        app.router.add_get('/api/v4/leads/{id:\\d+}', self._get_lead)
+        app.router.add_patch('/api/v4/leads/{id:\\d+}', self._patch_lead)
+        app.router.add_post('/api/v4/leads/{id:\\d+}/notes', self._add_lead_notes)
+        app.router.add_post('/api/v4/leads/{id:\\d+}/link', self._no_content_ok)
+        app.router.add_get('/api/v4/users/{id:\\d+}', self._get_user)
+        app.router.add_post('/api/v4/tasks', self._no_content_ok)
+        app.router.add_get('/api/v4/customers', self._no_content)
+        app.router.add_get('/api/v4/customers/{id:\\d+}', self._no_content)
+        return app
+
+    # --- запуск ---
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info('Fake amoCRM слушает %s: %d сделок, %d контактов', self.url,
+                    len(self.data.leads), len(self.data.contacts))
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def start_in_thread(self) -> None:
+        """Для синхронного AmoCRMWrapper: сервер в отдельном потоке со своим event loop."""
+        started = threading.Event()
+
+        def _run() -> None:
+            loop = asyncio.new_event_loop()
+            self._thread_loop = loop
+            loop.run_until_complete(self.start())
+            started.set()
+            loop.run_forever()
+            loop.run_until_complete(self.stop())
+            loop.close()
+
+        self._thread = threading.Thread(target=_run, name='fake-amo', daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop_thread(self) -> None:
+        if self._thread_loop is not None:
+            self._thread_loop.call_soon_threadsafe(self._thread_loop.stop)
+            self._thread.join()
+            self._thread_loop = None
+
+    # --- общее ---
+
+    @web.middleware
+    async def _emulate_limits(self, request: web.Request, handler) -> web.StreamResponse:
+        resource = request.match_info.route.resource
+        key = f'{request.method} {resource.canonical if resource else request.path}'
+        self.requests[key] = self.requests.get(key, 0) + 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        if not request.path.startswith('/oauth2') and not self.limiter.allow():
+            self.throttled += 1
+            return self._json({'title': 'Too Many Requests', 'status': 429}, HTTPStatus.TOO_MANY_REQUESTS)
+        if self.error_rate and random.random() < self.error_rate:
+            return self._json({'title': 'Internal Server Error', 'status': 500}, HTTPStatus.INTERNAL_SERVER_ERROR)
+        return await handler(request)
+
+    @staticmethod
+    def _json(data: Any, status: int = HTTPStatus.OK) -> web.Response:
+        return web.Response(body=dumps(data), status=status, content_type='application/hal+json')
+
+    @staticmethod
+    async def _body(request: web.Request) -> Any:
+        body = await request.read()
+        return loads(body) if body else None
+
+    @staticmethod
+    def _page(request: web.Request) -> tuple[int, int]:
+        limit = min(int(request.query.get('limit', 50)), PAGE_LIMIT_MAX)
+        page = max(int(request.query.get('page', 1)), 1)
+        return page, limit
+
+    def _page_response(self, request: web.Request, entity: str, ids: list[int], render) -> web.Response:
+        page, limit = self._page(request)
+        chunk = ids[(page - 1) * limit:page * limit]
+        if not chunk:
+            return web.Response(status=HTTPStatus.NO_CONTENT)
+        links = {'self': {'href': f'{request.path}?page={page}'}}
+        if page * limit < len(ids):
+            links['next'] = {'href': f'{request.path}?page={page + 1}'}
+        return self._json({'_page': page, '_links': links, '_embedded': {entity: [render(item) for item in chunk]}})
+
+    async def _no_content(self, request: web.Request) -> web.Response:
+        return web.Response(status=HTTPStatus.NO_CONTENT)
+
+    async def _no_content_ok(self, request: web.Request) -> web.Response:
+        await request.read()
+        return self._json({'_embedded': {}})
+
+    async def _access_token(self, request: web.Request) -> web.Response:
+        await request.read()
+        expires = int(time.time()) + 86400
+        access_token = jwt.encode({'exp': expires, 'iat': int(time.time())}, TOKEN_KEY, algorithm='HS256')
+        return self._json({'token_type': 'Bearer', 'expires_in': 86400, 'access_token': access_token,
+                           'refresh_token': f'refresh-{time.time_ns()}'})
+
+    async def _account(self, request: web.Request) -> web.Response:
+        return self._json({'id': 1, 'name': 'fake', 'subdomain': 'fake'})
+
+    async def _get_user(self, request: web.Request) -> web.Response:
+        return self._json({'id': int(request.match_info['id']), 'name': 'Менеджер', 'email': 'manager@example.com'})
+
+    # --- контакты ---
+
+    async def _list_contacts(self, request: web.Request) -> web.Response:
+        max_ids = []
+        for key, value in request.query.items():
+            if _CF_FILTER_RE.match(key):
+                max_ids.append(value)
+        if request.query.get('query') or max_ids:
+            ids = self.data.find_contacts(request.query.get('query'), max_ids)
+        else:
+            ids = list(self.data.contacts)
+        return self._page_response(request, 'contacts', ids, self.data.contact_json)
+
+    async def _get_contact(self, request: web.Request) -> web.Response:
+        contact_id = int(request.match_info['id'])
+        if contact_id not in self.data.contacts:
+            return web.Response(status=HTTPStatus.NO_CONTENT)
+        return self._json(self.data.contact_json(contact_id))
+
+    def _create_contact(self, item: dict) -> int:
+        phone = None
+        for field in item.get('custom_fields_values') or []:
+            is_phone = field.get('field_code') == 'PHONE' or int(field.get('field_id', 0)) == PHONE_FIELD_ID
+            if is_phone and field.get('values'):
+                phone = field['values'][0].get('value')
+        contact_id = self.data.add_contact(item.get('first_name', ''), item.get('last_name', ''), phone)
+        self.data.update_contact_fields(contact_id, item.get('custom_fields_values'))
+        return contact_id
+
+    async def _create_contacts(self, request: web.Request) -> web.Response:
+        items = await self._body(request) or []
+        created = [{'id': self._create_contact(item), 'request_id': str(index)} for index, item in enumerate(items)]
+        return self._json({'_embedded': {'contacts': created}})
+
+    async def _patch_contact(self, request: web.Request) -> web.Response:
+        contact_id = int(request.match_info['id'])
+        body = await self._body(request) or {}
+        if not self.data.update_contact_fields(contact_id, body.get('custom_fields_values')):
+            return self._json({'title': 'Not Found', 'status': 404}, HTTPStatus.NOT_FOUND)
+        return self._json({'id': contact_id, 'updated_at': int(time.time())})
+
+    # --- сделки ---
+
+    async def _list_leads(self, request: web.Request) -> web.Response:
+        pipelines, statuses, contact_ids = [], {}, []
+        for key, value in request.query.items():
+            if key in ('filter[pipeline_id][]', 'filter[pipeline_id]'):
+                pipelines.append(int(value))
+            elif key in ('filter[contacts][id]', 'filter[contacts][id][]'):
+                contact_ids.append(int(value))
+            elif key == 'filter[status_id]':
+                statuses.setdefault('single', {})['status_id'] = int(value)
+            else:
+                match = _STATUS_FILTER_RE.match(key)
+                if match:
+                    statuses.setdefault(match.group(1), {})[match.group(2)] = int(value)
+
+        status_pairs = []
+        for status in statuses.values():
+            if 'status_id' not in status:
+                continue
+            pipeline_id = status.get('pipeline_id') or (pipelines[0] if pipelines else None)
+            if pipeline_id is not None:
+                status_pairs.append((pipeline_id, status['status_id']))
+
+        ids = self.data.find_leads(pipelines, sorted(set(status_pairs)), contact_ids)
+        with_contacts = 'contacts' in request.query.get('with', '')
+        return self._page_response(request, 'leads', ids, lambda lead_id: self.data.lead_json(lead_id, with_contacts))
+
+    async def _get_lead(self, request: web.Request) -> web.Response:
+        lead_id = int(request.match_info['id'])
+        if lead_id not in self.data.leads:
+            return web.Response(status=HTTPStatus.NO_CONTENT)
+        return self._json(self.data.lead_json(lead_id, 'contacts' in request.query.get('with', '')))
+
+    def _create_lead(self, item: dict) -> tuple[int, int | None]:
+        contacts = (item.get('_embedded') or {}).get('contacts') or []
+        contact_id = None
+        if contacts:
+            contact = contacts[0]
+            contact_id = int(contact['id']) if contact.get('id') else self._create_contact(contact)
+        lead_id = self.data.add_lead(item.get('pipeline_id', EDU_PIPELINE_ID), item.get('status_id', 0),
+                                     contact_id, item.get('name', 'Сделка'))
+        return lead_id, contact_id
+
+    async def _create_leads(self, request: web.Request) -> web.Response:
+        items = await self._body(request) or []
+        created = [{'id': self._create_lead(item)[0], 'request_id': str(index)} for index, item in enumerate(items)]
+        return self._json({'_embedded': {'leads': created}})
+
+    async def _create_complex(self, request: web.Request) -> web.Response:
+        items = await self._body(request) or []
+        created = []
+        for index, item in enumerate(items):
+            lead_id, contact_id = self._create_lead(item)
+            created.append({'id': lead_id, 'contact_id': contact_id, 'company_id': None,
+                            'request_id': [str(index)], 'merged': False})
+        return self._json(created)
+
+    async def _patch_lead(self, request: web.Request) -> web.Response:
+        lead_id = int(request.match_info['id'])
+        body = await self._body(request) or {}
+        if not self.data.move_lead(lead_id, body.get('pipeline_id'), body.get('status_id')):
+            return self._json({'title': 'Not Found', 'status': 404}, HTTPStatus.NOT_FOUND)
+        return self._json({'id': lead_id, 'updated_at': int(time.time())})
+
+    async def _patch_leads(self, request: web.Request) -> web.Response:
+        items = await self._body(request) or []
+        updated = []
+        for item in items:
+            lead_id = int(item['id'])
+            if self.data.move_lead(lead_id, item.get('pipeline_id'), item.get('status_id')):
+                updated.append({'id': lead_id, 'updated_at': int(time.time())})
+        return self._json({'_embedded': {'leads': updated}})
+
+    # --- примечания ---
+
+    async def _add_notes(self, request: web.Request) -> web.Response:
+        items = await self._body(request) or []
+        created = []
+        for item in items:
+            note_id = self.data.add_note(int(item['entity_id']), (item.get('params') or {}).get('text', ''))
+            created.append({'id': note_id, 'entity_id': int(item['entity_id']), 'request_id': item.get('request_id')})
+        return self._json({'_embedded': {'notes': created}})
+
+    async def _add_lead_notes(self, request: web.Request) -> web.Response:
+        lead_id = int(request.match_info['id'])
+        items = await self._body(request) or []
+        created = [{'id': self.data.add_note(lead_id, (item.get('params') or {}).get('text', '')),
+                    'entity_id': lead_id, 'request_id': str(index)} for index, item in enumerate(items)]
+        return self._json({'_embedded': {'notes': created}})
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    started = time.perf_counter()
+    data = FakeAmoData.seed(args.leads, args.contacts, edu_share=args.edu_share, seed=args.seed)
+    logger.info('Данные засеяны за %.1f с', time.perf_counter() - started)
+    server = FakeAmoServer(data, args.host, args.port, latency=args.latency, jitter=args.jitter,
+                           rps=args.rps, error_rate=args.error_rate)
+    await server.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Локальная замена amoCRM')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8202)
+    parser.add_argument('--leads', type=int, default=200_000, help='сколько сделок засеять')
+    parser.add_argument('--contacts', type=int, default=None, help='сколько контактов (по умолчанию = сделок)')
+    parser.add_argument('--edu-share', type=float, default=0.6, help='доля сделок в воронке обучения')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка каждого ответа, секунды')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--rps', type=float, default=7, help='лимит запросов в секунду, сверх него 429 (0 - без лимита)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 500')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
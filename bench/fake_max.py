@@ -0,0 +1,348 @@
+"""Локальная замена MAX Bot API для нагрузочных прогонов без сети.
+
+Реализует то, чем пользуется бот: /me, /subscriptions, /messages (send, edit, delete), /answers,
+/uploads + загрузку файла, /chats/{id}. Задержка и доля ошибок настраиваются, обновления
+отправляются на вебхук бота (по умолчанию http://127.0.0.1:8102/, либо URL из /subscriptions).
+
+Запуск отдельным процессом:
+    python -m bench.fake_max --port 8201 --latency 0.05 --jitter 0.02 --error-rate 0.01
+и бот с MAX_API_URL=http://127.0.0.1:8201 MAX_WEBHOOK_URL=http://127.0.0.1:8102/.
+Из кода нагрузочного теста - FakeMaxServer(...).start() в том же event loop.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import logging
+import random
+import time
+from collections import defaultdict
+from http import HTTPStatus
+from typing import Any
+
+import aiohttp
+from aiohttp import web
+
+from services.json_codec import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+BOT_USER_ID = 1
+DEFAULT_WEBHOOK_URL = 'http://127.0.0.1:8102/'
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def make_user(user_id: int, first_name: str = 'Bench', last_name: str | None = None) -> dict[str, Any]:
+    return {'user_id': user_id, 'first_name': first_name, 'last_name': last_name or str(user_id),
+            'username': None, 'is_bot': False, 'last_activity_time': _now_ms()}
+
+
+def bot_started_update(user_id: int, payload: str | None = None) -> dict[str, Any]:
+    return {'update_type': 'bot_started', 'timestamp': _now_ms(), 'chat_id': user_id,
+            'user': make_user(user_id), 'payload': payload, 'user_locale': 'ru'}
+
+
+def message_created_update(user_id: int, text: str | None = None, attachments: list[dict] | None = None,
+                           mid: str | None = None) -> dict[str, Any]:
+    return {
+        'update_type': 'message_created',
+        'timestamp': _now_ms(),
+        'user_locale': 'ru',
+        'message': {
+            'sender': make_user(user_id),
+            'recipient': {'chat_id': user_id, 'chat_type': 'dialog', 'user_id': BOT_USER_ID},
+            'timestamp': _now_ms(),
+            'body': {'mid': mid or f'mid.user.{user_id}.{time.time_ns()}', 'seq': time.time_ns(),
+                     'text': text, 'attachments': attachments or []},
+        },
+    }
+
+
+def contact_attachment(user_id: int, phone: str, name: str = 'Bench User') -> dict[str, Any]:
+    vcf = f'BEGIN:VCARD\r\nVERSION:3.0\r\nFN:{name}\r\nTEL;TYPE=cell:{phone}\r\nEND:VCARD\r\n'
+    return {'type': 'contact', 'payload': {'vcf_info': vcf, 'max_info': make_user(user_id, name)}}
+
+
+def message_callback_update(user_id: int, payload: str, message: dict[str, Any] | None = None) -> dict[str, Any]:
+    return {
+        'update_type': 'message_callback',
+        'timestamp': _now_ms(),
+        'user_locale': 'ru',
+        'callback': {'timestamp': _now_ms(), 'callback_id': f'cb.{user_id}.{time.time_ns()}',
+                     'payload': payload, 'user': make_user(user_id)},
+        'message': message,
+    }
+
+
+def iter_callback_payloads(message: dict[str, Any]) -> list[str]:
+    """payload всех callback-кнопок сообщения бота, по строкам клавиатуры слева направо."""
+    payloads = []
+    for attachment in (message.get('body') or {}).get('attachments') or []:
+        if attachment.get('type') != 'inline_keyboard':
+            continue
+        for row in (attachment.get('payload') or {}).get('buttons') or []:
+            for button in row:
+                if button.get('type') == 'callback' and button.get('payload'):
+                    payloads.append(button['payload'])
+    return payloads
+
+
+class FakeMaxServer:
+    """aiohttp-приложение, отвечающее как MAX Bot API, и клиент для отправки обновлений на вебхук бота.
+
+    Все исходящие сообщения бота (send/edit) складываются в очередь пользователя: нагрузочный тест
+    ждёт ответ через wait_for_bot_message и выбирает по клавиатуре следующее действие.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8201, *, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = HTTPStatus.SERVICE_UNAVAILABLE,
+                 webhook_url: str | None = None, webhook_secret: str | None = None) -> None:
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+
+        self.requests: dict[str, int] = defaultdict(int)
+        self.errors_injected = 0
+        self._mid_counter = itertools.count(1)
+        self._messages: dict[str, dict[str, Any]] = {}  # mid -> последнее состояние сообщения бота
+        self._inbox: dict[int, asyncio.Queue] = defaultdict(asyncio.Queue)
+        self._uploads: dict[str, str] = {}  # upload id -> тип файла
+        self._runner: web.AppRunner | None = None
+        self._client: aiohttp.ClientSession | None = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    # --- сервер ---
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._inject_faults], client_max_size=1024 ** 3)
+        app.router.add_get('/me', self._me)
+        app.router.add_post('/subscriptions', self._subscribe)
+        app.router.add_get('/subscriptions', self._subscriptions)
+        app.router.add_delete('/subscriptions', self._ok)
+        app.router.add_post('/messages', self._send_message)
+        app.router.add_put('/messages', self._edit_message)
+        app.router.add_delete('/messages', self._ok)
+        app.router.add_post('/answers', self._answer)
+        app.router.add_post('/uploads', self._get_upload_url)
+        app.router.add_post('/upload/{upload_id}', self._upload_file)
+        app.router.add_get('/chats/{chat_id}', self._chat)
+        app.router.add_get('/chats/{chat_id}/members', self._members)
+        app.router.add_post('/chats/{chat_id}/actions', self._ok)
+        return app
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._client = aiohttp.ClientSession()
+        logger.info('Fake MAX API слушает %s (latency=%ss, jitter=%ss, error_rate=%s)',
+                    self.url, self.latency, self.jitter, self.error_rate)
+
+    async def stop(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @web.middleware
+    async def _inject_faults(self, request: web.Request, handler) -> web.StreamResponse:
+        resource = request.match_info.route.resource
+        self.requests[f'{request.method} {resource.canonical if resource else request.path}'] += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors_injected += 1
+            return self._json({'code': 'internal.error', 'message': 'injected by bench.fake_max'},
+                              status=self.error_status)
+        return await handler(request)
+
+    @staticmethod
+    def _json(data: Any, status: int = HTTPStatus.OK) -> web.Response:
+        return web.Response(body=dumps(data), status=status, content_type='application/json')
+
+    async def _read_json(self, request: web.Request) -> dict[str, Any]:
+        body = await request.read()
+        return loads(body) if body else {}
+
+    async def _ok(self, request: web.Request) -> web.Response:
+        return self._json({'success': True})
+
+    async def _me(self, request: web.Request) -> web.Response:
+        return self._json({'user_id': BOT_USER_ID, 'first_name': 'Fake bot', 'username': 'fake_bot',
+                           'is_bot': True, 'last_activity_time': _now_ms()})
+
+    async def _subscribe(self, request: web.Request) -> web.Response:
+        body = await self._read_json(request)
+        if self.webhook_url is None:
+            self.webhook_url = body.get('url')
+        if self.webhook_secret is None:
+            self.webhook_secret = body.get('secret')
+        logger.info('Бот подписался на вебхук %s', body.get('url'))
+        return self._json({'success': True})
+
+    async def _subscriptions(self, request: web.Request) -> web.Response:
+        url = self.webhook_url or DEFAULT_WEBHOOK_URL
+        return self._json({'subscriptions': [{'url': url, 'time': _now_ms(), 'update_types': None}]})
+
+    def _recipient_id(self, request: web.Request) -> int:
+        return int(request.query.get('user_id') or request.query.get('chat_id') or 0)
+
+    def _build_message(self, recipient_id: int, body: dict[str, Any], mid: str) -> dict[str, Any]:
+        return {
+            'sender': {'user_id': BOT_USER_ID, 'first_name': 'Fake bot', 'is_bot': True,
+                       'last_activity_time': _now_ms()},
+            'recipient': {'chat_id': recipient_id, 'chat_type': 'dialog', 'user_id': recipient_id},
+            'timestamp': _now_ms(),
+            'body': {'mid': mid, 'seq': next(self._mid_counter), 'text': body.get('text'),
+                     'attachments': body.get('attachments') or []},
+        }
+
+    async def _send_message(self, request: web.Request) -> web.Response:
+        recipient_id = self._recipient_id(request)
+        body = await self._read_json(request)
+        mid = f'mid.bot.{next(self._mid_counter)}'
+        message = self._build_message(recipient_id, body, mid)
+        self._messages[mid] = message
+        self._inbox[recipient_id].put_nowait(('send', message))
+        return self._json({'message': message})
+
+    async def _edit_message(self, request: web.Request) -> web.Response:
+        mid = request.query.get('message_id', '')
+        body = await self._read_json(request)
+        previous = self._messages.get(mid)
+        if previous is None:
+            return self._json({'success': False, 'message': 'message not found'}, status=HTTPStatus.NOT_FOUND)
+        recipient_id = previous['recipient']['user_id']
+        message = self._build_message(recipient_id, {
+            'text': body.get('text', previous['body'].get('text')),
+            'attachments': body['attachments'] if body.get('attachments') is not None
+            else previous['body'].get('attachments'),
+        }, mid)
+        self._messages[mid] = message
+        self._inbox[recipient_id].put_nowait(('edit', message))
+        return self._json({'success': True})
+
+    async def _answer(self, request: web.Request) -> web.Response:
+        body = await self._read_json(request)
+        if body.get('message'):
+            # callback.answer(new_text=...) заменяет сообщение с кнопкой; получателя берём из callback_id
+            recipient_id = int(request.query.get('callback_id', 'cb.0').split('.')[1] or 0)
+            mid = f'mid.bot.{next(self._mid_counter)}'
+            message = self._build_message(recipient_id, body['message'], mid)
+            self._messages[mid] = message
+            self._inbox[recipient_id].put_nowait(('answer', message))
+        return self._json({'success': True})
+
+    async def _get_upload_url(self, request: web.Request) -> web.Response:
+        upload_type = request.query.get('type', 'file')
+        upload_id = f'{upload_type}-{next(self._mid_counter)}'
+        self._uploads[upload_id] = upload_type
+        # Для видео токен выдаётся сразу, для фото - в ответе на загрузку файла, как в настоящем API
+        token = f'token-{upload_id}' if upload_type in ('video', 'audio') else None
+        return self._json({'url': f'{self.url}/upload/{upload_id}', 'token': token})
+
+    async def _upload_file(self, request: web.Request) -> web.Response:
+        upload_id = request.match_info['upload_id']
+        await request.read()
+        if self._uploads.pop(upload_id, None) == 'image':
+            return self._json({'photos': {'fake': {'token': f'token-{upload_id}'}}})
+        return self._json({'token': f'token-{upload_id}'})
+
+    async def _chat(self, request: web.Request) -> web.Response:
+        chat_id = int(request.match_info['chat_id'])
+        return self._json({'chat_id': chat_id, 'type': 'dialog', 'status': 'active', 'title': None,
+                           'last_event_time': _now_ms(), 'participants_count': 2, 'is_public': False,
+                           'dialog_with_user': make_user(chat_id)})
+
+    async def _members(self, request: web.Request) -> web.Response:
+        user_ids = [int(user_id) for user_id in request.query.get('user_ids', '').split(',') if user_id]
+        return self._json({'members': [
+            {**make_user(user_id), 'last_access_time': _now_ms(), 'is_owner': False, 'is_admin': False,
+             'join_time': _now_ms(), 'permissions': None}
+            for user_id in user_ids
+        ], 'marker': None})
+
+    # --- клиентская сторона: обновления на вебхук бота ---
+
+    async def post_update(self, update: dict[str, Any]) -> tuple[int, float]:
+        """Отправляет обновление на вебхук бота. Возвращает (HTTP-статус, время ответа вебхука в секундах)."""
+        if self._client is None:
+            self._client = aiohttp.ClientSession()
+        headers = {'Content-Type': 'application/json'}
+        if self.webhook_secret:
+            headers['X-Max-Bot-Api-Secret'] = self.webhook_secret
+        started = time.perf_counter()
+        async with self._client.post(self.webhook_url or DEFAULT_WEBHOOK_URL, data=dumps(update),
+                                     headers=headers) as response:
+            await response.read()
+            return response.status, time.perf_counter() - started
+
+    async def wait_for_bot_message(self, user_id: int, timeout: float = 10.0) -> tuple[str, dict[str, Any]]:
+        """Следующее сообщение бота пользователю: ('send' | 'edit' | 'answer', message)."""
+        return await asyncio.wait_for(self._inbox[user_id].get(), timeout)
+
+    def drain_bot_messages(self, user_id: int) -> list[tuple[str, dict[str, Any]]]:
+        queue = self._inbox[user_id]
+        items = []
+        while not queue.empty():
+            items.append(queue.get_nowait())
+        return items
+
+    def forget_user(self, user_id: int) -> None:
+        self._inbox.pop(user_id, None)
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    server = FakeMaxServer(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                           error_rate=args.error_rate, error_status=args.error_status,
+                           webhook_url=args.webhook_url, webhook_secret=args.webhook_secret)
+    await server.start()
+    try:
+        if args.send_bot_started:
+            for user_id in range(args.first_user_id, args.first_user_id + args.send_bot_started):
+                status, elapsed = await server.post_update(bot_started_update(user_id))
+                logger.info('bot_started %s -> %s за %.1f мс', user_id, status, elapsed * 1000)
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Локальная замена MAX Bot API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8201)
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка каждого ответа, секунды')
+    parser.add_argument('--jitter', type=float, default=0.0, help='случайная добавка к задержке, до N секунд')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля запросов, на которые вернуть ошибку')
+    parser.add_argument('--error-status', type=int, default=HTTPStatus.SERVICE_UNAVAILABLE)
+    parser.add_argument('--webhook-url', default=None, help=f'куда слать обновления (по умолчанию из /subscriptions '
+                                                            f'или {DEFAULT_WEBHOOK_URL})')
+    parser.add_argument('--webhook-secret', default=None)
+    parser.add_argument('--send-bot-started', type=int, default=0,
+                        help='после старта отправить bot_started от N пользователей')
+    parser.add_argument('--first-user-id', type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
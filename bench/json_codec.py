@@ -0,0 +1,132 @@
+"""Микробенчмарк JSON: стандартный json против services.json_codec на типичных телах запросов.
+
+Запуск: python -m bench.json_codec [--number 2000]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import Any, Callable
+
+from service.webhook import update_dedup_key
+from services import json_codec
+
+
+def _max_message_update() -> bytes:
+    # Обновление message_created с кнопкой-вложением, ~1 КБ как у ответов на вопросы урока
+    return json.dumps({
+        'update_type': 'message_created',
+        'timestamp': 1760000000000,
+        'user_locale': 'ru',
+        'message': {
+            'sender': {'user_id': 123456789, 'first_name': 'Иван', 'last_name': 'Петров',
+                       'username': None, 'is_bot': False, 'last_activity_time': 1760000000000},
+            'recipient': {'chat_id': 987654321, 'chat_type': 'dialog', 'user_id': 555},
+            'timestamp': 1760000000000,
+            'body': {
+                'mid': 'mid.0000000000000000000000000000000000000000000000abcdef',
+                'seq': 115000000000000000,
+                'text': 'Ответ на вопрос урока: ' + 'вариант ответа с пояснением ' * 10,
+                'attachments': [{'type': 'inline_keyboard', 'payload': {'buttons': [
+                    [{'type': 'callback', 'text': f'Вариант {index}', 'payload': f'answer_{index}'}]
+                    for index in range(4)
+                ]}}],
+                'markup': [],
+            },
+            'stat': None,
+        },
+    }, ensure_ascii=False).encode()
+
+
+def _max_callback_update() -> bytes:
+    return json.dumps({
+        'update_type': 'message_callback',
+        'timestamp': 1760000000000,
+        'callback': {'timestamp': 1760000000000, 'callback_id': 'cb.0000000000000000abcdef',
+                     'payload': 'lesson_1_question_3_answer_2',
+                     'user': {'user_id': 123456789, 'first_name': 'Иван', 'is_bot': False}},
+        'message': None,
+        'user_locale': 'ru',
+    }, ensure_ascii=False).encode()
+
+
+def _amo_contacts_page(size: int = 250) -> bytes:
+    # Страница /api/v4/contacts с телефоном, почтой и парой пользовательских полей у каждого контакта
+    contacts = []
+    for index in range(size):
+        contacts.append({
+            'id': 10000000 + index,
+            'name': f'Клиент {index}',
+            'first_name': 'Клиент',
+            'last_name': str(index),
+            'responsible_user_id': 1234567,
+            'created_at': 1700000000,
+            'updated_at': 1760000000,
+            'custom_fields_values': [
+                {'field_id': 1, 'field_name': 'Телефон', 'field_code': 'PHONE', 'field_type': 'multitext',
+                 'values': [{'value': f'+7900{index:07d}', 'enum_id': 1, 'enum_code': 'WORK'}]},
+                {'field_id': 2, 'field_name': 'Email', 'field_code': 'EMAIL', 'field_type': 'multitext',
+                 'values': [{'value': f'client{index}@example.com', 'enum_id': 2, 'enum_code': 'WORK'}]},
+                {'field_id': 1104992, 'field_name': 'MAX id', 'field_code': None, 'field_type': 'text',
+                 'values': [{'value': str(100000000 + index)}]},
+            ],
+            '_links': {'self': {'href': f'https://example.amocrm.ru/api/v4/contacts/{10000000 + index}'}},
+        })
+    return json.dumps({'_page': 1, '_links': {}, '_embedded': {'contacts': contacts}}, ensure_ascii=False).encode()
+
+
+def _amo_notes_batch(size: int = 50) -> list[dict]:
+    return [{'entity_id': 20000000 + index, 'note_type': 'common', 'request_id': str(index),
+             'params': {'text': 'Урок 3 пройден, результат теста: 8 из 10'}}
+            for index in range(size)]
+
+
+def _per_call_us(func: Callable[[], Any], number: int) -> float:
+    func()
+    started = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - started) / number * 1e6
+
+
+def _webhook_stdlib(body: bytes) -> Callable[[], Any]:
+    return lambda: update_dedup_key(json.loads(body))
+
+
+def _webhook_codec(body: bytes) -> Callable[[], Any]:
+    return lambda: update_dedup_key(json_codec.loads(body))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=2000, help='сколько раз повторять каждую операцию')
+    args = parser.parse_args()
+
+    message_update = _max_message_update()
+    callback_update = _max_callback_update()
+    contacts_page = _amo_contacts_page()
+    notes_batch = _amo_notes_batch()
+
+    cases = [
+        (f'вебхук message_created ({len(message_update)} Б)',
+         _webhook_stdlib(message_update), _webhook_codec(message_update), args.number),
+        (f'вебхук message_callback ({len(callback_update)} Б)',
+         _webhook_stdlib(callback_update), _webhook_codec(callback_update), args.number),
+        (f'amoCRM: страница контактов ({len(contacts_page) // 1024} КБ)',
+         lambda: json.loads(contacts_page), lambda: json_codec.loads(contacts_page), max(args.number // 20, 10)),
+        ('amoCRM: пакет из 50 примечаний (запрос)',
+         lambda: json.dumps(notes_batch).encode(), lambda: json_codec.dumps(notes_batch), args.number),
+    ]
+
+    print(f'Бэкенд services.json_codec: {json_codec.BACKEND}')
+    print(f'{"операция":<44} {"json, мкс":>10} {"codec, мкс":>11} {"экономия, мкс":>14} {"x":>6}')
+    for title, stdlib_call, codec_call, number in cases:
+        stdlib_us = _per_call_us(stdlib_call, number)
+        codec_us = _per_call_us(codec_call, number)
+        print(f'{title:<44} {stdlib_us:>10.1f} {codec_us:>11.1f} {stdlib_us - codec_us:>14.1f} '
+              f'{stdlib_us / codec_us:>6.1f}')
+
+
+if __name__ == '__main__':
+    main()
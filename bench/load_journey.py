@@ -0,0 +1,352 @@
+"""Нагрузочный прогон: N пользователей одновременно проходят весь путь в боте.
+
+bot_started -> выбор типа клиента -> авторизация контактом -> 7 уроков (с переключением ответов) -> экзамен.
+Генератор поднимает bench.fake_max и bench.fake_amo в своём процессе, бот запускается отдельно и смотрит на них:
+    MAX_API_URL=http://127.0.0.1:8201 MAX_WEBHOOK_URL=http://127.0.0.1:8102/ \\
+    AMOCRM_BASE_URL=http://127.0.0.1:8202 python main.py
+    python -m bench.load_journey --users 200 --ramp 30 --think-min 0.5 --think-max 2
+
+Время шага - от отправки обновления на вебхук до прихода ожидаемого ответа бота в fake MAX.
+В конце печатается пропускная способность, p50/p95/p99 и доля ошибок по каждому шагу.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import math
+import random
+import time
+from collections import defaultdict
+from typing import Any, Callable
+
+from bench.fake_amo import FIRST_CONTACT_ID, FakeAmoData, FakeAmoServer, bench_phone
+from bench.fake_max import (FakeMaxServer, bot_started_update, contact_attachment, iter_callback_payloads,
+                            message_callback_update, message_created_update)
+from service import questions_lexicon
+from services.json_codec import dumps
+
+logger = logging.getLogger(__name__)
+
+LESSONS = {number: getattr(questions_lexicon, f'questions_{number}') for number in range(1, 8)}
+EXAM_ANSWERS = questions_lexicon.exam_lesson
+CLIENT_TYPES = tuple(questions_lexicon.who_are_you['buttons'])
+
+
+class JourneyError(Exception):
+    def __init__(self, step: str, reason: str) -> None:
+        super().__init__(f'{step}: {reason}')
+        self.step = step
+        self.reason = reason
+
+
+class StepStats:
+    """Времена и ошибки по шагам пути пользователя."""
+
+    def __init__(self) -> None:
+        self.timings: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.error_reasons: dict[str, int] = defaultdict(int)
+        self.updates_sent = 0
+
+    def record(self, step: str, duration: float) -> None:
+        self.timings[step].append(duration)
+
+    def record_error(self, step: str, reason: str) -> None:
+        self.errors[step] += 1
+        self.error_reasons[f'{step}: {reason}'] += 1
+
+    @staticmethod
+    def percentile(values: list[float], q: float) -> float:
+        ordered = sorted(values)
+        if not ordered:
+            return 0.0
+        return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+    def rows(self) -> list[dict[str, Any]]:
+        rows = []
+        for step in sorted(set(self.timings) | set(self.errors), key=_step_order):
+            values = self.timings.get(step, [])
+            total = len(values) + self.errors.get(step, 0)
+            rows.append({
+                'step': step,
+                'count': total,
+                'errors': self.errors.get(step, 0),
+                'error_rate': self.errors.get(step, 0) / total if total else 0.0,
+                'p50_ms': self.percentile(values, 50) * 1000,
+                'p95_ms': self.percentile(values, 95) * 1000,
+                'p99_ms': self.percentile(values, 99) * 1000,
+                'max_ms': max(values, default=0.0) * 1000,
+            })
+        return rows
+
+
+def _step_order(step: str) -> tuple:
+    phase, _, action = step.partition('.')
+    phases = ['bot_started', 'client_type', 'authorize', 'start', 'menu'] + [f'lesson_{n}' for n in LESSONS] + ['exam']
+    actions = ['open', 'video', 'answer', 'counter', 'next', 'result']
+    return (phases.index(phase) if phase in phases else len(phases), actions.index(action) if action in actions else 0)
+
+
+def _buttons(message: dict[str, Any]) -> list[dict[str, Any]]:
+    buttons = []
+    for attachment in (message.get('body') or {}).get('attachments') or []:
+        if attachment.get('type') == 'inline_keyboard':
+            for row in (attachment.get('payload') or {}).get('buttons') or []:
+                buttons.extend(row)
+    return buttons
+
+
+def _has_payload(*payloads: str) -> Callable[[str, dict], bool]:
+    def predicate(kind: str, message: dict) -> bool:
+        return all(payload in iter_callback_payloads(message) for payload in payloads)
+    return predicate
+
+
+def _is_question(kind: str, message: dict) -> bool:
+    payloads = iter_callback_payloads(message)
+    return 'next' in payloads and len(payloads) > 1
+
+
+def _is_exam_question(kind: str, message: dict) -> bool:
+    return any(payload.endswith('_increment') for payload in iter_callback_payloads(message))
+
+
+def _asks_contact(kind: str, message: dict) -> bool:
+    return any(button.get('type') == 'request_contact' for button in _buttons(message))
+
+
+class Journey:
+    """Путь одного пользователя. Ответы бота выбираются по клавиатуре последнего сообщения."""
+
+    def __init__(self, max_server: FakeMaxServer, stats: StepStats, user_id: int, phone: str,
+                 args: argparse.Namespace, rng: random.Random) -> None:
+        self.max = max_server
+        self.stats = stats
+        self.user_id = user_id
+        self.phone = phone
+        self.args = args
+        self.rng = rng
+        self.message: dict[str, Any] | None = None
+
+    async def _think(self) -> None:
+        if self.args.think_max:
+            await asyncio.sleep(self.rng.uniform(self.args.think_min, self.args.think_max))
+
+    async def _act(self, step: str, update: dict[str, Any], expect: Callable[[str, dict], bool]) -> dict[str, Any]:
+        """Отправляет обновление и ждёт сообщение бота, подходящее под expect. Время шага пишется в stats."""
+        await self._think()
+        self.max.drain_bot_messages(self.user_id)
+        started = time.perf_counter()
+        deadline = started + self.args.step_timeout
+        self.stats.updates_sent += 1
+        try:
+            status, _ = await self.max.post_update(update)
+        except Exception as error:
+            raise JourneyError(step, type(error).__name__)
+        if status != 200:
+            raise JourneyError(step, f'webhook {status}')
+
+        while True:
+            remaining = deadline - time.perf_counter()
+            try:
+                kind, message = await self.max.wait_for_bot_message(self.user_id, max(remaining, 0.001))
+            except asyncio.TimeoutError:
+                raise JourneyError(step, 'нет ответа бота')
+            if expect(kind, message):
+                self.stats.record(step, time.perf_counter() - started)
+                self.message = message
+                return message
+
+    def _edited(self, kind: str, message: dict) -> bool:
+        return message['body']['mid'] == self.message['body']['mid']
+
+    async def _click(self, step: str, payload: str, expect: Callable[[str, dict], bool] | None = None) -> dict:
+        update = message_callback_update(self.user_id, payload, self.message)
+        return await self._act(step, update, expect or self._edited)
+
+    async def run(self) -> None:
+        await self._act('bot_started', bot_started_update(self.user_id),
+                        lambda kind, message: bool({*CLIENT_TYPES, 'lesson_1'} & set(iter_callback_payloads(message))))
+        if 'lesson_1' not in iter_callback_payloads(self.message):
+            await self._click('client_type', self.rng.choice(CLIENT_TYPES), _asks_contact)
+            contact = message_created_update(self.user_id, attachments=[contact_attachment(self.user_id, self.phone)])
+            await self._act('authorize', contact, _has_payload('start'))
+            await self._click('start', 'start', _has_payload('lesson_1'))
+
+        for number in range(1, self.args.lessons + 1):
+            await self._lesson(number)
+        if self.args.exam:
+            await self._exam()
+
+    async def _lesson(self, number: int) -> None:
+        phase = f'lesson_{number}'
+        questions = LESSONS[number]
+        await self._click(f'{phase}.open', phase, _has_payload('next'))
+        await self._click(f'{phase}.video', 'next', _is_question)
+
+        question = 1
+        while True:
+            payloads = [payload for payload in iter_callback_payloads(self.message) if payload != 'next']
+            answers = (questions.get(f'Lesson_{number}:question_{question}') or {}).get('answers') or []
+            correct = [str(answer[1]) for answer in answers if len(answer) > 2 and answer[2]] or payloads[:1]
+            wrong = [payload for payload in payloads if payload not in correct]
+            # Переключения: неверный вариант выбирается и снимается, как это делают живые пользователи
+            for _ in range(self.args.toggles if wrong else 0):
+                toggled = self.rng.choice(wrong)
+                await self._click(f'{phase}.answer', toggled)
+                await self._click(f'{phase}.answer', toggled)
+            for payload in correct:
+                await self._click(f'{phase}.answer', payload)
+
+            step = f'{phase}.result' if question >= len(questions) else f'{phase}.next'
+            message = await self._click(step, 'next')
+            if 'main_menu' in iter_callback_payloads(message):
+                break
+            question += 1
+
+        if 'Поздравляем' not in (message['body'].get('text') or ''):
+            # Следующий урок закрыт, дальше идти бессмысленно
+            raise JourneyError(f'{phase}.result', 'урок не пройден')
+        await self._click('menu', 'main_menu', _has_payload('lesson_1'))
+
+    async def _exam(self) -> None:
+        await self._click('exam.open', 'exam', _has_payload('next'))
+        await self._click('exam.video', 'next', _is_exam_question)
+        for question in range(1, len(EXAM_ANSWERS) + 1):
+            for key, count in EXAM_ANSWERS[f'q{question}'].items():
+                # Лишний плюс с последующим минусом - типичное поведение на счётчиках
+                for _ in range(self.args.toggles):
+                    await self._click('exam.counter', f'{key}_increment')
+                    await self._click('exam.counter', f'{key}_decrement')
+                for _ in range(count):
+                    await self._click('exam.counter', f'{key}_increment')
+            if question < len(EXAM_ANSWERS):
+                await self._click('exam.next', 'next', _is_exam_question)
+        await self._click('exam.result', 'next', _has_payload('main_menu'))
+        if 'Поздравляем' not in (self.message['body'].get('text') or ''):
+            raise JourneyError('exam.result', 'экзамен не сдан')
+
+
+async def _run_user(max_server: FakeMaxServer, stats: StepStats, args: argparse.Namespace, index: int,
+                    results: dict[str, int]) -> None:
+    rng = random.Random(args.seed + index)
+    await asyncio.sleep(args.ramp * index / max(args.users, 1))
+    user_id = args.first_user_id + index
+    # Часть пользователей уже есть в amoCRM: их телефоны совпадают с засеянными контактами
+    if index < args.amo_leads and rng.random() < args.known_share:
+        phone = bench_phone(FIRST_CONTACT_ID + index)
+    else:
+        phone = f'7901{user_id % 10_000_000:07d}'
+    journey = Journey(max_server, stats, user_id, phone, args, rng)
+    try:
+        await journey.run()
+        results['completed'] += 1
+    except JourneyError as error:
+        stats.record_error(error.step, error.reason)
+        results['failed'] += 1
+        logger.debug('Пользователь %s остановился на шаге %s', user_id, error)
+    finally:
+        max_server.forget_user(user_id)
+
+
+def _print_report(stats: StepStats, results: dict[str, int], elapsed: float, max_server: FakeMaxServer,
+                  amo_server: FakeAmoServer | None) -> None:
+    print(f'\nПользователей: {results["completed"] + results["failed"]}, прошли путь: {results["completed"]}, '
+          f'прервались: {results["failed"]}, время: {elapsed:.1f} с')
+    print(f'Обновлений отправлено: {stats.updates_sent} ({stats.updates_sent / elapsed:.1f}/с), '
+          f'завершённых путей в минуту: {results["completed"] / elapsed * 60:.1f}')
+    print(f'\n{"шаг":<18}{"кол-во":>8}{"ошибки":>8}{"ошибки %":>10}{"p50 мс":>10}{"p95 мс":>10}'
+          f'{"p99 мс":>10}{"max мс":>10}')
+    for row in stats.rows():
+        print(f'{row["step"]:<18}{row["count"]:>8}{row["errors"]:>8}{row["error_rate"] * 100:>10.2f}'
+              f'{row["p50_ms"]:>10.1f}{row["p95_ms"]:>10.1f}{row["p99_ms"]:>10.1f}{row["max_ms"]:>10.1f}')
+    if stats.error_reasons:
+        print('\nПричины ошибок:')
+        for reason, count in sorted(stats.error_reasons.items(), key=lambda item: -item[1]):
+            print(f'  {count:6d}  {reason}')
+    print(f'\nЗапросов бота к fake MAX: {sum(max_server.requests.values())}, '
+          f'внесённых ошибок: {max_server.errors_injected}')
+    if amo_server is not None:
+        print(f'Запросов бота к fake amoCRM: {sum(amo_server.requests.values())}, ответов 429: {amo_server.throttled}')
+
+
+async def _run(args: argparse.Namespace) -> None:
+    max_server = FakeMaxServer(port=args.max_port, latency=args.max_latency, jitter=args.max_jitter,
+                               error_rate=args.max_error_rate, webhook_url=args.webhook_url,
+                               webhook_secret=args.webhook_secret)
+    amo_server = None
+    if args.amo_port:
+        amo_server = FakeAmoServer(FakeAmoData.seed(args.amo_leads), port=args.amo_port, latency=args.amo_latency,
+                                   rps=args.amo_rps)
+        await amo_server.start()
+    await max_server.start()
+    try:
+        if args.webhook_url is None:
+            logger.info('Жду, пока бот подпишется на вебхук в fake MAX (до %s с)...', args.startup_timeout)
+            deadline = time.monotonic() + args.startup_timeout
+            while max_server.webhook_url is None and time.monotonic() < deadline:
+                await asyncio.sleep(0.2)
+            if max_server.webhook_url is None:
+                logger.warning('Подписки не было, обновления пойдут на адрес по умолчанию')
+
+        stats = StepStats()
+        results = {'completed': 0, 'failed': 0}
+        started = time.perf_counter()
+        await asyncio.gather(*(_run_user(max_server, stats, args, index, results) for index in range(args.users)))
+        elapsed = time.perf_counter() - started
+
+        _print_report(stats, results, elapsed, max_server, amo_server)
+        if args.json:
+            with open(args.json, 'wb') as file:
+                file.write(dumps({'users': args.users, 'elapsed': elapsed, 'updates_sent': stats.updates_sent,
+                                  **results, 'steps': stats.rows(), 'errors': dict(stats.error_reasons)}))
+    finally:
+        await max_server.stop()
+        if amo_server is not None:
+            await amo_server.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон пути пользователя через бота')
+    parser.add_argument('--users', type=int, default=50, help='сколько пользователей проходят путь одновременно')
+    parser.add_argument('--ramp', type=float, default=10.0, help='за сколько секунд запустить всех пользователей')
+    parser.add_argument('--think-min', type=float, default=0.2, help='минимальная пауза перед действием, секунды')
+    parser.add_argument('--think-max', type=float, default=1.0, help='максимальная пауза перед действием (0 - без пауз)')
+    parser.add_argument('--lessons', type=int, default=len(LESSONS), choices=range(0, len(LESSONS) + 1))
+    parser.add_argument('--no-exam', dest='exam', action='store_false')
+    parser.add_argument('--toggles', type=int, default=1, help='сколько раз на вопрос выбрать и снять неверный ответ')
+    parser.add_argument('--step-timeout', type=float, default=15.0, help='сколько ждать ответ бота на шаг')
+    parser.add_argument('--first-user-id', type=int, default=None,
+                        help='max_id первого пользователя (по умолчанию от текущего времени, чтобы не пересекаться)')
+    parser.add_argument('--known-share', type=float, default=0.3, help='доля пользователей, уже заведённых в amoCRM')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', default=None, help='сохранить итоги в файл для сравнения прогонов')
+
+    parser.add_argument('--max-port', type=int, default=8201)
+    parser.add_argument('--max-latency', type=float, default=0.0)
+    parser.add_argument('--max-jitter', type=float, default=0.0)
+    parser.add_argument('--max-error-rate', type=float, default=0.0)
+    parser.add_argument('--webhook-url', default=None, help='вебхук бота (по умолчанию берётся из подписки бота)')
+    parser.add_argument('--webhook-secret', default=None)
+    parser.add_argument('--startup-timeout', type=float, default=60.0)
+
+    parser.add_argument('--amo-port', type=int, default=8202, help='0 - не поднимать fake amoCRM')
+    parser.add_argument('--amo-leads', type=int, default=10_000)
+    parser.add_argument('--amo-latency', type=float, default=0.0)
+    parser.add_argument('--amo-rps', type=float, default=0.0)
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+    if args.first_user_id is None:
+        args.first_user_id = 900_000_000 + int(time.time()) % 10_000 * 10_000
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    try:
+        asyncio.run(_run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""Микробенчмарки отрисовки и проверки вопросов: клавиатуры, тексты, подсчёт результатов уроков и экзамена.
+
+Каждый случай прогоняет функцию по всем вопросам одного урока из service/questions_lexicon.py.
+Время - минимум из нескольких повторов (timeit), в микросекундах на вызов.
+
+    python -m bench.quiz_hotpaths run                    # просто замерить
+    python -m bench.quiz_hotpaths save                   # замерить и записать базовую линию
+    python -m bench.quiz_hotpaths compare --threshold 0.2   # сравнить с базовой линией, код 1 при замедлении
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import time
+import timeit
+from pathlib import Path
+from typing import Any, Callable
+
+from service import questions_lexicon
+from service.questions_lexicon import exam_lesson
+from services.utils import (build_exam_keyboard, build_question_inline_keyboard, build_question_multiply_keyboard,
+                            extract_phone_from_vcf, get_question_text, proceed_exam, proceed_result, result_exam,
+                            result_exam_for_note)
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / '.baselines' / 'quiz_hotpaths.json'
+LESSONS = {str(number): getattr(questions_lexicon, f'questions_{number}') for number in range(1, 8)}
+VCF = ('BEGIN:VCARD\r\nVERSION:3.0\r\nFN:Иван Петров\r\nN:Петров;Иван;;;\r\nORG:ИП Петров\r\n'
+       'EMAIL;TYPE=work:ivan@example.com\r\nTEL;TYPE=cell:+7 (900) 123-45-67\r\nEND:VCARD\r\n')
+
+
+def _correct_answers(question: dict[str, Any]) -> dict:
+    return {answer[1]: answer[2] for answer in question.get('answers', [])}
+
+
+def _lesson_cases(number: str, lesson: dict[str, dict]) -> dict[str, Callable[[], Any]]:
+    questions = list(lesson.values())
+    numbers = range(1, len(lesson) + 1)
+    chosen = [str(question['answers'][-1][1]) for question in questions]
+    multiply_chosen = [{str(answer[1]): bool(answer[2]) for answer in question['answers']} for question in questions]
+    all_correct = {'results': {f'question_{question["key"][1:]}': _correct_answers(question) for question in questions}}
+
+    def inline_keyboards():
+        for question, choose in zip(questions, chosen):
+            build_question_inline_keyboard(question, choose_payload=choose)
+
+    def multiply_keyboards():
+        for question, choose in zip(questions, multiply_chosen):
+            build_question_multiply_keyboard(question, choose_payload=choose)
+
+    def question_texts():
+        for question_number in numbers:
+            get_question_text(lesson, lesson_number=number, question_number=question_number)
+            get_question_text(lesson, with_answers=True, lesson_number=number, question_number=question_number,
+                              is_radio=False)
+
+    return {
+        f'build_question_inline_keyboard[lesson_{number}]': inline_keyboards,
+        f'build_question_multiply_keyboard[lesson_{number}]': multiply_keyboards,
+        f'get_question_text[lesson_{number}]': question_texts,
+        f'proceed_result[lesson_{number}]': lambda: proceed_result(lesson, all_correct),
+    }
+
+
+def _exam_cases() -> dict[str, Callable[[], Any]]:
+    question_keys = list(exam_lesson)
+    answers = {f'exam_{index}': dict(exam_lesson[key]) for index, key in enumerate(question_keys, start=1)}
+
+    def exam_keyboards():
+        for key in question_keys:
+            build_exam_keyboard(exam_lesson, key)
+            build_exam_keyboard(exam_lesson, key, choose_payload=dict(exam_lesson[key]))
+
+    def exam_counters():
+        # Один полный проход счётчиков вопроса: столько нажатий "+", сколько нужно для правильного ответа
+        for key in question_keys:
+            choose = None
+            for item, count in exam_lesson[key].items():
+                for _ in range(count or 1):
+                    choose = proceed_exam(exam_lesson, key, choose, f'{item}_increment')
+
+    return {
+        'build_exam_keyboard[exam]': exam_keyboards,
+        'proceed_exam[exam]': exam_counters,
+        'result_exam[exam]': lambda: result_exam(answers, exam_lesson),
+        'result_exam_for_note[exam]': lambda: result_exam_for_note(answers, exam_lesson),
+        'extract_phone_from_vcf': lambda: extract_phone_from_vcf(VCF),
+    }
+
+
+def collect_cases() -> dict[str, Callable[[], Any]]:
+    cases = {}
+    for number, lesson in LESSONS.items():
+        cases.update(_lesson_cases(number, lesson))
+    cases.update(_exam_cases())
+    return cases
+
+
+def measure(func: Callable[[], Any], repeat: int, min_time: float) -> float:
+    """Минимальное время одного вызова в микросекундах."""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def run_cases(pattern: str | None, repeat: int, min_time: float) -> dict[str, float]:
+    results = {}
+    for name, func in collect_cases().items():
+        if pattern and pattern not in name:
+            continue
+        results[name] = measure(func, repeat, min_time)
+        print(f'{name:<52} {results[name]:>10.2f} мкс')
+    return results
+
+
+def save_baseline(path: Path, results: dict[str, float]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    baseline = {
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.node(),
+        'results_us': results,
+    }
+    path.write_text(json.dumps(baseline, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f'\nБазовая линия записана в {path}')
+
+
+def compare(path: Path, results: dict[str, float], threshold: float) -> bool:
+    """Печатает сравнение с базовой линией. Возвращает True, если есть замедления больше threshold."""
+    baseline = json.loads(path.read_text(encoding='utf-8'))
+    print(f'\nБазовая линия от {baseline["created_at"]} (Python {baseline["python"]}, {baseline["machine"]}), '
+          f'порог замедления {threshold:.0%}')
+    print(f'{"случай":<52} {"было, мкс":>10} {"стало, мкс":>11} {"изменение":>10}')
+    regressions = []
+    for name, current in results.items():
+        previous = baseline['results_us'].get(name)
+        if previous is None:
+            print(f'{name:<52} {"-":>10} {current:>11.2f} {"новый":>10}')
+            continue
+        change = current / previous - 1
+        mark = ''
+        if change > threshold:
+            regressions.append(name)
+            mark = '  <-- замедление'
+        print(f'{name:<52} {previous:>10.2f} {current:>11.2f} {change:>+10.1%}{mark}')
+
+    if regressions:
+        print(f'\nЗамедлилось больше чем на {threshold:.0%}: {len(regressions)} из {len(results)}')
+    else:
+        print('\nЗамедлений сверх порога нет')
+    return bool(regressions)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Микробенчмарки вопросов уроков и экзамена')
+    parser.add_argument('command', choices=('run', 'save', 'compare'))
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE, help='файл базовой линии')
+    parser.add_argument('--threshold', type=float, default=0.2, help='допустимое замедление, доля (0.2 = 20%%)')
+    parser.add_argument('-k', dest='pattern', default=None, help='только случаи, в имени которых есть подстрока')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help='минимальная длительность одного повтора, секунды')
+    args = parser.parse_args()
+
+    if args.command == 'compare' and not args.baseline.exists():
+        parser.error(f'нет базовой линии {args.baseline}, сначала запустите save')
+
+    results = run_cases(args.pattern, args.repeat, args.min_time)
+    if args.command == 'save':
+        save_baseline(args.baseline, results)
+    elif args.command == 'compare' and compare(args.baseline, results, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
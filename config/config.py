@@ -45,13 +45,17 @@ amo_fields = {
 @dataclass
 class MaxBot:
     token: str  #Токен для доступа к боту
-    api_url: str | None
+    api_url: str | None  # Адрес MAX Bot API, если не стандартный (например, локальный bench.fake_max)
+    webhook_url: str  # Публичный URL, на который MAX шлёт обновления
+    webhook_secret: str | None  # Секрет для заголовка X-Max-Bot-Api-Secret
+    rate_limit: float  # Сколько запросов в секунду процесс делает к MAX API (0 - без ограничения)
 
 
 # Класс с объектом TGBot
 @dataclass
 class Database:
     url: str  # URL подключения к PostgreSQL (async)
+    pool_size: int  # Размер пула соединений SQLAlchemy
 
 # Класс с данными для подключения к API AMO
 @dataclass
@@ -64,6 +68,49 @@ class AmoConfig:
     amocrm_refresh_token: str | None
     amocrm_secret_code: str
     path_to_env: str
+    webhook_path: str  # Путь, на который amoCRM шлёт вебхуки о смене этапа сделки
+    webhook_secret: str | None  # Значение query-параметра token в URL вебхука amoCRM; без него вебхук отключён
+    batch_window: float  # Сколько секунд копить примечания и смены этапов перед пакетной отправкой
+    request_timeout: float  # Таймаут одного запроса к amoCRM, секунды
+    breaker_failures: int  # Сколько ошибок подряд размыкают предохранитель amoCRM
+    breaker_reset_timeout: float  # Через сколько секунд после размыкания пробовать amoCRM снова
+    base_url: str | None  # Адрес API вместо https://<subdomain>.amocrm.ru (например, локальный bench.fake_amo)
+
+# Класс с настройками прогрева соединений при старте бота
+@dataclass
+class Warmup:
+    db_connections: int  # Сколько соединений с БД открыть до приёма вебхуков
+    http_connections: int  # Сколько соединений открыть к каждому HTTP-сервису (amoCRM, UTM)
+
+# Класс с настройками эндпоинта метрик
+@dataclass
+class Metrics:
+    path: str  # Путь, по которому отдаются метрики в формате Prometheus
+    token: str | None  # /metrics и служебные отчёты требуют заголовок Authorization: Bearer <token>; без токена они отключены
+    loop_lag_interval: float  # Как часто (в секундах) мерить задержку event loop
+    loop_block_threshold: float  # Сколько секунд блокировки event loop считать зависанием и писать стек в лог
+    loop_watchdog: bool  # Запускать ли поток-watchdog, который снимает стек заблокированного loop
+
+# Класс с настройками очереди входящих обновлений MAX
+@dataclass
+class Ingress:
+    workers: int  # Сколько обновлений обрабатывать одновременно; 0 - обрабатывать прямо в запросе вебхука
+    queue_size: int  # Сколько принятых обновлений может ждать обработки; сверх этого MAX получает 503 и повторит
+    shed_at: float  # С какой заполненности очереди (доля) пропускать обновления, на которые у бота нет хендлеров
+
+# Класс с настройками трейсинга обновлений
+@dataclass
+class Tracing:
+    enabled: bool  # Записывать ли трейсы обновлений (смотреть на /metrics/traces)
+    file_path: str | None  # Файл, куда дописывать спаны по одному JSON на строку
+
+# Класс с настройками выгрузки FSM-контекстов из памяти
+@dataclass
+class FsmContexts:
+    ttl: float  # Через сколько секунд простоя пользователя его FSM-контекст выгружается из памяти
+    sweep_interval: float  # Как часто (в секундах) искать простаивающие контексты
+    max_contexts: int  # Сколько контекстов держать в памяти максимум, лишние (самые старые) выгружаются
+    spill: bool  # Сохранять ли непустые контексты в БД перед выгрузкой, чтобы пользователь продолжил с того же места
 
 @dataclass
 class Config:
@@ -74,7 +121,11 @@ class Config:
     admin: str
     utm_token: str
     webhook_url: str
-
+    warmup: Warmup
+    metrics: Metrics
+    ingress: Ingress
+    tracing: Tracing
+    fsm: FsmContexts
 
 
 
@@ -87,9 +138,13 @@ def load_config(path: str | None = BASE_DIR / '.env'):
         max_bot=MaxBot(
             token=env("MAX_BOT_TOKEN", None) or env("BOT_TOKEN"),
             api_url=env("MAX_API_URL", None),
+            webhook_url=env("MAX_WEBHOOK_URL", "https://bots-webhook.hite-pro.ru/max/education_bot/"),
+            webhook_secret=env("MAX_WEBHOOK_SECRET", None),
+            rate_limit=env.float("MAX_RATE_LIMIT", 25),
         ),
         db=Database(
-            url=env("DATABASE_URL")
+            url=env("DATABASE_URL"),
+            pool_size=env.int("DB_POOL_SIZE", 5),
         ),
         amo_config=AmoConfig(
             path_to_env=path,
@@ -99,10 +154,43 @@ def load_config(path: str | None = BASE_DIR / '.env'):
             amocrm_redirect_url=env("AMOCRM_REDIRECT_URL"),
             amocrm_access_token=env("AMOCRM_ACCESS_TOKEN"),
             amocrm_refresh_token=env("AMOCRM_REFRESH_TOKEN"),
-            amocrm_secret_code=env("AMOCRM_SECRET")
+            amocrm_secret_code=env("AMOCRM_SECRET"),
+            webhook_path=env("AMOCRM_WEBHOOK_PATH", "/amo/leads"),
+            webhook_secret=env("AMOCRM_WEBHOOK_SECRET", None),
+            batch_window=env.float("AMOCRM_BATCH_WINDOW", 0.25),
+            request_timeout=env.float("AMOCRM_TIMEOUT", 10),
+            breaker_failures=env.int("AMOCRM_BREAKER_FAILURES", 5),
+            breaker_reset_timeout=env.float("AMOCRM_BREAKER_RESET", 30),
+            base_url=env("AMOCRM_BASE_URL", None),
         ),
         amo_fields=amo_fields,
         admin=env("ADMIN_ID"),
         utm_token=env("UTM_TOKEN"),
         webhook_url=env("WEBHOOK_URL"),
+        warmup=Warmup(
+            db_connections=env.int("WARMUP_DB_CONNECTIONS", 5),
+            http_connections=env.int("WARMUP_HTTP_CONNECTIONS", 2),
+        ),
+        metrics=Metrics(
+            path=env("METRICS_PATH", "/metrics"),
+            token=env("METRICS_TOKEN", None),
+            loop_lag_interval=env.float("LOOP_LAG_INTERVAL", 0.5),
+            loop_block_threshold=env.float("LOOP_BLOCK_THRESHOLD", 1.0),
+            loop_watchdog=env.bool("LOOP_WATCHDOG", True),
+        ),
+        ingress=Ingress(
+            workers=env.int("INGRESS_WORKERS", 8),
+            queue_size=env.int("INGRESS_QUEUE_SIZE", 500),
+            shed_at=env.float("INGRESS_SHED_AT", 0.8),
+        ),
+        tracing=Tracing(
+            enabled=env.bool("TRACING_ENABLED", True),
+            file_path=env("TRACING_FILE", None),
+        ),
+        fsm=FsmContexts(
+            ttl=env.float("FSM_CONTEXT_TTL", 6 * 60 * 60),
+            sweep_interval=env.float("FSM_SWEEP_INTERVAL", 60),
+            max_contexts=env.int("FSM_MAX_CONTEXTS", 8000),
+            spill=env.bool("FSM_SPILL", True),
+        ),
     )
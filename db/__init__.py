@@ -1,13 +1,30 @@
 from db.base import Base
-from db.models import HpLessonResult, User
-from db.session import async_session_factory, get_session, init_db, shutdown_db
+from db.models import (
+    AmoLeadStatus,
+    AmoOutbox,
+    AmoPhoneContact,
+    Broadcast,
+    BroadcastRecipient,
+    FsmContextSpill,
+    HpLessonResult,
+    User,
+)
+from db.session import async_session_factory, engine, get_session, init_db, shutdown_db, warmup_db
 
 __all__ = [
+    "AmoLeadStatus",
+    "AmoOutbox",
+    "AmoPhoneContact",
     "Base",
+    "Broadcast",
+    "BroadcastRecipient",
+    "FsmContextSpill",
     "HpLessonResult",
     "User",
     "async_session_factory",
+    "engine",
     "get_session",
     "init_db",
     "shutdown_db",
+    "warmup_db",
 ]
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime
 
-from sqlalchemy import BigInteger, Date, DateTime, ForeignKey, Integer, String, Boolean
+from sqlalchemy import JSON, BigInteger, Date, DateTime, ForeignKey, Index, Integer, String, Boolean, Text, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from db.base import Base
@@ -51,3 +51,79 @@ class HpLessonResult(Base):
     completed_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
 
     user: Mapped[User] = relationship(back_populates="lesson_results")
+
+
+class AmoPhoneContact(Base):
+    """Локальный кеш соответствия телефон -> контакт amoCRM."""
+    __tablename__ = "amo_phone_contacts"
+
+    phone: Mapped[str] = mapped_column(String(32), primary_key=True)
+    amo_contact_id: Mapped[int] = mapped_column(BigInteger, index=True)
+    first_name: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    last_name: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class AmoLeadStatus(Base):
+    """Локальное зеркало текущего этапа сделки в amoCRM."""
+    __tablename__ = "amo_lead_statuses"
+
+    lead_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    pipeline_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    status_id: Mapped[int] = mapped_column(BigInteger)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class AmoOutbox(Base):
+    """Очередь отложенных записей в amoCRM на время его недоступности."""
+    __tablename__ = "amo_outbox"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(32))
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    payload: Mapped[dict] = mapped_column(JSON, default=dict)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    done_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True, index=True)
+
+
+class FsmContextSpill(Base):
+    """FSM-контекст пользователя, выгруженный из памяти после простоя."""
+    __tablename__ = "fsm_context_spills"
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)  # "<chat_id>:<user_id>", как ключ в dp.contexts
+    state: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    data: Mapped[dict] = mapped_column(JSON, default=dict)
+    spilled_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+
+
+class Broadcast(Base):
+    """Рассылка администратора по сегменту пользователей."""
+    __tablename__ = "broadcasts"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    text: Mapped[str] = mapped_column(Text)
+    segment: Mapped[dict] = mapped_column(JSON, default=dict)
+    status: Mapped[str] = mapped_column(String(16), default="running", index=True)  # running, done, cancelled
+    created_by: Mapped[int] = mapped_column(BigInteger)  # max_user_id администратора, ему уходит отчёт
+    total: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class BroadcastRecipient(Base):
+    """Получатель рассылки и результат доставки ему: по этим записям рассылка продолжается после рестарта."""
+    __tablename__ = "broadcast_recipients"
+    __table_args__ = (
+        UniqueConstraint("broadcast_id", "user_id"),
+        Index("ix_broadcast_recipients_broadcast_status", "broadcast_id", "status"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    broadcast_id: Mapped[int] = mapped_column(ForeignKey("broadcasts.id", ondelete="CASCADE"))
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    max_user_id: Mapped[int] = mapped_column(BigInteger)
+    status: Mapped[str] = mapped_column(String(16), default="pending")  # pending, sent, failed
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
@@ -1,6 +1,10 @@
+import asyncio
+import logging
 from collections.abc import AsyncIterator
 
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
     AsyncEngine,
     AsyncSession,
     async_sessionmaker,
@@ -11,6 +15,8 @@ from config.config import load_config
 from db.base import Base
 import db.models  # noqa: F401  # Ensures models are registered on Base
 
+logger = logging.getLogger(__name__)
+
 
 def create_engine() -> AsyncEngine:
     config = load_config()
@@ -18,6 +24,7 @@ def create_engine() -> AsyncEngine:
         config.db.url,
         echo=False,
         pool_pre_ping=True,
+        pool_size=config.db.pool_size,
     )
 
 
@@ -35,5 +42,33 @@ async def init_db() -> None:
         await conn.run_sync(Base.metadata.create_all)
 
 
+async def warmup_db(connections: int) -> int:
+    # Открываем соединения одновременно, чтобы пул создал именно столько физических подключений,
+    # а не переиспользовал одно. После проверки соединения возвращаются в пул и остаются открытыми.
+    connections = min(connections, engine.pool.size())
+    if connections <= 0:
+        return 0
+
+    async def _open() -> AsyncConnection:
+        conn = await engine.connect()
+        try:
+            await conn.execute(text("SELECT 1"))
+        except Exception:
+            await conn.close()
+            raise
+        return conn
+
+    opened = await asyncio.gather(*(_open() for _ in range(connections)), return_exceptions=True)
+
+    ready = 0
+    for conn in opened:
+        if isinstance(conn, BaseException):
+            logger.warning("DB warmup connection failed: %r", conn)
+            continue
+        ready += 1
+        await conn.close()
+    return ready
+
+
 async def shutdown_db() -> None:
     await engine.dispose()
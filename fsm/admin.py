@@ -3,3 +3,6 @@ from maxapi.context import StatesGroup, State
 class Admin(StatesGroup):
     menu = State()
     id_reque = State()
+    broadcast_segment = State()
+    broadcast_text = State()
+    broadcast_confirm = State()
@@ -1,14 +1,30 @@
 from pprint import pprint
+import asyncio
 import logging
 from maxapi import Router, F, Bot
 from maxapi.context import MemoryContext
 from maxapi.enums.attachment import AttachmentType
+from maxapi.enums.upload_type import UploadType
 from maxapi.filters.command import Command
-from maxapi.types import BotStarted, MessageCreated, CallbackButton, MessageCallback, RequestContactButton
+from maxapi.types import BotStarted, MessageCreated, CallbackButton, MessageCallback, RequestContactButton, \
+    InputMediaBuffer
 from maxapi.utils.inline_keyboard import InlineKeyboardBuilder
 
 from amo_api.amo_service import processing_contact, processing_lead
-from service.questions_lexicon import welcome_message
+from service.broadcasts import (
+    SEGMENT_ALL,
+    SEGMENT_BEFORE_LESSON,
+    SEGMENT_CLIENT_TYPE,
+    cancel_broadcast,
+    count_segment,
+    create_broadcast,
+    segment_title,
+    start_broadcast,
+)
+from service.max_limiter import max_priority
+from service.metrics import PROFILE_DEFAULT_SECONDS, PROFILER, ProfilerBusyError
+from service.questions_lexicon import lessons, welcome_message, who_are_you
+from service.service import ADMIN_MAX_ID
 from fsm.main_states import Main_menu
 from fsm.admin import Admin
 from services.utils import extract_phone_from_vcf, get_main_menu
@@ -22,10 +38,23 @@ logger = logging.getLogger(__name__)
 
 admin_router = Router()
 
+# Фоновые задачи профилирования: ссылка нужна, чтобы задачу не собрал GC до отправки отчёта
+_profile_tasks: set[asyncio.Task] = set()
+# Администраторы, чья рассылка сейчас создаётся: повторное нажатие «Отправить» не создаёт вторую
+_broadcasts_in_progress: set[int] = set()
+
+
+def is_admin(max_id: int, admin_id: str | None) -> bool:
+    return str(max_id) in {str(ADMIN_MAX_ID), str(admin_id)}
+
+
 @admin_router.message_callback(F.callback.payload == 'admin_menu', Main_menu.menu)
 async def admin_menu(event: MessageCallback, context: MemoryContext, session: AsyncSession):
     kb = InlineKeyboardBuilder()
     kb.add(CallbackButton(text='Удалить пользователя', payload='delete_user'))
+    kb.add(CallbackButton(text=f'Профиль бота ({PROFILE_DEFAULT_SECONDS:.0f} с)', payload='profile_bot'))
+    kb.add(CallbackButton(text='Рассылка', payload='broadcast'))
+    kb.adjust(1)
     await context.set_state(Admin.menu)
 
     await event.message.edit(
@@ -36,6 +65,48 @@ async def admin_menu(event: MessageCallback, context: MemoryContext, session: As
     )
 
 
+async def send_profile_report(bot: Bot, user_id: int, seconds: float) -> None:
+    try:
+        result = await PROFILER.profile(seconds, threads='all')
+    except ProfilerBusyError:
+        await bot.send_message(user_id=user_id, text='Профиль уже снимается, дождитесь отчёта.')
+        return
+    except Exception as error:
+        logger.exception(f'Не удалось снять профиль бота: {error}')
+        await bot.send_message(user_id=user_id, text='Не удалось снять профиль, подробности в логе.')
+        return
+
+    with max_priority('background'):
+        await bot.send_message(
+            user_id=user_id,
+            text=f'Профиль за {result.seconds:.0f} с: {result.busy_samples} снимков с работой из {result.samples}.',
+            attachments=[
+                InputMediaBuffer(buffer=result.render().encode(), filename='profile.txt', type=UploadType.FILE),
+                InputMediaBuffer(buffer=result.folded().encode(), filename='profile.folded.txt', type=UploadType.FILE),
+            ]
+        )
+
+
+@admin_router.message_callback(F.callback.payload == 'profile_bot', Admin.menu)
+async def profile_bot(event: MessageCallback, context: MemoryContext, admin_id: str):
+    max_id = event.callback.user.user_id
+    if not is_admin(max_id, admin_id):
+        logger.warning(f'Попытка снять профиль не администратором, max_id: {max_id}')
+        return
+    if PROFILER.running:
+        await event.message.answer(text='Профиль уже снимается, дождитесь отчёта.')
+        return
+
+    await event.message.answer(
+        text=f'Снимаю профиль {PROFILE_DEFAULT_SECONDS:.0f} с, отчёт придёт файлом. Бот продолжает работать.'
+    )
+    # Профиль снимается в фоне: хендлер не держит обработку обновления (и ответ вебхуку) всё это время
+    task = asyncio.create_task(send_profile_report(event.bot, max_id, PROFILE_DEFAULT_SECONDS),
+                               name=f'profile-report-{max_id}')
+    _profile_tasks.add(task)
+    task.add_done_callback(_profile_tasks.discard)
+
+
 @admin_router.message_callback(F.callback.payload == 'delete_user', Admin.menu)
 async def delete_user(event: MessageCallback, context: MemoryContext, session: AsyncSession):
     await context.set_state(Admin.id_reque)
@@ -72,3 +143,159 @@ async def get_user_id(event: MessageCreated, context: MemoryContext, session: As
     await event.message.answer(
         text=f'Пользователь с id {max_user_id} удалён.'
     )
+
+
+def _broadcast_cancel_button() -> CallbackButton:
+    return CallbackButton(text='Отмена', payload='bc_cancel')
+
+
+@admin_router.message_callback(F.callback.payload == 'broadcast', Admin.menu)
+async def broadcast_start(event: MessageCallback, context: MemoryContext, admin_id: str):
+    if not is_admin(event.callback.user.user_id, admin_id):
+        return
+    kb = InlineKeyboardBuilder()
+    kb.add(CallbackButton(text='Всем пользователям', payload=f'bc_seg:{SEGMENT_ALL}'))
+    kb.add(CallbackButton(text='Кто не прошёл урок…', payload='bc_kind:lesson'))
+    kb.add(CallbackButton(text='По типу клиента…', payload='bc_kind:client'))
+    kb.add(_broadcast_cancel_button())
+    kb.adjust(1)
+    await context.set_state(Admin.broadcast_segment)
+
+    await event.message.edit(
+        text='Кому отправить рассылку?',
+        attachments=[kb.as_markup()]
+    )
+
+
+@admin_router.message_callback(F.callback.payload.startswith('bc_kind:'), Admin.broadcast_segment)
+async def broadcast_segment_kind(event: MessageCallback, context: MemoryContext):
+    kb = InlineKeyboardBuilder()
+    if event.callback.payload == 'bc_kind:lesson':
+        text = 'Кто ещё не прошёл урок:'
+        for lesson in lessons:
+            kb.add(CallbackButton(text=lesson['descr'],
+                                  payload=f'bc_seg:{SEGMENT_BEFORE_LESSON}:{lesson["title"]}'))
+    else:
+        text = 'Какой тип клиента:'
+        for key, title in who_are_you['buttons'].items():
+            kb.add(CallbackButton(text=title, payload=f'bc_seg:{SEGMENT_CLIENT_TYPE}:{key}'))
+    kb.add(_broadcast_cancel_button())
+    kb.adjust(1)
+
+    await event.message.edit(
+        text=text,
+        attachments=[kb.as_markup()]
+    )
+
+
+@admin_router.message_callback(F.callback.payload.startswith('bc_seg:'), Admin.broadcast_segment)
+async def broadcast_segment(event: MessageCallback, context: MemoryContext, session: AsyncSession):
+    _, kind, *value = event.callback.payload.split(':', 2)
+    segment = {'kind': kind}
+    if kind == SEGMENT_BEFORE_LESSON:
+        segment['lesson_key'] = value[0]
+    elif kind == SEGMENT_CLIENT_TYPE:
+        segment['client_type'] = value[0]
+
+    recipients = await count_segment(session, segment)
+    await context.update_data(broadcast_segment=segment)
+    await context.set_state(Admin.broadcast_text)
+
+    kb = InlineKeyboardBuilder()
+    kb.add(_broadcast_cancel_button())
+    await event.message.edit(
+        text=f'Получатели: {segment_title(segment)} - {recipients}.\n\nОтправьте текст рассылки одним сообщением.',
+        attachments=[kb.as_markup()]
+    )
+
+
+@admin_router.message_created(Admin.broadcast_text)
+async def broadcast_text(event: MessageCreated, context: MemoryContext, session: AsyncSession):
+    text = ((event.message.body.text if event.message and event.message.body else "") or "").strip()
+    if not text:
+        await event.message.answer(text='Нужен текст рассылки, отправьте его одним сообщением.')
+        return
+
+    context_data = await context.get_data()
+    segment = context_data.get('broadcast_segment') or {'kind': SEGMENT_ALL}
+    recipients = await count_segment(session, segment)
+    context_data['broadcast_text'] = text
+    await context.set_data(context_data)
+    await context.set_state(Admin.broadcast_confirm)
+
+    kb = InlineKeyboardBuilder()
+    kb.add(CallbackButton(text=f'Отправить ({recipients})', payload='bc_send'))
+    kb.add(_broadcast_cancel_button())
+    await event.message.answer(
+        text=f'Рассылка: {segment_title(segment)} - {recipients} получателей.\n\n{text}',
+        attachments=[kb.as_markup()]
+    )
+
+
+@admin_router.message_callback(F.callback.payload == 'bc_send', Admin.broadcast_confirm)
+async def broadcast_send(event: MessageCallback, context: MemoryContext, session: AsyncSession, admin_id: str):
+    max_id = event.callback.user.user_id
+    if not is_admin(max_id, admin_id):
+        logger.warning(f'Попытка запустить рассылку не администратором, max_id: {max_id}')
+        return
+
+    if max_id in _broadcasts_in_progress:
+        return
+    _broadcasts_in_progress.add(max_id)
+    try:
+        context_data = await context.get_data()
+        segment = context_data.pop('broadcast_segment', None)
+        text = context_data.pop('broadcast_text', None)
+        await context.set_data(context_data)
+        await context.set_state(Admin.menu)
+        if not segment or not text:
+            await event.message.edit(text='Рассылка не собрана, начните заново из меню администратора.', attachments=[])
+            return
+
+        broadcast = await create_broadcast(session, text=text, segment=segment, created_by=max_id)
+    finally:
+        _broadcasts_in_progress.discard(max_id)
+    logger.info(f'Рассылка #{broadcast.id} запущена администратором {max_id}: {segment}, {broadcast.total} получателей')
+    start_broadcast(event.bot, broadcast.id)
+
+    kb = InlineKeyboardBuilder()
+    kb.add(CallbackButton(text='Остановить рассылку', payload=f'bc_stop:{broadcast.id}'))
+    await event.message.edit(
+        text=f'Рассылка #{broadcast.id} запущена: {broadcast.total} получателей. Отчёт придёт по завершении.',
+        attachments=[kb.as_markup()]
+    )
+
+
+@admin_router.message_callback(F.callback.payload.startswith('bc_stop:'))
+async def broadcast_stop(event: MessageCallback, admin_id: str):
+    max_id = event.callback.user.user_id
+    if not is_admin(max_id, admin_id):
+        logger.warning(f'Попытка остановить рассылку не администратором, max_id: {max_id}')
+        return
+
+    broadcast_id = int(event.callback.payload.split(':', 1)[1])
+    totals = await cancel_broadcast(broadcast_id)
+    if totals is None:
+        await event.message.edit(text=f'Рассылка #{broadcast_id} уже завершена.', attachments=[])
+        return
+    logger.info(f'Рассылка #{broadcast_id} остановлена администратором {max_id}')
+    await event.message.edit(
+        text=f'Рассылка #{broadcast_id} остановлена. Доставлено: {totals.get("sent", 0)}, '
+             f'ошибок: {totals.get("failed", 0)}, не отправлено: {totals.get("pending", 0)}.',
+        attachments=[]
+    )
+
+
+@admin_router.message_callback(F.callback.payload == 'bc_cancel', Admin.broadcast_segment, Admin.broadcast_text,
+                               Admin.broadcast_confirm)
+async def broadcast_cancel(event: MessageCallback, context: MemoryContext):
+    context_data = await context.get_data()
+    context_data.pop('broadcast_segment', None)
+    context_data.pop('broadcast_text', None)
+    await context.set_data(context_data)
+    await context.set_state(Admin.menu)
+
+    await event.message.edit(
+        text='Рассылка отменена.',
+        attachments=[]
+    )
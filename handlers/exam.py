@@ -12,13 +12,15 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 from amo_api.amo_api import AmoCRMWrapper
+from amo_api.batcher import AmoWriteBatcher
 from db.models import User, HpLessonResult as LessonResult
 
 from service.questions_lexicon import welcome_message, exam_lesson, exam_questions, edu_compleat_text, \
     urls_to_messanger, edu_not_compleat, exam_in_message
 from fsm.exam import Exam
 from fsm.main_states import Main_menu
-from service.service import check_push_to_new_status, lesson_access
+from service.amo_outbox import report_lesson_result
+from service.service import lesson_access
 from services.utils import build_question_inline_keyboard, proceed_radio_button, build_question_multiply_keyboard, \
     proceed_multiply_button, get_question_text, proceed_result, main_menu_button, build_exam_keyboard, proceed_exam, \
     result_exam, get_main_menu, result_exam_for_note
@@ -30,9 +32,7 @@ exam_router = Router()
 
 @exam_router.message_callback(F.callback.payload == 'exam')
 async def vebinar_1(event: MessageCallback, context: MemoryContext, video_tokens: dict[str, str], session: AsyncSession,
-                    amo_api: AmoCRMWrapper, amo_fields: dict):
-    pipelines = amo_fields.get('pipelines')
-    status_fields = amo_fields.get('statuses')
+                    amo_api: AmoCRMWrapper, amo_batcher: AmoWriteBatcher, amo_fields: dict):
     max_id = event.callback.user.user_id
     result = await session.execute(select(User).where(User.max_user_id == max_id))
     user = result.scalar_one_or_none()
@@ -67,19 +67,13 @@ async def vebinar_1(event: MessageCallback, context: MemoryContext, video_tokens
         results['lesson_id'] = lesson.id
         await context.set_data(context_data)
 
-        status_id_in_amo = amo_api.get_lead_by_id(lead_id=user.amo_deal_id).get('status_id')
-        push_to_new_status = await check_push_to_new_status(lesson_key='ready_to_exam',
-                                                            lead_status=status_id_in_amo)
-        if push_to_new_status:
-            try:
-                amo_api.push_lead_to_status(
-                    pipeline_id=pipelines.get("hite_pro_education"),
-                    status_id=status_fields.get("ready_to_exam"),
-                    lead_id=str(user.amo_deal_id),
-                )
-            except Exception as error:
-                logger.error(f'Не получилось перевести сделку в этап "Приступил к экзамену"')
-                logger.exception(error)
+        try:
+            # Если amoCRM недоступен, перевод в этап "Приступил к экзамену" уйдёт в очередь синхронизации
+            await report_lesson_result(session=session, amo_api=amo_api, amo_batcher=amo_batcher,
+                                       amo_fields=amo_fields, user=user, lesson_key='ready_to_exam')
+        except Exception as error:
+            logger.error(f'Не получилось перевести сделку в этап "Приступил к экзамену"')
+            logger.exception(error)
 
         await context.set_state(Exam.vebinar)
         if event.message is None:
@@ -292,13 +286,11 @@ async def question_4_proceed(event: MessageCallback, context: MemoryContext, ima
 
 @exam_router.message_callback(F.callback.payload == 'next', Exam.question_4)
 async def exam_result(event: MessageCallback, context: MemoryContext, image_tokens: dict[str, str], session: AsyncSession,
-                      amo_api: AmoCRMWrapper, amo_fields: dict):
+                      amo_api: AmoCRMWrapper, amo_batcher: AmoWriteBatcher, amo_fields: dict):
     await context.set_state(Exam.compleate)
     exam_results = await context.get_data()
     lesson_id = (exam_results.get('results') or {}).get('lesson_id')
     logger.info(f'Обработка результатов экзамена - id = {lesson_id}')
-    pipelines = amo_fields.get('pipelines')
-    status_fields = amo_fields.get('statuses')
     exam_results = exam_results.get('results') or {}
     result_check = result_exam(results=exam_results,
                                trouth_results=exam_lesson
@@ -327,19 +319,11 @@ async def exam_result(event: MessageCallback, context: MemoryContext, image_toke
         await session.refresh(user)
 
         note_result = result_check.get('title')
-        # Отправляем примечание в сделку с обучением
-        amo_api.add_new_note_to_lead(lead_id=user.amo_deal_id, text=result_for_note)
-
-        user_lead_id = user.amo_deal_id
-        status_id_in_amo = amo_api.get_lead_by_id(lead_id=user_lead_id).get('status_id')
-        push_to_new_status = await check_push_to_new_status(lesson_key='compleat_exam',
-                                                            lead_status=status_id_in_amo)
-
-        # Перемещаем сделку далее по воронке обучения, если успешно. В сделку записываем примечание с результатами
-        if result_check.get('results') and push_to_new_status:
-            amo_api.push_lead_to_status(pipeline_id=pipelines.get('hite_pro_education'),
-                                        status_id=status_fields.get('compleat_exam'),
-                                        lead_id=str(user.amo_deal_id))
+        # Отправляем примечание в сделку с обучением и перемещаем её далее по воронке, если экзамен сдан.
+        # Если amoCRM недоступен, результат уйдёт в очередь синхронизации
+        await report_lesson_result(session=session, amo_api=amo_api, amo_batcher=amo_batcher,
+                                   amo_fields=amo_fields, user=user, lesson_key='compleat_exam',
+                                   note=result_for_note, push=bool(result_check.get('results')))
     await event.message.edit(text=result_check.get('title'),
                              attachments=[])
     kb = InlineKeyboardBuilder()
@@ -13,11 +13,12 @@ from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 
 from amo_api.amo_api import AmoCRMWrapper
+from amo_api.batcher import AmoWriteBatcher
 from db.models import User, HpLessonResult as LessonResult
 from service.questions_lexicon import welcome_message
 from fsm.lesson_1 import Lesson_1
 from fsm.main_states import Main_menu
-from service.service import check_push_to_new_status
+from service.amo_outbox import report_lesson_result
 from services.utils import build_question_inline_keyboard, proceed_radio_button, build_question_multiply_keyboard, \
     proceed_multiply_button, get_question_text, proceed_result, main_menu_button
 from service.questions_lexicon import questions_1 as lesson
@@ -385,13 +386,11 @@ async def proceed_question_10(event: MessageCallback, context: MemoryContext):
 
 @lesson_1.message_callback(F.callback.payload == 'next', Lesson_1.question_10)
 async def result(event: MessageCallback, context: MemoryContext, session: AsyncSession,
-                 amo_api: AmoCRMWrapper, amo_fields: dict):
+                 amo_api: AmoCRMWrapper, amo_batcher: AmoWriteBatcher, amo_fields: dict):
     max_id = event.callback.user.user_id
     result = await context.get_data()
     lesson_id = (result.get('results') or {}).get('lesson_id')
     logger.info(f'Обработка результатов первого урока - id = {lesson_id}')
-    pipelines = amo_fields.get('pipelines')
-    status_fields = amo_fields.get('statuses')
     checking_result = proceed_result(questions=lesson, results=result)
     score = checking_result.get('score', 0)
     title = checking_result.get('title', '')
@@ -416,19 +415,11 @@ async def result(event: MessageCallback, context: MemoryContext, session: AsyncS
             await session.refresh(lesson_obj)
             await session.refresh(user)
 
-            # Отправляем примечание в сделку с обучением
-            amo_api.add_new_note_to_lead(lead_id=user.amo_deal_id, text=f'Результаты урока №1: {title}')
-
-            user_lead_id = user.amo_deal_id
-            status_id_in_amo = amo_api.get_lead_by_id(lead_id=user_lead_id).get('status_id')
-            push_to_new_status = await check_push_to_new_status(lesson_key='compleat_lesson_1',
-                                                                lead_status=status_id_in_amo)
-
-            # Перемещаем сделку далее по воронке обучения, если успешно. В сделку записываем примечание с результатами
-            if compleat_lesson and push_to_new_status:
-                amo_api.push_lead_to_status(pipeline_id=pipelines.get('hite_pro_education'),
-                                            status_id=status_fields.get('compleat_lesson_1'),
-                                            lead_id=str(user.amo_deal_id))
+            # Отправляем примечание в сделку с обучением и перемещаем её далее по воронке.
+            # Если amoCRM недоступен, результат уйдёт в очередь синхронизации
+            await report_lesson_result(session=session, amo_api=amo_api, amo_batcher=amo_batcher,
+                                       amo_fields=amo_fields, user=user, lesson_key='compleat_lesson_1',
+                                       note=f'Результаты урока №1: {title}', push=compleat_lesson)
     kb: InlineKeyboardBuilder = main_menu_button()
     await context.clear()
     await context.set_state(Main_menu.menu)
@@ -2,11 +2,14 @@ import asyncio
 import logging
 
 from maxapi import Bot, Dispatcher
+from maxapi.client.default import DEFAULT_RETRY_STATUSES, DefaultConnectionProperties
 from maxapi.enums import parse_mode
 
 from amo_api.amo_api import AmoCRMWrapper
+from amo_api.batcher import AmoWriteBatcher
+from amo_api.circuit_breaker import CircuitBreaker
 from config.config import BASE_DIR, Config, load_config
-from db import init_db, shutdown_db
+from db import engine, init_db, shutdown_db
 from handlers.admin_menu import admin_router
 from handlers.error_handler import error_handler
 from handlers.exam import exam_router
@@ -21,11 +24,34 @@ from handlers.main_handlers import main_router
 from middleware.amo_api import AmoApiMiddleware
 from middleware.dp import DbSessionMiddleware
 from middleware.image_tokens import ImageTokensMiddleware
+from middleware.tracing import TracingMiddleware
 from middleware.video_tokens import VideoTokensMiddleware
+from service.amo_outbox import start_amo_outbox_replayer, stop_amo_outbox_replayer
+from service.amo_reconciliation import start_amo_reconciliation_scheduler, stop_amo_reconciliation_scheduler
+from service.metrics import (
+    LoopMonitor,
+    create_max_trace_config,
+    install_handler_metrics,
+    install_sqlalchemy_timing,
+    start_loop_monitor,
+    stop_loop_monitor,
+)
+from service.fsm_contexts import (
+    FsmSpillStore,
+    SpillableMemoryContext,
+    start_fsm_context_evictor,
+    stop_fsm_context_evictor,
+)
+from service.broadcasts import resume_broadcasts, stop_broadcasts
 from service.background_notifications import (
     start_inactivity_scheduler,
     stop_inactivity_scheduler,
 )
+from service.tracing import configure_tracing
+from service.max_limiter import MaxRateLimiter, create_max_limiter_trace_config
+from service.warmup import warmup_connections
+from service.webhook import BotWebhook
+from services.http_client import close_http_session
 from services.video_tokens_env import ensure_image_tokens_in_env, ensure_video_tokens_in_env
 
 logger = logging.getLogger(__name__)
@@ -36,7 +62,25 @@ logging.basicConfig(
 
 config: Config = load_config()
 
-bot = Bot(token=config.max_bot.token, parse_mode=parse_mode.ParseMode.HTML)
+# Все запросы к MAX API (ответы пользователям, напоминания, рассылки) проходят через общий лимитер с полосами
+max_limiter = MaxRateLimiter(rate=config.max_bot.rate_limit)
+bot = Bot(
+    token=config.max_bot.token,
+    parse_mode=parse_mode.ParseMode.HTML,
+    default_connection=DefaultConnectionProperties(
+        # 429 повторяет maxapi, а лимитер на это время ставит на паузу всю отправку
+        retry_on_statuses=(429, *DEFAULT_RETRY_STATUSES),
+        trace_configs=[
+            create_max_limiter_trace_config(max_limiter, config.max_bot.api_url or Bot.API_URL),
+            # Время каждого запроса к MAX API (send_message, edit и т.д.) попадает в outbound-метрики
+            create_max_trace_config(),
+        ],
+    ),
+)
+if config.max_bot.api_url:
+    bot.set_api_url(config.max_bot.api_url)
+install_sqlalchemy_timing(engine)
+trace_file_exporter = configure_tracing(enabled=config.tracing.enabled, file_path=config.tracing.file_path)
 amo_api = AmoCRMWrapper(
     path=config.amo_config.path_to_env,
     amocrm_subdomain=config.amo_config.amocrm_subdomain,
@@ -46,9 +90,18 @@ amo_api = AmoCRMWrapper(
     amocrm_secret_code=config.amo_config.amocrm_secret_code,
     amocrm_access_token=config.amo_config.amocrm_access_token,
     amocrm_refresh_token=config.amo_config.amocrm_refresh_token,
+    request_timeout=config.amo_config.request_timeout,
+    breaker=CircuitBreaker(
+        failure_threshold=config.amo_config.breaker_failures,
+        reset_timeout=config.amo_config.breaker_reset_timeout,
+    ),
+    base_url=config.amo_config.base_url,
 )
+amo_batcher = AmoWriteBatcher(amo_api, window=config.amo_config.batch_window)
 
-dp = Dispatcher()
+# Контексты FSM живут в памяти, но после простоя выгружаются (непустые - в БД) фоновой задачей
+fsm_spill_store = FsmSpillStore(enabled=config.fsm.spill)
+dp = Dispatcher(storage=SpillableMemoryContext, spill_store=fsm_spill_store)
 dp.include_routers(
     main_router,
     lesson_1,
@@ -64,12 +117,21 @@ dp.include_routers(
 )
 
 inactivity_scheduler_task: asyncio.Task | None = None
+amo_outbox_task: asyncio.Task | None = None
+amo_reconciliation_task: asyncio.Task | None = None
+fsm_evictor_task: asyncio.Task | None = None
+loop_monitor: LoopMonitor | None = None
 
 
 async def run() -> None:
-    global inactivity_scheduler_task
+    global inactivity_scheduler_task, amo_outbox_task, amo_reconciliation_task, fsm_evictor_task, loop_monitor
 
     logger.info("Starting hitepro_edu_bot for MAX")
+    loop_monitor = start_loop_monitor(
+        interval=config.metrics.loop_lag_interval,
+        block_threshold=config.metrics.loop_block_threshold,
+        watchdog=config.metrics.loop_watchdog,
+    )
 
     try:
         await init_db()
@@ -94,6 +156,7 @@ async def run() -> None:
     dp.middleware(
         AmoApiMiddleware(
             amo_api,
+            amo_batcher=amo_batcher,
             amo_fields=config.amo_fields,
             admin_id=config.admin,
             webhook_url=config.webhook_url,
@@ -101,22 +164,74 @@ async def run() -> None:
         )
     )
     dp.middleware(DbSessionMiddleware())
+    if config.tracing.enabled:
+        dp.outer_middleware(TracingMiddleware())
+    # Цепочки middleware хендлеров собираются в dp.startup, поэтому метрики вешаем до запуска вебхука
+    handlers_count = install_handler_metrics(dp)
+    logger.info("Handler metrics installed for %d handlers", handlers_count)
 
     inactivity_scheduler_task = start_inactivity_scheduler(bot)
+    amo_outbox_task = start_amo_outbox_replayer(amo_api, amo_batcher, config.amo_fields)
+    amo_reconciliation_task = start_amo_reconciliation_scheduler(amo_api, amo_batcher, config.amo_fields)
+    fsm_evictor_task = start_fsm_context_evictor(
+        dp,
+        fsm_spill_store,
+        ttl=config.fsm.ttl,
+        interval=config.fsm.sweep_interval,
+        max_contexts=config.fsm.max_contexts,
+    )
 
     try:
-
-        webhook_url = 'https://bots-webhook.hite-pro.ru/max/education_bot/'
-        await bot.subscribe_webhook(url=webhook_url)
-        await dp.handle_webhook(
+        # Прогреваем пулы соединений до подписки на вебхук, чтобы первые апдейты не ждали рукопожатий
+        await warmup_connections(
+            amo_api=amo_api,
+            webhook_url=config.webhook_url,
+            db_connections=config.warmup.db_connections,
+            http_connections=config.warmup.http_connections,
+        )
+        logger.info("Bot is ready to accept updates")
+        try:
+            # Рассылки, прерванные прошлой остановкой, продолжаются с неотправленных получателей
+            resumed = await resume_broadcasts(bot)
+            if resumed:
+                logger.info("Resumed %d broadcasts", resumed)
+        except Exception as exc:
+            logger.exception("Broadcast resume failed: %s", exc)
+
+        await bot.subscribe_webhook(url=config.max_bot.webhook_url, secret=config.max_bot.webhook_secret)
+        webhook = BotWebhook(
+            dp=dp,
             bot=bot,
+            secret=config.max_bot.webhook_secret,
+            amo_path=config.amo_config.webhook_path,
+            amo_secret=config.amo_config.webhook_secret,
+            metrics_path=config.metrics.path,
+            metrics_token=config.metrics.token,
+            ingress_workers=config.ingress.workers,
+            ingress_queue_size=config.ingress.queue_size,
+            ingress_shed_at=config.ingress.shed_at,
+        )
+        await webhook.run(
             host='127.0.0.1',
             port=8102,
         )
     finally:
         await stop_inactivity_scheduler(inactivity_scheduler_task)
         inactivity_scheduler_task = None
+        await stop_amo_outbox_replayer(amo_outbox_task)
+        amo_outbox_task = None
+        await stop_amo_reconciliation_scheduler(amo_reconciliation_task)
+        amo_reconciliation_task = None
+        await stop_fsm_context_evictor(fsm_evictor_task)
+        fsm_evictor_task = None
+        await stop_broadcasts()
+        await amo_batcher.close()
+        await close_http_session()
         await shutdown_db()
+        await stop_loop_monitor(loop_monitor)
+        loop_monitor = None
+        if trace_file_exporter is not None:
+            await asyncio.to_thread(trace_file_exporter.shutdown)
 
 
 if __name__ == "__main__":
@@ -3,11 +3,13 @@ from typing import Any, Awaitable, Callable, Dict, Mapping
 from maxapi.filters.middleware import BaseMiddleware
 
 from amo_api.amo_api import AmoCRMWrapper
+from amo_api.batcher import AmoWriteBatcher
 
 class AmoApiMiddleware(BaseMiddleware):
-    def __init__(self, amo_api: AmoCRMWrapper, amo_fields: dict, admin_id: str,
+    def __init__(self, amo_api: AmoCRMWrapper, amo_batcher: AmoWriteBatcher, amo_fields: dict, admin_id: str,
                  webhook_url: str, utm_token: str) -> None:
         self._amo_api = amo_api
+        self._amo_batcher = amo_batcher
         self._amo_fields = amo_fields
         self.admin_id = admin_id
         self.webhook_url = webhook_url
@@ -20,6 +22,7 @@ class AmoApiMiddleware(BaseMiddleware):
         data: dict[str, Any],
     ) -> Any:
         data["amo_api"] = self._amo_api
+        data["amo_batcher"] = self._amo_batcher
         data["amo_fields"] = self._amo_fields
         data["admin_id"] = self.admin_id
         data["webhook_url"] = self.webhook_url
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from maxapi.filters.middleware import BaseMiddleware
+
+from service.metrics.bot import HANDLER_ERRORS, HANDLER_IN_FLIGHT, HANDLER_LATENCY
+from service.tracing import get_tracer
+
+tracer = get_tracer(__name__)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Замеряет время, ошибки и число одновременных вызовов одного хендлера.
+    Навешивается на каждый хендлер через service.metrics.install_handler_metrics."""
+
+    def __init__(self, router: str, handler: str) -> None:
+        self.router = router
+        self.handler = handler
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event_object: Any,
+        data: dict[str, Any],
+    ) -> Any:
+        HANDLER_IN_FLIGHT.inc(router=self.router, handler=self.handler)
+        started = time.perf_counter()
+        try:
+            with tracer.start_as_current_span(f'handler {self.router}.{self.handler}',
+                                              {'router': self.router, 'handler': self.handler}):
+                return await handler(event_object, data)
+        except Exception as error:
+            HANDLER_ERRORS.inc(router=self.router, handler=self.handler, error=type(error).__name__)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, router=self.router, handler=self.handler)
+            HANDLER_IN_FLIGHT.dec(router=self.router, handler=self.handler)
@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Dict
+
+from maxapi.filters.middleware import BaseMiddleware
+
+from service.tracing import get_tracer
+
+tracer = get_tracer(__name__)
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Спан на всю цепочку middleware и поиск роутера; вешается через dp.outer_middleware, чтобы быть первым.
+    Время между началом этого спана и спаном хендлера - это middleware и фильтры роутеров."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event_object: Any,
+        data: dict[str, Any],
+    ) -> Any:
+        with tracer.start_as_current_span('dispatch', {'update': data.get('_process_info', '')}) as span:
+            result = await handler(event_object, data)
+            if span is not None:
+                span.set_attribute('router_id', str(data.get('_router_id')))
+                span.set_attribute('handled', bool(data.get('_is_handled')))
+            return result
@@ -0,0 +1,16 @@
+from service.amo_outbox.repository import enqueue_amo_task, has_pending_authorize
+from service.amo_outbox.runner import replay_amo_outbox_once
+from service.amo_outbox.scheduler import (
+    start_amo_outbox_replayer,
+    stop_amo_outbox_replayer,
+)
+from service.amo_outbox.tasks import report_lesson_result
+
+__all__ = [
+    "enqueue_amo_task",
+    "has_pending_authorize",
+    "replay_amo_outbox_once",
+    "report_lesson_result",
+    "start_amo_outbox_replayer",
+    "stop_amo_outbox_replayer",
+]
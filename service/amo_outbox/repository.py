@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import AmoOutbox
+
+
+async def enqueue_amo_task(
+    session: AsyncSession,
+    kind: str,
+    user_id: int,
+    payload: dict | None = None,
+) -> None:
+    session.add(AmoOutbox(kind=kind, user_id=user_id, payload=payload or {}))
+    await session.commit()
+
+
+async def has_pending_authorize(session: AsyncSession, user_id: int) -> bool:
+    result = await session.execute(
+        select(AmoOutbox.id)
+        .where(
+            AmoOutbox.user_id == user_id,
+            AmoOutbox.kind == "authorize",
+            AmoOutbox.done_at.is_(None),
+        )
+        .limit(1)
+    )
+    return result.scalar_one_or_none() is not None
+
+
+async def get_pending_tasks(session: AsyncSession, limit: int) -> list[AmoOutbox]:
+    result = await session.execute(
+        select(AmoOutbox)
+        .where(AmoOutbox.done_at.is_(None))
+        .order_by(AmoOutbox.id)
+        .limit(limit)
+    )
+    return result.scalars().all()
+
+
+async def update_task_payload(session: AsyncSession, task_id: int, payload: dict) -> None:
+    """Сохраняет payload задачи, из которого убрано уже доставленное в amoCRM."""
+    await session.execute(update(AmoOutbox).where(AmoOutbox.id == task_id).values(payload=payload))
+    await session.commit()
+
+
+def mark_done(task: AmoOutbox) -> None:
+    task.done_at = datetime.utcnow()
+    task.last_error = None
+
+
+def mark_failed(task: AmoOutbox, error: str, max_attempts: int) -> None:
+    task.attempts += 1
+    task.last_error = error
+    # После max_attempts неудач задачу больше не повторяем, last_error остаётся для разбора
+    if task.attempts >= max_attempts:
+        task.done_at = datetime.utcnow()
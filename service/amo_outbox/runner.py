@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import logging
+
+from sqlalchemy import select
+from sqlalchemy.orm.exc import StaleDataError
+
+from amo_api.amo_api import AmoCRMWrapper
+from amo_api.amo_service import authorize_in_amo
+from amo_api.batcher import AmoWriteBatcher
+from amo_api.circuit_breaker import AmoUnavailableError
+from db import async_session_factory
+from db.models import AmoOutbox, User
+from service.amo_outbox.repository import get_pending_tasks, mark_done, mark_failed, update_task_payload
+from service.amo_outbox.tasks import apply_lesson_result
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 10
+
+
+def _build_stats() -> dict[str, int]:
+    return {
+        "processed": 0,
+        "done": 0,
+        "postponed": 0,
+        "errors": 0,
+    }
+
+
+def _utm_from_user(user: User) -> dict[str, str]:
+    return {
+        "utm_campaign": user.utm_campaign or '',
+        "utm_medium": user.utm_medium or '',
+        "utm_content": user.utm_content or '',
+        "utm_term": user.utm_term or '',
+        "utm_source": user.utm_source or '',
+        "yclid": user.yclid or '',
+    }
+
+
+async def _replay_task(session, task: AmoOutbox, payload: dict, user: User, amo_api: AmoCRMWrapper,
+                       amo_batcher: AmoWriteBatcher, amo_fields: dict) -> bool:
+    """Возвращает False, если задачу пока нельзя выполнить и её надо оставить в очереди.
+    Доставленную часть задача убирает из payload (копии task.payload)."""
+    if task.kind == 'authorize':
+        await authorize_in_amo(
+            session=session,
+            amo_api=amo_api,
+            amo_batcher=amo_batcher,
+            amo_fields=amo_fields,
+            max_id=user.max_user_id,
+            phone=user.phone_number,
+            client_type=user.client_type,
+            utm_data=_utm_from_user(user),
+        )
+        return True
+
+    if task.kind == 'lesson_result':
+        if user.amo_deal_id is None:
+            # Сделки ещё нет - ждём, пока отработает отложенная авторизация
+            return False
+        await apply_lesson_result(
+            session=session,
+            amo_api=amo_api,
+            amo_batcher=amo_batcher,
+            amo_fields=amo_fields,
+            user=user,
+            payload=payload,
+        )
+        return True
+
+    raise ValueError(f'Неизвестный тип задачи {task.kind}')
+
+
+async def replay_amo_outbox_once(amo_api: AmoCRMWrapper, amo_batcher: AmoWriteBatcher,
+                                 amo_fields: dict) -> dict[str, int]:
+    stats = _build_stats()
+
+    async with async_session_factory() as session:
+        tasks = await get_pending_tasks(session, limit=OUTBOX_BATCH_SIZE)
+
+        for task in tasks:
+            stats["processed"] += 1
+            user = (await session.execute(select(User).where(User.id == task.user_id))).scalar_one_or_none()
+            if user is None:
+                mark_failed(task, 'Пользователь удалён', max_attempts=1)
+                await session.commit()
+                stats["errors"] += 1
+                continue
+
+            task_id, task_kind = task.id, task.kind  # После rollback атрибуты task будут сброшены
+            original_payload = dict(task.payload or {})
+            payload = dict(original_payload)
+            try:
+                replayed = await _replay_task(session, task, payload, user, amo_api, amo_batcher, amo_fields)
+            except AmoUnavailableError as error:
+                # amoCRM снова лёг: остальные задачи не трогаем до следующего запуска
+                await session.rollback()
+                if payload != original_payload:
+                    # Примечание уже в сделке: при следующем запуске повторяем только смену этапа
+                    await update_task_payload(session, task_id, payload)
+                logger.warning("amoCRM outbox replay interrupted: %s", error)
+                stats["postponed"] += 1
+                break
+            except Exception as error:
+                logger.exception("Failed to replay amoCRM outbox task id=%s kind=%s", task_id, task_kind)
+                await session.rollback()
+                await session.refresh(task)
+                task.payload = payload
+                mark_failed(task, repr(error), max_attempts=OUTBOX_MAX_ATTEMPTS)
+                await session.commit()
+                stats["errors"] += 1
+                continue
+
+            if replayed:
+                mark_done(task)
+            try:
+                await session.commit()
+            except StaleDataError:
+                # Строку задачи удалили, пока она выполнялась (например, вместе с пользователем):
+                # работа сделана, отмечать нечего, остальные задачи пакета обрабатываем дальше
+                await session.rollback()
+                logger.warning("amoCRM outbox task id=%s disappeared while being replayed", task_id)
+            stats["done" if replayed else "postponed"] += 1
+
+    if stats["processed"]:
+        logger.info(
+            "amoCRM outbox replay finished. processed=%s done=%s postponed=%s errors=%s",
+            stats["processed"],
+            stats["done"],
+            stats["postponed"],
+            stats["errors"],
+        )
+    return stats
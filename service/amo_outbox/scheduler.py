@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from amo_api.amo_api import AmoCRMWrapper
+from amo_api.batcher import AmoWriteBatcher
+from service.amo_outbox.runner import replay_amo_outbox_once
+
+logger = logging.getLogger(__name__)
+
+REPLAY_INTERVAL = 60  # Как часто (в секундах) пытаемся отправить отложенные записи
+
+
+async def _replay_loop(amo_api: AmoCRMWrapper, amo_batcher: AmoWriteBatcher, amo_fields: dict) -> None:
+    logger.info("amoCRM outbox replayer started. interval=%ss", REPLAY_INTERVAL)
+    try:
+        while True:
+            await asyncio.sleep(REPLAY_INTERVAL)
+            if amo_api.breaker.is_open:
+                continue
+
+            try:
+                await replay_amo_outbox_once(amo_api, amo_batcher, amo_fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Unhandled error in amoCRM outbox replay")
+    except asyncio.CancelledError:
+        logger.info("amoCRM outbox replayer stopped")
+        raise
+
+
+def start_amo_outbox_replayer(amo_api: AmoCRMWrapper, amo_batcher: AmoWriteBatcher,
+                              amo_fields: dict) -> asyncio.Task:
+    return asyncio.create_task(
+        _replay_loop(amo_api, amo_batcher, amo_fields),
+        name="amo-outbox-replayer",
+    )
+
+
+async def stop_amo_outbox_replayer(task: asyncio.Task | None) -> None:
+    if task is None:
+        return
+
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
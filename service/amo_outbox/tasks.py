@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from amo_api.amo_api import AmoCRMWrapper
+from amo_api.batcher import AmoWriteBatcher
+from amo_api.circuit_breaker import AmoUnavailableError
+from amo_api.lead_status import get_lead_status, push_lead_status
+from db.models import User
+from service.amo_outbox.repository import enqueue_amo_task
+from service.service import check_push_to_new_status
+
+logger = logging.getLogger(__name__)
+
+
+async def apply_lesson_result(
+    session: AsyncSession,
+    amo_api: AmoCRMWrapper,
+    amo_batcher: AmoWriteBatcher,
+    amo_fields: dict,
+    user: User,
+    payload: dict,
+) -> None:
+    """Записывает примечание в сделку обучения и двигает её в этап lesson_key, если она ещё не дальше.
+    payload - {'lesson_key', 'note', 'push'}, как в задаче amo_outbox. Записанное примечание убирается из payload:
+    если потом не удастся сменить этап, в очередь вернётся только смена этапа, без повтора примечания.
+    Бросает AmoUnavailableError, если amoCRM не отвечает."""
+    lesson_key = payload.get('lesson_key')
+    if payload.get('note'):
+        await amo_batcher.add_note(lead_id=user.amo_deal_id, text=payload['note'])
+        payload['note'] = None
+    if not payload.get('push', True):
+        return
+
+    status_id_in_amo = await get_lead_status(session, amo_api, lead_id=user.amo_deal_id)
+    if status_id_in_amo is None:
+        # Без текущего этапа нельзя понять, не откатим ли сделку назад: этап не трогаем, примечание уже записано
+        logger.warning(f'Этап сделки {user.amo_deal_id} неизвестен, перевод в {lesson_key} пропущен')
+        return
+    push_to_new_status = await check_push_to_new_status(lesson_key=lesson_key, lead_status=status_id_in_amo)
+    if push_to_new_status:
+        await push_lead_status(session=session, amo_batcher=amo_batcher,
+                               pipeline_id=amo_fields.get('pipelines').get('hite_pro_education'),
+                               status_id=amo_fields.get('statuses').get(lesson_key),
+                               lead_id=str(user.amo_deal_id))
+
+
+async def report_lesson_result(
+    session: AsyncSession,
+    amo_api: AmoCRMWrapper,
+    amo_batcher: AmoWriteBatcher,
+    amo_fields: dict,
+    user: User,
+    lesson_key: str,
+    note: str | None = None,
+    push: bool = True,
+) -> None:
+    """То же, что apply_lesson_result, но без ошибок для пользователя: если amoCRM недоступен или сделка
+    ещё не создана, результат откладывается в очередь и будет отправлен позже."""
+    payload = {'lesson_key': lesson_key, 'note': note, 'push': push}
+    user_id = user.id  # После rollback атрибуты user будут сброшены
+    if user.amo_deal_id is None or amo_api.breaker.is_open:
+        await enqueue_amo_task(session, 'lesson_result', user_id=user_id, payload=payload)
+        logger.info(f'amoCRM недоступен, результат {lesson_key} пользователя {user_id} отложен в очередь')
+        return
+
+    try:
+        await apply_lesson_result(session, amo_api, amo_batcher, amo_fields, user, payload)
+    except AmoUnavailableError as error:
+        logger.warning(f'Не удалось отправить результат {lesson_key} пользователя {user_id} в amoCRM: {error}')
+        await session.rollback()
+        await enqueue_amo_task(session, 'lesson_result', user_id=user_id, payload=payload)
+        await session.refresh(user)
@@ -0,0 +1,11 @@
+from service.amo_reconciliation.runner import run_amo_reconciliation_once
+from service.amo_reconciliation.scheduler import (
+    start_amo_reconciliation_scheduler,
+    stop_amo_reconciliation_scheduler,
+)
+
+__all__ = [
+    "run_amo_reconciliation_once",
+    "start_amo_reconciliation_scheduler",
+    "stop_amo_reconciliation_scheduler",
+]
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import HpLessonResult, User
+
+
+async def get_leads_progress(session: AsyncSession) -> dict[int, dict]:
+    """Одним запросом собирает пройденные уроки всех пользователей, у которых есть сделка.
+    Ключ - id сделки в amoCRM."""
+    result = await session.execute(
+        select(User.id, User.amo_deal_id, HpLessonResult.lesson_key)
+        .outerjoin(
+            HpLessonResult,
+            and_(
+                HpLessonResult.user_id == User.id,
+                HpLessonResult.compleat.is_(True),
+            ),
+        )
+        .where(User.amo_deal_id.is_not(None))
+    )
+
+    progress: dict[int, dict] = {}
+    for user_id, lead_id, lesson_key in result.all():
+        entry = progress.setdefault(int(lead_id), {"user_id": user_id, "completed": set()})
+        if lesson_key is not None:
+            entry["completed"].add(lesson_key)
+    return progress
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+# Системные этапы amoCRM «Успешно реализовано» и «Закрыто и не реализовано»: закрытые сделки сверка не трогает
+AMO_CLOSED_STATUS_IDS = frozenset({142, 143})
+
+# Этап воронки, который соответствует пройденному уроку, в порядке прохождения обучения
+LESSON_STATUS_KEYS: list[tuple[str, str]] = [
+    ("lesson_1", "compleat_lesson_1"),
+    ("lesson_2", "compleat_lesson_2"),
+    ("lesson_3", "compleat_lesson_3"),
+    ("lesson_4", "compleat_lesson_4"),
+    ("lesson_5", "compleat_lesson_5"),
+    ("lesson_6", "compleat_lesson_6"),
+    ("lesson_7", "compleat_lesson_7"),
+    ("exam", "compleat_exam"),
+]
+
+
+def resolve_expected_status_key(completed: set[str]) -> str | None:
+    """Самый дальний этап, до которого сделка должна была дойти по локальным результатам."""
+    expected = None
+    for lesson_key, status_key in LESSON_STATUS_KEYS:
+        if lesson_key in completed:
+            expected = status_key
+    return expected
+
+
+def is_lesson_progression_status(status_id: int, statuses: dict[str, int]) -> bool:
+    """Сделка стоит на одном из этапов обучения: только такие сверка может двигать дальше."""
+    return status_id not in AMO_CLOSED_STATUS_IDS and status_id in statuses.values()
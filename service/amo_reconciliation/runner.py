@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import aclosing
+from datetime import date
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from amo_api.amo_api import AmoCRMWrapper
+from amo_api.batcher import AMO_BATCH_LIMIT, AmoWriteBatcher
+from amo_api.circuit_breaker import AmoUnavailableError, CircuitBreaker
+from amo_api.lead_status import save_lead_status
+from amo_api.models import Lead
+from db import async_session_factory
+from service.amo_reconciliation.repository import get_leads_progress
+from service.amo_reconciliation.rules import is_lesson_progression_status, resolve_expected_status_key
+from service.service import check_push_to_new_status
+
+logger = logging.getLogger(__name__)
+
+PAGE_LIMIT = 250  # Столько сделок запрашиваем одним filter[id][]: максимум страницы amoCRM
+PAGE_PREFETCH = 3  # Сколько следующих страниц запрашиваем заранее, пока обрабатывается текущая
+REQUEST_BUDGET = 200  # Максимум запросов к amoCRM за один прогон сверки
+CORRECTION_PAUSE = 1.0  # Пауза в секундах между пачками исправлений: запас лимита amoCRM остаётся пользователям
+
+
+def _build_stats() -> dict[str, int]:
+    return {
+        "pages": 0,
+        "leads": 0,
+        "matched": 0,
+        "corrected": 0,
+        "missing": 0,
+        "requests": 0,
+        "errors": 0,
+    }
+
+
+def _ensure_breaker_closed(amo_api: AmoCRMWrapper) -> None:
+    # Сверка не ждёт, пока amoCRM придёт в себя: пробные запросы и остаток лимита - для пользователей
+    if amo_api.breaker.state != CircuitBreaker.CLOSED:
+        raise AmoUnavailableError(f"предохранитель amoCRM в состоянии {amo_api.breaker.state}")
+
+
+async def _apply_corrections(session: AsyncSession, amo_api: AmoCRMWrapper, corrections: list, pipeline_id: int, statuses: dict,
+                             stats: dict[str, int]) -> None:
+    """Дожидается пачки исправлений и обновляет зеркало этапов. Если amoCRM стал недоступен, прерывает сверку."""
+    unavailable = None
+    for lead_id, expected_key, note, push in corrections:
+        results = await asyncio.gather(note, push, return_exceptions=True)
+        unavailable = unavailable or next((r for r in results if isinstance(r, AmoUnavailableError)), None)
+        if any(isinstance(result, BaseException) for result in results) or not results[1]:
+            stats["errors"] += 1
+            continue
+        stats["corrected"] += 1
+        await save_lead_status(session, lead_id, statuses.get(expected_key), pipeline_id)
+    await session.commit()
+    stats["requests"] += 2
+    corrections.clear()
+    if unavailable is not None:
+        raise unavailable
+    _ensure_breaker_closed(amo_api)
+
+
+def _select_chunks(lead_ids: list[int], max_pages: int, today: date) -> list[list[int]]:
+    """Делит сделки на запросы по PAGE_LIMIT и выбирает не больше max_pages из них.
+
+    Если все не помещаются в бюджет, каждый день начинаем с нового места: за несколько
+    прогонов по кругу сверяются все сделки, а не только первые.
+    """
+    chunks = [lead_ids[index:index + PAGE_LIMIT] for index in range(0, len(lead_ids), PAGE_LIMIT)]
+    if len(chunks) <= max_pages:
+        return chunks
+    start = today.toordinal() * max_pages % len(chunks)
+    return (chunks[start:] + chunks[:start])[:max_pages]
+
+
+async def _iter_known_leads(amo_api: AmoCRMWrapper, pipeline_id: int,
+                            chunks: list[list[int]]) -> AsyncIterator[list[dict]]:
+    """Запрашивает в воронке только сделки, о которых знает бот, с опережением на PAGE_PREFETCH запросов."""
+    def _fetch(chunk: list[int]) -> asyncio.Task:
+        query = f"filter[pipeline_id][]={pipeline_id}&" + "&".join(f"filter[id][]={lead_id}" for lead_id in chunk)
+        return asyncio.create_task(
+            asyncio.to_thread(amo_api.get_page, "/api/v4/leads", "leads", query, 1, PAGE_LIMIT),
+            name="amo-reconciliation-page",
+        )
+
+    remaining = deque(chunks)
+    pending: deque[asyncio.Task] = deque()
+    try:
+        while remaining and len(pending) <= PAGE_PREFETCH:
+            pending.append(_fetch(remaining.popleft()))
+        while pending:
+            leads, _ = await pending.popleft()
+            if remaining:
+                pending.append(_fetch(remaining.popleft()))
+            yield leads
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def run_amo_reconciliation_once(amo_api: AmoCRMWrapper, amo_batcher: AmoWriteBatcher, amo_fields: dict,
+                                      request_budget: int = REQUEST_BUDGET) -> dict[str, int]:
+    stats = _build_stats()
+    pipeline_id = amo_fields.get("pipelines").get("hite_pro_education")
+    statuses = amo_fields.get("statuses")
+
+    async with async_session_factory() as session:
+        progress = await get_leads_progress(session)
+
+    # Бюджет делим пополам между чтением страниц и исправлениями. Исправления уходят пачками
+    # по AMO_BATCH_LIMIT, и на каждую пачку нужно два запроса: примечания и смена этапов
+    max_pages = max(request_budget // 2, 1)
+    max_corrections = max(request_budget - max_pages, 0) // 2 * AMO_BATCH_LIMIT
+    chunks = _select_chunks(sorted(progress), max_pages, date.today())
+
+    seen: set[int] = set()
+    # Исправления текущей пачки: следующую начинаем собирать только после ответа amoCRM на эту
+    corrections: list[tuple[int, str, asyncio.Future, asyncio.Future]] = []
+    queued = 0
+    interrupted = False
+    try:
+        pages = _iter_known_leads(amo_api, pipeline_id, chunks)
+        async with aclosing(pages):
+            async for leads in pages:
+                stats["pages"] += 1
+                stats["requests"] += 1
+                async with async_session_factory() as session:
+                    for lead_dct in leads:
+                        stats["leads"] += 1
+                        lead = Lead.from_api(lead_dct)
+                        lead_id = lead.id
+                        entry = progress.get(lead_id)
+                        if entry is None:
+                            continue
+                        seen.add(lead_id)
+                        stats["matched"] += 1
+
+                        status_id = lead.status_id
+                        await save_lead_status(session, lead_id, status_id, lead.pipeline_id)
+
+                        expected_key = resolve_expected_status_key(entry["completed"])
+                        if expected_key is None or queued >= max_corrections:
+                            continue
+                        if status_id is None:
+                            logger.warning("Reconciliation: lead %s has no status, skipped", lead_id)
+                            continue
+                        # Неизвестный этап check_push_to_new_status считает самым ранним: закрытую сделку
+                        # он вернул бы в обучение
+                        if not is_lesson_progression_status(status_id, statuses):
+                            continue
+                        if not await check_push_to_new_status(lesson_key=expected_key, lead_status=status_id):
+                            continue
+
+                        if not corrections:
+                            _ensure_breaker_closed(amo_api)
+                        logger.info("Reconciliation: lead %s is behind, pushing to %s", lead_id, expected_key)
+                        # Батчер соберёт пачку в два пакетных запроса: примечания и смена этапов
+                        note = asyncio.ensure_future(amo_batcher.add_note(
+                            lead_id=lead_id,
+                            text=f'Сверка с ботом обучения: сделка переведена в этап {expected_key} по результатам уроков',
+                        ))
+                        push = asyncio.ensure_future(amo_batcher.push_status(
+                            lead_id=lead_id,
+                            pipeline_id=pipeline_id,
+                            status_id=statuses.get(expected_key),
+                        ))
+                        corrections.append((lead_id, expected_key, note, push))
+                        queued += 1
+                        if len(corrections) >= AMO_BATCH_LIMIT:
+                            await _apply_corrections(session, amo_api, corrections, pipeline_id, statuses, stats)
+                            await asyncio.sleep(CORRECTION_PAUSE)
+                    await session.commit()
+            if corrections:
+                async with async_session_factory() as session:
+                    await _apply_corrections(session, amo_api, corrections, pipeline_id, statuses, stats)
+    except AmoUnavailableError as error:
+        logger.warning("amoCRM reconciliation interrupted: %s", error)
+        interrupted = True
+        stats["errors"] += 1
+
+    # Прерванная сверка могла оставить исправления в полёте: дожидаемся их, чтобы не потерять ответы
+    if corrections:
+        async with async_session_factory() as session:
+            try:
+                await _apply_corrections(session, amo_api, corrections, pipeline_id, statuses, stats)
+            except AmoUnavailableError:
+                pass
+
+    # Сделки, которых нет в воронке обучения (удалены или перенесены), только считаем: решает менеджер
+    if not interrupted:
+        stats["missing"] = sum(len(chunk) for chunk in chunks) - len(seen)
+
+    logger.info(
+        "amoCRM reconciliation finished. pages=%s leads=%s matched=%s corrected=%s missing=%s requests=%s errors=%s",
+        stats["pages"],
+        stats["leads"],
+        stats["matched"],
+        stats["corrected"],
+        stats["missing"],
+        stats["requests"],
+        stats["errors"],
+    )
+    return stats
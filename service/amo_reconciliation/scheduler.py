@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from amo_api.amo_api import AmoCRMWrapper
+from amo_api.batcher import AmoWriteBatcher
+from service.amo_reconciliation.runner import run_amo_reconciliation_once
+
+logger = logging.getLogger(__name__)
+
+MOSCOW_TZ = ZoneInfo("Europe/Moscow")
+RUN_HOUR = 4
+RUN_MINUTE = 0
+
+
+def _seconds_until_next_run(now: datetime) -> float:
+    next_run = now.replace(
+        hour=RUN_HOUR,
+        minute=RUN_MINUTE,
+        second=0,
+        microsecond=0,
+    )
+    if now > next_run:
+        next_run += timedelta(days=1)
+    return max((next_run - now).total_seconds(), 0.0)
+
+
+async def _scheduler_loop(amo_api: AmoCRMWrapper, amo_batcher: AmoWriteBatcher, amo_fields: dict) -> None:
+    logger.info(
+        "amoCRM reconciliation scheduler started. timezone=%s run_time=%02d:%02d",
+        MOSCOW_TZ.key,
+        RUN_HOUR,
+        RUN_MINUTE,
+    )
+    try:
+        while True:
+            now = datetime.now(MOSCOW_TZ)
+            sleep_seconds = _seconds_until_next_run(now)
+            next_run_at = now + timedelta(seconds=sleep_seconds)
+            logger.info("Next amoCRM reconciliation run at %s", next_run_at.isoformat())
+
+            await asyncio.sleep(sleep_seconds)
+
+            if amo_api.breaker.is_open:
+                logger.warning("amoCRM is unavailable, reconciliation skipped")
+                continue
+
+            try:
+                await run_amo_reconciliation_once(amo_api, amo_batcher, amo_fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Unhandled error in amoCRM reconciliation run")
+    except asyncio.CancelledError:
+        logger.info("amoCRM reconciliation scheduler stopped")
+        raise
+
+
+def start_amo_reconciliation_scheduler(amo_api: AmoCRMWrapper, amo_batcher: AmoWriteBatcher,
+                                       amo_fields: dict) -> asyncio.Task:
+    return asyncio.create_task(
+        _scheduler_loop(amo_api, amo_batcher, amo_fields),
+        name="amo-reconciliation-scheduler",
+    )
+
+
+async def stop_amo_reconciliation_scheduler(task: asyncio.Task | None) -> None:
+    if task is None:
+        return
+
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
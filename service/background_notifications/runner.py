@@ -9,6 +9,7 @@ from maxapi.utils.inline_keyboard import InlineKeyboardBuilder
 
 from db import async_session_factory
 from service.background_message import get_background_message
+from service.max_limiter import max_priority
 from service.background_notifications.repository import (
     get_last_lesson_result,
     get_notification_candidates,
@@ -90,11 +91,13 @@ async def run_inactivity_notifications_once(bot: Bot) -> dict[str, int]:
                         stats["skipped"] += 1
                         continue
 
-                    await bot.send_message(
-                        user_id=user.max_user_id,
-                        text=message,
-                        attachments=[_build_continue_education_markup()],
-                    )
+                    # Напоминания уступают MAX API ответам пользователям
+                    with max_priority("background"):
+                        await bot.send_message(
+                            user_id=user.max_user_id,
+                            text=message,
+                            attachments=[_build_continue_education_markup()],
+                        )
                 except Exception:
                     logger.exception(
                         "Failed to send inactivity message user_id=%s max_user_id=%s stage=%s",
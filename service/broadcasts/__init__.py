@@ -0,0 +1,28 @@
+from service.broadcasts.repository import count_segment, create_broadcast
+from service.broadcasts.rules import (
+    SEGMENT_ALL,
+    SEGMENT_BEFORE_LESSON,
+    SEGMENT_CLIENT_TYPE,
+    segment_title,
+)
+from service.broadcasts.runner import (
+    cancel_broadcast,
+    resume_broadcasts,
+    run_broadcast,
+    start_broadcast,
+    stop_broadcasts,
+)
+
+__all__ = [
+    "SEGMENT_ALL",
+    "SEGMENT_BEFORE_LESSON",
+    "SEGMENT_CLIENT_TYPE",
+    "cancel_broadcast",
+    "count_segment",
+    "create_broadcast",
+    "resume_broadcasts",
+    "run_broadcast",
+    "segment_title",
+    "start_broadcast",
+    "stop_broadcasts",
+]
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import func, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Broadcast, BroadcastRecipient, User
+from service.broadcasts.rules import segment_conditions
+
+
+async def count_segment(session: AsyncSession, segment: dict) -> int:
+    result = await session.execute(select(func.count(User.id)).where(*segment_conditions(segment)))
+    return result.scalar_one()
+
+
+async def create_broadcast(session: AsyncSession, text: str, segment: dict, created_by: int) -> Broadcast:
+    """Создаёт рассылку и её получателей одним INSERT ... SELECT по сегменту."""
+    broadcast = Broadcast(text=text, segment=segment, created_by=created_by, status="running")
+    session.add(broadcast)
+    await session.flush()
+
+    recipients = select(
+        literal(broadcast.id), User.id, User.max_user_id, literal("pending"),
+    ).where(*segment_conditions(segment))
+    result = await session.execute(
+        insert(BroadcastRecipient).from_select(
+            ["broadcast_id", "user_id", "max_user_id", "status"], recipients,
+        )
+    )
+    broadcast.total = result.rowcount
+    await session.commit()
+    return broadcast
+
+
+async def get_running_broadcast_ids(session: AsyncSession) -> list[int]:
+    result = await session.execute(
+        select(Broadcast.id).where(Broadcast.status == "running").order_by(Broadcast.id)
+    )
+    return list(result.scalars().all())
+
+
+async def get_pending_recipients(
+    session: AsyncSession,
+    broadcast_id: int,
+    after_id: int,
+    limit: int,
+) -> list[tuple[int, int]]:
+    """(id записи, max_user_id) следующей страницы неотправленных получателей."""
+    result = await session.execute(
+        select(BroadcastRecipient.id, BroadcastRecipient.max_user_id)
+        .where(
+            BroadcastRecipient.broadcast_id == broadcast_id,
+            BroadcastRecipient.status == "pending",
+            BroadcastRecipient.id > after_id,
+        )
+        .order_by(BroadcastRecipient.id)
+        .limit(limit)
+    )
+    return [tuple(row) for row in result.all()]
+
+
+async def mark_recipient(session: AsyncSession, recipient_id: int, status: str, error: str | None = None) -> None:
+    await session.execute(
+        update(BroadcastRecipient)
+        .where(BroadcastRecipient.id == recipient_id)
+        .values(status=status, error=error, sent_at=datetime.utcnow() if status == "sent" else None)
+    )
+    await session.commit()
+
+
+async def count_recipients_by_status(session: AsyncSession, broadcast_id: int) -> dict[str, int]:
+    result = await session.execute(
+        select(BroadcastRecipient.status, func.count(BroadcastRecipient.id))
+        .where(BroadcastRecipient.broadcast_id == broadcast_id)
+        .group_by(BroadcastRecipient.status)
+    )
+    return dict(result.all())
+
+
+async def top_recipient_errors(session: AsyncSession, broadcast_id: int, limit: int = 3) -> list[tuple[str, int]]:
+    result = await session.execute(
+        select(BroadcastRecipient.error, func.count(BroadcastRecipient.id))
+        .where(
+            BroadcastRecipient.broadcast_id == broadcast_id,
+            BroadcastRecipient.status == "failed",
+        )
+        .group_by(BroadcastRecipient.error)
+        .order_by(func.count(BroadcastRecipient.id).desc())
+        .limit(limit)
+    )
+    return [tuple(row) for row in result.all()]
+
+
+async def get_broadcast_status(session: AsyncSession, broadcast_id: int) -> str | None:
+    result = await session.execute(select(Broadcast.status).where(Broadcast.id == broadcast_id))
+    return result.scalar_one_or_none()
+
+
+async def finish_broadcast(session: AsyncSession, broadcast_id: int, status: str = "done") -> bool:
+    """Закрывает рассылку в статусе running. False - её уже закрыли (например, администратор остановил)."""
+    result = await session.execute(
+        update(Broadcast)
+        .where(Broadcast.id == broadcast_id, Broadcast.status == "running")
+        .values(status=status, finished_at=datetime.utcnow())
+    )
+    await session.commit()
+    return result.rowcount > 0
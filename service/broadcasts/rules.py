@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from sqlalchemy import select
+
+from db.models import HpLessonResult, User
+from service.questions_lexicon import lessons, who_are_you
+
+SEGMENT_ALL = "all"
+SEGMENT_BEFORE_LESSON = "before_lesson"  # Ещё не прошли урок lesson_key (застряли до него или на нём)
+SEGMENT_CLIENT_TYPE = "client_type"  # Выбрали при старте тип клиента client_type (ключ кнопки who_are_you)
+
+
+def lesson_title(lesson_key: str) -> str:
+    for lesson in lessons:
+        if lesson["title"] == lesson_key:
+            return lesson["descr"]
+    return lesson_key
+
+
+def segment_title(segment: dict) -> str:
+    kind = segment.get("kind")
+    if kind == SEGMENT_BEFORE_LESSON:
+        return f"не прошли «{lesson_title(segment['lesson_key'])}»"
+    if kind == SEGMENT_CLIENT_TYPE:
+        return f"тип клиента «{who_are_you['buttons'].get(segment['client_type'], segment['client_type'])}»"
+    return "все пользователи"
+
+
+def segment_conditions(segment: dict) -> list:
+    """Условия WHERE по таблице users для сегмента рассылки."""
+    conditions = [User.max_user_id.is_not(None)]
+    kind = segment.get("kind")
+    if kind == SEGMENT_BEFORE_LESSON:
+        completed = (
+            select(HpLessonResult.id)
+            .where(
+                HpLessonResult.user_id == User.id,
+                HpLessonResult.lesson_key == segment["lesson_key"],
+                HpLessonResult.compleat.is_(True),
+            )
+            .exists()
+        )
+        conditions.append(~completed)
+    elif kind == SEGMENT_CLIENT_TYPE:
+        # В users.client_type лежит текст кнопки, а не её ключ
+        conditions.append(User.client_type == who_are_you["buttons"][segment["client_type"]])
+    elif kind != SEGMENT_ALL:
+        raise ValueError(f"Неизвестный сегмент рассылки: {segment}")
+    return conditions
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from maxapi import Bot
+from maxapi.exceptions.max import MaxApiError
+
+from db import async_session_factory
+from db.models import Broadcast
+from service.broadcasts.repository import (
+    count_recipients_by_status,
+    finish_broadcast,
+    get_broadcast_status,
+    get_pending_recipients,
+    get_running_broadcast_ids,
+    mark_recipient,
+    top_recipient_errors,
+)
+from service.broadcasts.rules import segment_title
+from service.max_limiter import max_priority
+from service.metrics.registry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_CONCURRENCY = 5  # Сколько сообщений рассылки отправляется одновременно; темп задаёт лимитер MAX API
+BROADCAST_PAGE_SIZE = 200  # Сколько получателей читаем из БД за раз
+
+BROADCAST_MESSAGES = REGISTRY.counter(
+    'broadcast_messages_total', 'Сообщения рассылок администратора', ('result',))
+
+# Рассылки, которые отправляются в этом процессе: broadcast_id -> задача
+_tasks: dict[int, asyncio.Task] = {}
+
+
+def _error_label(error: Exception) -> str:
+    # Короткая метка без идентификаторов: по ней ошибки группируются в отчёте
+    if isinstance(error, MaxApiError):
+        return f"MAX API {error.code}"
+    return type(error).__name__
+
+
+async def _load_recipients(broadcast_id: int, queue: asyncio.Queue) -> None:
+    after_id = 0
+    while True:
+        async with async_session_factory() as session:
+            # Статус проверяем на каждой странице: рассылку могли остановить из другого процесса
+            if await get_broadcast_status(session, broadcast_id) != "running":
+                return
+            page = await get_pending_recipients(session, broadcast_id, after_id, BROADCAST_PAGE_SIZE)
+        if not page:
+            return
+        for recipient in page:
+            await queue.put(recipient)
+        after_id = page[-1][0]
+
+
+async def _send_worker(bot: Bot, broadcast: Broadcast, queue: asyncio.Queue, stats: dict[str, int]) -> None:
+    while True:
+        recipient = await queue.get()
+        if recipient is None:
+            return
+        recipient_id, max_user_id = recipient
+        status, error_label = "sent", None
+        try:
+            with max_priority("broadcast"):
+                await bot.send_message(user_id=max_user_id, text=broadcast.text)
+        except Exception as error:
+            status, error_label = "failed", _error_label(error)
+            logger.warning(
+                "Broadcast %s: failed to send to max_user_id=%s: %r", broadcast.id, max_user_id, error,
+            )
+        # Статус пишем сразу после отправки: после рестарта этот получатель уже не попадёт в выборку
+        try:
+            async with async_session_factory() as session:
+                await mark_recipient(session, recipient_id, status, error_label)
+        except Exception:
+            logger.exception("Broadcast %s: failed to save status of recipient %s", broadcast.id, recipient_id)
+        stats[status] += 1
+        BROADCAST_MESSAGES.inc(result=status)
+
+
+async def run_broadcast(bot: Bot, broadcast_id: int) -> dict[str, int]:
+    """Досылает рассылку всем получателям в статусе pending и отправляет автору отчёт."""
+    async with async_session_factory() as session:
+        broadcast = await session.get(Broadcast, broadcast_id)
+    if broadcast is None or broadcast.status != "running":
+        return {}
+
+    logger.info("Broadcast %s started: segment=%s total=%s", broadcast.id, broadcast.segment, broadcast.total)
+    stats = {"sent": 0, "failed": 0}
+    started = time.monotonic()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=BROADCAST_CONCURRENCY * 2)
+    workers = [
+        asyncio.create_task(_send_worker(bot, broadcast, queue, stats), name=f"broadcast-{broadcast.id}-{index}")
+        for index in range(BROADCAST_CONCURRENCY)
+    ]
+    try:
+        await _load_recipients(broadcast.id, queue)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel()
+    elapsed = time.monotonic() - started
+
+    async with async_session_factory() as session:
+        finished = await finish_broadcast(session, broadcast.id)
+        totals = await count_recipients_by_status(session, broadcast.id)
+        errors = await top_recipient_errors(session, broadcast.id)
+
+    rate = stats["sent"] / elapsed if elapsed > 0 else 0.0
+    logger.info(
+        "Broadcast %s finished: sent=%s failed=%s elapsed=%.1fs rate=%.1f/s",
+        broadcast.id, stats["sent"], stats["failed"], elapsed, rate,
+    )
+    lines = [
+        f"Рассылка #{broadcast.id} ({segment_title(broadcast.segment)}) {'завершена' if finished else 'остановлена'}.",
+        f"Доставлено: {totals.get('sent', 0)} из {broadcast.total}, ошибок: {totals.get('failed', 0)}.",
+        f"В этом запуске: {stats['sent']} за {elapsed:.0f} с ({rate:.1f} сообщ./с).",
+    ]
+    if errors:
+        lines.append("Ошибки: " + ", ".join(f"{label} - {count}" for label, count in errors))
+    try:
+        with max_priority("background"):
+            await bot.send_message(user_id=broadcast.created_by, text="\n".join(lines))
+    except Exception:
+        logger.exception("Failed to send broadcast %s report to admin %s", broadcast.id, broadcast.created_by)
+    return stats
+
+
+def start_broadcast(bot: Bot, broadcast_id: int) -> asyncio.Task:
+    task = _tasks.get(broadcast_id)
+    if task is not None and not task.done():
+        return task
+
+    task = asyncio.create_task(run_broadcast(bot, broadcast_id), name=f"broadcast-{broadcast_id}")
+    _tasks[broadcast_id] = task
+
+    def _done(finished: asyncio.Task) -> None:
+        _tasks.pop(broadcast_id, None)
+        if not finished.cancelled() and finished.exception() is not None:
+            logger.error("Broadcast %s crashed", broadcast_id, exc_info=finished.exception())
+
+    task.add_done_callback(_done)
+    return task
+
+
+async def cancel_broadcast(broadcast_id: int) -> dict[str, int] | None:
+    """Останавливает рассылку: неотправленные получатели остаются pending, после рестарта она не продолжится.
+    Возвращает число получателей по статусам или None, если рассылка уже не идёт."""
+    async with async_session_factory() as session:
+        if not await finish_broadcast(session, broadcast_id, status="cancelled"):
+            return None
+    task = _tasks.get(broadcast_id)
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    async with async_session_factory() as session:
+        return await count_recipients_by_status(session, broadcast_id)
+
+
+async def resume_broadcasts(bot: Bot) -> int:
+    """Продолжает рассылки, прерванные рестартом: отправленным получателям повторно ничего не уходит."""
+    async with async_session_factory() as session:
+        broadcast_ids = await get_running_broadcast_ids(session)
+    for broadcast_id in broadcast_ids:
+        logger.info("Resuming broadcast %s", broadcast_id)
+        start_broadcast(bot, broadcast_id)
+    return len(broadcast_ids)
+
+
+async def stop_broadcasts() -> None:
+    # Рассылки остаются в статусе running и продолжатся после следующего старта
+    tasks = list(_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
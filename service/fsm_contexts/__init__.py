@@ -0,0 +1,19 @@
+from service.fsm_contexts.evictor import (
+    ContextsReport,
+    contexts_report,
+    evict_idle_contexts,
+    start_fsm_context_evictor,
+    stop_fsm_context_evictor,
+)
+from service.fsm_contexts.storage import FsmSpillStore, SpillableMemoryContext, context_key
+
+__all__ = [
+    "ContextsReport",
+    "FsmSpillStore",
+    "SpillableMemoryContext",
+    "context_key",
+    "contexts_report",
+    "evict_idle_contexts",
+    "start_fsm_context_evictor",
+    "stop_fsm_context_evictor",
+]
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from maxapi import Dispatcher
+
+from db import async_session_factory
+from service.fsm_contexts.repository import delete_spilled_before, load_spilled_keys, save_spilled_contexts
+from service.fsm_contexts.storage import FsmSpillStore, SpillableMemoryContext
+from service.metrics.registry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+FSM_CONTEXT_TTL = 6 * 60 * 60  # Через сколько секунд простоя контекст выгружается из памяти
+FSM_SWEEP_INTERVAL = 60  # Как часто (в секундах) ищем простаивающие контексты
+FSM_MAX_CONTEXTS = 8_000  # Ниже лимита maxapi (10 000), который молча выкидывает самые старые контексты
+FSM_SPILL_RETENTION = timedelta(days=30)  # Сколько хранить выгруженный контекст, если пользователь не вернулся
+
+FSM_CONTEXTS_HELD = REGISTRY.gauge(
+    'fsm_contexts_held', 'Сколько FSM-контекстов держит в памяти диспетчер')
+FSM_CONTEXTS_BYTES = REGISTRY.gauge(
+    'fsm_contexts_bytes_estimated', 'Оценка памяти под данные FSM-контекстов, байты (sys.getsizeof по вложенным объектам)')
+FSM_CONTEXTS_SPILLED = REGISTRY.gauge(
+    'fsm_contexts_spilled', 'Сколько FSM-контекстов сейчас выгружено в БД')
+FSM_CONTEXTS_EVICTED = REGISTRY.counter(
+    'fsm_contexts_evicted_total', 'Сколько FSM-контекстов выгружено из памяти', labelnames=('reason', 'spilled'))
+
+
+@dataclass
+class ContextsReport:
+    held: int = 0
+    with_state: int = 0
+    bytes_estimated: int = 0
+    idle: int = 0
+
+
+def estimate_size(obj, _seen: set[int] | None = None) -> int:
+    """Грубая оценка занимаемой памяти: sys.getsizeof по контейнерам и их содержимому."""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(key, seen) + estimate_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, seen) for item in obj)
+    return size
+
+
+def contexts_report(dp: Dispatcher, ttl: float = FSM_CONTEXT_TTL) -> ContextsReport:
+    report = ContextsReport()
+    now = time.monotonic()
+    for ctx in list(dp.contexts.values()):
+        report.held += 1
+        state, data = ctx.snapshot() if isinstance(ctx, SpillableMemoryContext) else (None, {})
+        report.with_state += state is not None
+        report.bytes_estimated += estimate_size(data)
+        if isinstance(ctx, SpillableMemoryContext) and now - ctx.last_used > ttl:
+            report.idle += 1
+    return report
+
+
+def _pick_for_eviction(dp: Dispatcher, ttl: float, max_contexts: int) -> dict[tuple, str]:
+    """Ключ dp.contexts -> причина выгрузки. dp.contexts упорядочен от давно не использованных к свежим."""
+    now = time.monotonic()
+    picked = {}
+    overflow = len(dp.contexts) - max_contexts
+    for key, ctx in list(dp.contexts.items()):
+        if not isinstance(ctx, SpillableMemoryContext) or ctx.busy:
+            continue
+        if now - ctx.last_used > ttl:
+            picked[key] = 'ttl'
+        elif len(picked) < overflow:
+            picked[key] = 'limit'
+    return picked
+
+
+async def evict_idle_contexts(dp: Dispatcher, store: FsmSpillStore, ttl: float = FSM_CONTEXT_TTL,
+                              max_contexts: int = FSM_MAX_CONTEXTS) -> int:
+    """Выгружает простаивающие контексты (и самые старые сверх max_contexts). Возвращает, сколько выгружено."""
+    picked = _pick_for_eviction(dp, ttl, max_contexts)
+    if not picked:
+        return 0
+
+    snapshots, used = {}, {}
+    for key, ctx in ((key, dp.contexts[key]) for key in picked):
+        used[key] = ctx.last_used
+        state, data = ctx.snapshot()
+        # Пустой контекст (пользователь ещё ничего не начал или закончил) в БД не нужен
+        if store.enabled and (state is not None or data):
+            snapshots[ctx.key] = (state, data)
+
+    if snapshots:
+        try:
+            async with async_session_factory() as session:
+                await save_spilled_contexts(session, snapshots)
+        except Exception:
+            # Не записали - не выгружаем: данные пользователя важнее памяти, попробуем на следующем проходе
+            logger.exception('Не удалось выгрузить %d FSM-контекстов в БД', len(snapshots))
+            return 0
+
+    evicted = 0
+    for key, reason in picked.items():
+        ctx = dp.contexts.get(key)
+        # Пока писали в БД, пользователь мог вернуться: такой контекст остаётся в памяти
+        if ctx is None or ctx.last_used != used[key] or ctx.busy:
+            continue
+        del dp.contexts[key]
+        spilled = ctx.key in snapshots
+        if spilled:
+            store.keys.add(ctx.key)
+        FSM_CONTEXTS_EVICTED.inc(reason=reason, spilled='yes' if spilled else 'no')
+        evicted += 1
+    return evicted
+
+
+async def _sweep_once(dp: Dispatcher, store: FsmSpillStore, ttl: float, max_contexts: int) -> None:
+    evicted = await evict_idle_contexts(dp, store, ttl, max_contexts)
+    if store.enabled:
+        async with async_session_factory() as session:
+            expired = await delete_spilled_before(session, datetime.utcnow() - FSM_SPILL_RETENTION)
+        store.keys.difference_update(expired)
+
+    report = contexts_report(dp, ttl)
+    FSM_CONTEXTS_HELD.set(report.held)
+    FSM_CONTEXTS_BYTES.set(report.bytes_estimated)
+    FSM_CONTEXTS_SPILLED.set(len(store.keys))
+    if evicted:
+        logger.info('Выгружено FSM-контекстов: %d, в памяти %d (~%d КБ), в БД %d',
+                    evicted, report.held, report.bytes_estimated // 1024, len(store.keys))
+
+
+async def _sweep_loop(dp: Dispatcher, store: FsmSpillStore, ttl: float, interval: float, max_contexts: int) -> None:
+    logger.info('FSM context evictor started. ttl=%ss interval=%ss max=%d spill=%s',
+                ttl, interval, max_contexts, store.enabled)
+    try:
+        if store.enabled:
+            try:
+                async with async_session_factory() as session:
+                    store.keys = await load_spilled_keys(session)
+            except Exception:
+                logger.exception('Не удалось загрузить ключи выгруженных FSM-контекстов')
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await _sweep_once(dp, store, ttl, max_contexts)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Unhandled error in FSM context eviction')
+    except asyncio.CancelledError:
+        logger.info('FSM context evictor stopped')
+        raise
+
+
+def start_fsm_context_evictor(dp: Dispatcher, store: FsmSpillStore, ttl: float = FSM_CONTEXT_TTL,
+                              interval: float = FSM_SWEEP_INTERVAL,
+                              max_contexts: int = FSM_MAX_CONTEXTS) -> asyncio.Task:
+    return asyncio.create_task(
+        _sweep_loop(dp, store, ttl, interval, max_contexts),
+        name='fsm-context-evictor',
+    )
+
+
+async def stop_fsm_context_evictor(task: asyncio.Task | None) -> None:
+    if task is None:
+        return
+
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
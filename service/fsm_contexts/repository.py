@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import FsmContextSpill
+
+
+async def load_spilled_keys(session: AsyncSession) -> set[str]:
+    result = await session.execute(select(FsmContextSpill.key))
+    return set(result.scalars().all())
+
+
+async def save_spilled_contexts(session: AsyncSession, snapshots: dict[str, tuple[str | None, dict]]) -> None:
+    """snapshots: ключ -> (имя состояния, данные). Старые записи с теми же ключами заменяются."""
+    if not snapshots:
+        return
+    now = datetime.utcnow()
+    await session.execute(delete(FsmContextSpill).where(FsmContextSpill.key.in_(list(snapshots))))
+    session.add_all(
+        FsmContextSpill(key=key, state=state, data=data, spilled_at=now)
+        for key, (state, data) in snapshots.items()
+    )
+    await session.commit()
+
+
+async def pop_spilled_context(session: AsyncSession, key: str) -> FsmContextSpill | None:
+    """Забирает выгруженный контекст: запись удаляется, дальше контекст снова живёт в памяти."""
+    result = await session.execute(
+        delete(FsmContextSpill).where(FsmContextSpill.key == key).returning(FsmContextSpill)
+    )
+    spill = result.scalar_one_or_none()
+    await session.commit()
+    return spill
+
+
+async def delete_spilled_before(session: AsyncSession, before: datetime) -> list[str]:
+    result = await session.execute(
+        delete(FsmContextSpill).where(FsmContextSpill.spilled_at < before).returning(FsmContextSpill.key)
+    )
+    keys = list(result.scalars().all())
+    await session.commit()
+    return keys
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any
+
+from maxapi.context import MemoryContext, State
+
+from db import async_session_factory
+from service.fsm_contexts.repository import pop_spilled_context
+from service.metrics.registry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+FSM_CONTEXTS_RESTORED = REGISTRY.counter(
+    'fsm_contexts_restored_total', 'Сколько FSM-контекстов поднято из БД при возвращении пользователя')
+
+
+def context_key(chat_id: int | None, user_id: int | None) -> str:
+    return f'{chat_id}:{user_id}'
+
+
+class FsmSpillStore:
+    """Какие контексты сейчас лежат в БД, а не в памяти.
+
+    Ключи держим в памяти (это строки, а не данные), чтобы новый контекст ходил в БД
+    только для пользователей, которых действительно выгружали.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.keys: set[str] = set()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+
+    async def restore(self, key: str) -> tuple[str | None, dict] | None:
+        if not self.enabled or key not in self.keys:
+            return None
+        self.keys.discard(key)
+        async with async_session_factory() as session:
+            spill = await pop_spilled_context(session, key)
+        if spill is None:
+            return None
+        return spill.state, spill.data or {}
+
+
+class SpillableMemoryContext(MemoryContext):
+    """MemoryContext, который помнит время последнего обращения и умеет подняться из БД после выгрузки.
+
+    Передаётся в Dispatcher(storage=SpillableMemoryContext, spill_store=...). Выгружает контексты
+    service.fsm_contexts.evictor, здесь только восстановление при первом обращении.
+    """
+
+    def __init__(self, chat_id: int | None, user_id: int | None, spill_store: FsmSpillStore | None = None,
+                 **kwargs: Any) -> None:
+        super().__init__(chat_id, user_id, **kwargs)
+        self.key = context_key(chat_id, user_id)
+        self.last_used = time.monotonic()
+        self._spill_store = spill_store
+        self._restored = spill_store is None
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def snapshot(self) -> tuple[str | None, dict]:
+        state = self._state.name if isinstance(self._state, State) else self._state
+        return state, dict(self._context)
+
+    async def _restore(self) -> None:
+        self.last_used = time.monotonic()
+        if self._restored:
+            return
+        async with self._lock:
+            if self._restored:
+                return
+            try:
+                spilled = await self._spill_store.restore(self.key)
+            except Exception:
+                # Без БД пользователь начнёт с пустого контекста, как после рестарта бота
+                logger.exception('Не удалось восстановить FSM-контекст %s из БД', self.key)
+                spilled = None
+            self._restored = True
+            if spilled is not None:
+                # Состояние возвращается строкой "Группа:состояние": фильтры maxapi сравнивают State со строкой
+                self._state, self._context = spilled
+                FSM_CONTEXTS_RESTORED.inc()
+                logger.debug('FSM-контекст %s восстановлен из БД', self.key)
+
+    async def get_data(self) -> dict[str, Any]:
+        await self._restore()
+        return await super().get_data()
+
+    async def set_data(self, data: dict[str, Any]) -> None:
+        await self._restore()
+        await super().set_data(data)
+
+    async def update_data(self, **kwargs: Any) -> None:
+        await self._restore()
+        await super().update_data(**kwargs)
+
+    async def set_state(self, state: State | str | None = None) -> None:
+        await self._restore()
+        await super().set_state(state)
+
+    async def get_state(self) -> State | str | None:
+        await self._restore()
+        return await super().get_state()
+
+    async def clear(self) -> None:
+        await self._restore()
+        await super().clear()
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from service.metrics.registry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+INGRESS_WORKERS = 8  # Сколько обновлений обрабатывается одновременно
+INGRESS_QUEUE_SIZE = 500  # Сколько принятых обновлений может ждать обработки
+INGRESS_SHED_AT = 0.8  # С какой заполненности очереди отбрасываем обновления низкого приоритета
+INGRESS_DRAIN_TIMEOUT = 10.0  # Сколько секунд при остановке дорабатываем уже принятые обновления
+
+# Обновления, на которые у бота есть хендлеры и которых ждёт пользователь. Остальные (bot_stopped,
+# message_edited, ...) бот только логирует, их при перегрузке можно не обрабатывать.
+HIGH_PRIORITY_UPDATES = frozenset({'message_callback', 'message_created', 'bot_started'})
+
+INGRESS_QUEUE_DEPTH = REGISTRY.gauge(
+    'bot_ingress_queue_depth', 'Сколько обновлений MAX ждут обработки в очереди')
+INGRESS_QUEUE_WAIT = REGISTRY.histogram(
+    'bot_ingress_queue_wait_seconds', 'Сколько обновление ждало свободного обработчика, секунды', ('priority',))
+INGRESS_WORKERS_BUSY = REGISTRY.gauge(
+    'bot_ingress_workers_busy', 'Сколько обработчиков очереди заняты обновлением')
+
+
+def update_priority(update_type: str) -> str:
+    return 'high' if update_type in HIGH_PRIORITY_UPDATES else 'low'
+
+
+class UpdateIngress:
+    """Очередь обновлений MAX между вебхуком и диспетчером.
+
+    Вебхук кладёт обновление в очередь и сразу отвечает MAX, обработку ведут workers задач.
+    Так авторизации, которые ждут amoCRM, не держат HTTP-ответ и MAX не повторяет доставку по таймауту.
+    При заполненности выше shed_at обновления низкого приоритета отбрасываются, а если очередь
+    заполнена целиком, submit возвращает 'deferred': вебхук отвечает 503 и MAX доставит обновление позже.
+    """
+
+    def __init__(self, handle: Callable[[dict[str, Any], float], Awaitable[Any]], workers: int = INGRESS_WORKERS,
+                 queue_size: int = INGRESS_QUEUE_SIZE, shed_at: float = INGRESS_SHED_AT) -> None:
+        self.handle = handle
+        self.workers = workers
+        self.queue_size = queue_size
+        self.shed_depth = max(1, int(queue_size * shed_at))
+        self._queue: asyncio.Queue[tuple[dict[str, Any], str, float]] = asyncio.Queue(maxsize=queue_size)
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, event_json: dict[str, Any], update_type: str) -> str:
+        """Возвращает 'queued', 'shed' (отброшено) или 'deferred' (очередь полна, пусть MAX повторит)."""
+        priority = update_priority(update_type)
+        if priority == 'low' and self._queue.qsize() >= self.shed_depth:
+            return 'shed'
+        try:
+            self._queue.put_nowait((event_json, priority, time.monotonic()))
+        except asyncio.QueueFull:
+            return 'deferred'
+        INGRESS_QUEUE_DEPTH.set(self._queue.qsize())
+        return 'queued'
+
+    def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f'max-ingress-worker-{index}')
+            for index in range(self.workers)
+        ]
+        logger.info('MAX ingress started. workers=%d queue_size=%d shed_depth=%d',
+                    self.workers, self.queue_size, self.shed_depth)
+
+    async def stop(self, timeout: float = INGRESS_DRAIN_TIMEOUT) -> None:
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning('MAX ingress: при остановке не обработано обновлений: %d', self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info('MAX ingress stopped')
+
+    async def _worker(self) -> None:
+        while True:
+            event_json, priority, queued_at = await self._queue.get()
+            wait = time.monotonic() - queued_at
+            INGRESS_QUEUE_DEPTH.set(self._queue.qsize())
+            INGRESS_QUEUE_WAIT.observe(wait, priority=priority)
+            INGRESS_WORKERS_BUSY.inc()
+            try:
+                await self.handle(event_json, wait)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Unhandled error while processing MAX update %s', event_json.get('update_type'))
+            finally:
+                INGRESS_WORKERS_BUSY.dec()
+                self._queue.task_done()
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import SimpleNamespace
+from typing import Iterator
+
+import aiohttp
+from yarl import URL
+
+from service.metrics.registry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+MAX_RATE_LIMIT = 25.0  # Запросов в секунду ко всему MAX API от процесса (лимит MAX - 30)
+THROTTLE_BACKOFF = 1.0  # Пауза после первого 429 без Retry-After, дальше удваивается
+THROTTLE_BACKOFF_MAX = 30.0
+
+# Полосы от самой важной к наименее важной: запрос из полосы ниже ждёт, пока в полосах выше есть очередь
+PRIORITIES = ('interactive', 'background', 'broadcast')
+
+LIMITER_WAIT = REGISTRY.histogram(
+    'max_api_limiter_wait_seconds', 'Сколько запрос к MAX API ждал своей очереди в лимитере, секунды', ('priority',),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+LIMITER_WAITING = REGISTRY.gauge(
+    'max_api_limiter_waiting', 'Сколько запросов к MAX API ждут в лимитере', ('priority',))
+LIMITER_THROTTLED = REGISTRY.counter(
+    'max_api_throttled_total', 'Ответы 429 от MAX API, после которых лимитер ставил отправку на паузу')
+
+_priority: ContextVar[str] = ContextVar('max_api_priority', default='interactive')
+
+
+@contextmanager
+def max_priority(priority: str) -> Iterator[None]:
+    """Запросы к MAX API внутри блока идут в полосе priority. По умолчанию всё - interactive.
+
+    Фоновые рассылки оборачивают отправку в with max_priority('background'), чтобы ответы
+    пользователям всегда шли первыми.
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f'Неизвестная полоса MAX API: {priority}')
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_max_priority() -> str:
+    return _priority.get()
+
+
+class MaxRateLimiter:
+    """Общий для процесса token bucket запросов к MAX API с полосами приоритета.
+
+    Пока никто не ждёт и токены есть, запрос проходит сразу. Иначе он встаёт в очередь своей полосы,
+    и одна задача-раздатчик выдаёт токены по мере пополнения: сначала interactive, потом background, потом broadcast.
+    После 429 выдача останавливается для всех полос на Retry-After (или на растущую паузу).
+    """
+
+    def __init__(self, rate: float = MAX_RATE_LIMIT, burst: int | None = None) -> None:
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._throttle_streak = 0
+        self._waiters: dict[str, deque[asyncio.Future]] = {priority: deque() for priority in PRIORITIES}
+        self._pump_task: asyncio.Task | None = None
+
+    @property
+    def paused_for(self) -> float:
+        return max(0.0, self._paused_until - time.monotonic())
+
+    async def acquire(self, priority: str = 'interactive') -> None:
+        if self.rate <= 0:
+            return
+        started = time.monotonic()
+        if not self._has_waiters() and self._take(started):
+            LIMITER_WAIT.observe(0.0, priority=priority)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(future)
+        LIMITER_WAITING.inc(priority=priority)
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump(), name='max-api-limiter')
+        try:
+            # Отменённый future остаётся в очереди, раздатчик его пропустит
+            await future
+        finally:
+            LIMITER_WAITING.dec(priority=priority)
+        LIMITER_WAIT.observe(time.monotonic() - started, priority=priority)
+
+    def throttled(self, retry_after: float | None = None) -> None:
+        """MAX ответил 429: останавливаем выдачу токенов всем полосам."""
+        self._throttle_streak += 1
+        delay = retry_after
+        if delay is None:
+            delay = min(THROTTLE_BACKOFF_MAX, THROTTLE_BACKOFF * 2 ** (self._throttle_streak - 1))
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + delay)
+        self._tokens = 0.0
+        self._updated = now
+        LIMITER_THROTTLED.inc()
+        logger.warning('MAX API ответил 429, отправка на паузе %.1f с (подряд: %d)', delay, self._throttle_streak)
+
+    def succeeded(self) -> None:
+        self._throttle_streak = 0
+
+    def _has_waiters(self) -> bool:
+        return any(self._waiters.values())
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self, now: float) -> bool:
+        if now < self._paused_until:
+            return False
+        self._refill(now)
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _next_waiter(self) -> asyncio.Future | None:
+        for priority in PRIORITIES:
+            waiters = self._waiters[priority]
+            while waiters:
+                future = waiters.popleft()
+                if not future.done():
+                    return future
+        return None
+
+    async def _pump(self) -> None:
+        while self._has_waiters():
+            now = time.monotonic()
+            if self._take(now):
+                future = self._next_waiter()
+                if future is not None:
+                    future.set_result(None)
+                continue
+            if now < self._paused_until:
+                delay = self._paused_until - now
+            else:
+                delay = (1 - self._tokens) / self.rate
+            await asyncio.sleep(delay)
+
+
+def _retry_after(headers) -> float | None:
+    try:
+        return max(0.0, float(headers.get('Retry-After')))
+    except (TypeError, ValueError):
+        return None
+
+
+def create_max_limiter_trace_config(limiter: MaxRateLimiter, api_url: str) -> aiohttp.TraceConfig:
+    """TraceConfig для aiohttp-сессии бота: каждый запрос к MAX API сначала получает токен в limiter.
+
+    Загрузка файлов идёт на другой хост (URL выдаёт /uploads) и лимитом MAX API не считается.
+    Ставить в trace_configs первым, чтобы ожидание в лимитере не попадало в outbound-метрики.
+    """
+    api_host = URL(api_url).host
+    trace_config = aiohttp.TraceConfig(trace_config_ctx_factory=lambda trace_request_ctx: SimpleNamespace(
+        trace_request_ctx=trace_request_ctx))
+
+    async def on_request_start(session, ctx, params):
+        if params.url.host == api_host:
+            await limiter.acquire(_priority.get())
+
+    async def on_request_end(session, ctx, params):
+        if params.url.host != api_host:
+            return
+        if params.response.status == 429:
+            limiter.throttled(_retry_after(params.response.headers))
+        else:
+            limiter.succeeded()
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
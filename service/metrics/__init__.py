@@ -0,0 +1,54 @@
+from service.metrics.bot import (
+    HANDLER_ERRORS,
+    HANDLER_IN_FLIGHT,
+    HANDLER_LATENCY,
+    WEBHOOK_UPDATES,
+    install_handler_metrics,
+)
+from service.metrics.loop_monitor import LoopMonitor, start_loop_monitor, stop_loop_monitor
+from service.metrics.outbound import (
+    OUTBOUND_LATENCY,
+    create_max_trace_config,
+    install_sqlalchemy_timing,
+    record_outbound,
+    sql_fingerprint,
+)
+from service.metrics.profiler import (
+    PROFILER,
+    PROFILE_DEFAULT_SECONDS,
+    PROFILE_MAX_SECONDS,
+    ProfileResult,
+    ProfilerBusyError,
+    SamplingProfiler,
+)
+from service.metrics.registry import REGISTRY, Counter, Gauge, Histogram, MetricsRegistry
+from service.metrics.slow_log import SLOW_LOG, SlowOperationsLog
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "HANDLER_ERRORS",
+    "HANDLER_IN_FLIGHT",
+    "HANDLER_LATENCY",
+    "Histogram",
+    "LoopMonitor",
+    "MetricsRegistry",
+    "OUTBOUND_LATENCY",
+    "PROFILER",
+    "PROFILE_DEFAULT_SECONDS",
+    "PROFILE_MAX_SECONDS",
+    "ProfileResult",
+    "ProfilerBusyError",
+    "REGISTRY",
+    "SLOW_LOG",
+    "SamplingProfiler",
+    "SlowOperationsLog",
+    "WEBHOOK_UPDATES",
+    "create_max_trace_config",
+    "install_handler_metrics",
+    "install_sqlalchemy_timing",
+    "record_outbound",
+    "sql_fingerprint",
+    "start_loop_monitor",
+    "stop_loop_monitor",
+]
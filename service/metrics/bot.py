@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from service.metrics.registry import REGISTRY
+
+if TYPE_CHECKING:
+    from maxapi import Dispatcher
+
+HANDLER_LATENCY = REGISTRY.histogram(
+    'bot_handler_duration_seconds', 'Время работы хендлера, секунды', ('router', 'handler'))
+HANDLER_ERRORS = REGISTRY.counter(
+    'bot_handler_errors_total', 'Исключения, вылетевшие из хендлера', ('router', 'handler', 'error'))
+HANDLER_IN_FLIGHT = REGISTRY.gauge(
+    'bot_handler_in_flight', 'Сколько вызовов хендлера выполняется прямо сейчас', ('router', 'handler'))
+WEBHOOK_UPDATES = REGISTRY.counter(
+    'bot_webhook_updates_total', 'Обновления MAX, пришедшие на вебхук', ('update_type', 'result'))
+
+
+def _iter_routers(router):
+    yield router
+    for child in router.routers:
+        if child is not router:
+            yield from _iter_routers(child)
+
+
+def install_handler_metrics(dp: Dispatcher) -> int:
+    """Вешает HandlerMetricsMiddleware первым в цепочку каждого хендлера.
+
+    Вызывать до dp.startup: цепочки middleware хендлеров собираются при старте диспетчера.
+    Метка router - router_id, а если он не задан, то имя модуля хендлера (lesson_1, main_handlers, ...).
+    """
+    from middleware.metrics import HandlerMetricsMiddleware
+
+    installed = 0
+    seen: set[int] = set()
+    for router in _iter_routers(dp):
+        if id(router) in seen:
+            continue
+        seen.add(id(router))
+        for handler in router.event_handlers:
+            if any(isinstance(mw, HandlerMetricsMiddleware) for mw in handler.middlewares):
+                continue
+            func = handler.func_event
+            router_label = router.router_id or func.__module__.rsplit('.', 1)[-1]
+            handler.middlewares.insert(0, HandlerMetricsMiddleware(router_label, func.__name__))
+            installed += 1
+    return installed
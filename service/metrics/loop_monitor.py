@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from service.metrics.registry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_INTERVAL = 0.5  # Как часто (в секундах) heartbeat проверяет задержку event loop
+LOOP_BLOCK_THRESHOLD = 1.0  # После скольких секунд без heartbeat считаем, что loop заблокирован
+
+# Корзины мельче, чем у хендлеров: нормальная задержка loop - единицы миллисекунд
+LOOP_LAG = REGISTRY.histogram(
+    'event_loop_lag_seconds', 'Насколько позже запланированного просыпается heartbeat event loop, секунды',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+LOOP_LAG_LAST = REGISTRY.gauge(
+    'event_loop_lag_last_seconds', 'Задержка event loop при последнем heartbeat, секунды')
+LOOP_BLOCKED = REGISTRY.counter(
+    'event_loop_blocked_total', 'Сколько раз watchdog заставал event loop заблокированным дольше порога')
+
+
+class LoopMonitor:
+    """Heartbeat-задача, которая меряет задержку event loop, и поток-watchdog.
+
+    Если heartbeat не отметился дольше block_threshold, watchdog снимает стек потока event loop
+    и пишет его в лог: так видно, какой синхронный вызов (например, запрос к amoCRM из хендлера) держит loop.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, block_threshold: float = LOOP_BLOCK_THRESHOLD,
+                 watchdog: bool = True) -> None:
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.watchdog = watchdog
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._last_beat = time.monotonic()
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat(), name='loop-monitor-heartbeat')
+        if self.watchdog:
+            self._thread = threading.Thread(target=self._watch, name='loop-monitor-watchdog', daemon=True)
+            self._thread.start()
+        logger.info("Event loop monitor started. interval=%ss block_threshold=%ss watchdog=%s",
+                    self.interval, self.block_threshold, self.watchdog)
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join, self.block_threshold)
+            self._thread = None
+
+    async def _heartbeat(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self._last_beat = time.monotonic()
+            LOOP_LAG.observe(lag)
+            LOOP_LAG_LAST.set(lag)
+            if lag >= self.block_threshold:
+                logger.warning("Event loop был заблокирован %.3f с", lag)
+
+    def _watch(self) -> None:
+        reported_beat = None
+        check_every = max(self.block_threshold / 4, 0.05)
+        while not self._stop.wait(check_every):
+            last_beat = self._last_beat
+            blocked_for = time.monotonic() - last_beat
+            # Порог считаем от последнего heartbeat плюс его собственного интервала сна
+            if blocked_for < self.interval + self.block_threshold or reported_beat == last_beat:
+                continue
+            reported_beat = last_beat
+            LOOP_BLOCKED.inc()
+            logger.warning("Event loop не отвечает %.3f с, текущая задача: %s\n%s",
+                           blocked_for - self.interval, self._current_task_name(), self._loop_stack())
+
+    def _current_task_name(self) -> str:
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            return '-'
+        return task.get_name() if task is not None else '-'
+
+    def _loop_stack(self) -> str:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return '<стек потока event loop недоступен>'
+        return ''.join(traceback.format_stack(frame))
+
+
+def start_loop_monitor(interval: float = LOOP_LAG_INTERVAL, block_threshold: float = LOOP_BLOCK_THRESHOLD,
+                       watchdog: bool = True) -> LoopMonitor:
+    monitor = LoopMonitor(interval=interval, block_threshold=block_threshold, watchdog=watchdog)
+    monitor.start()
+    return monitor
+
+
+async def stop_loop_monitor(monitor: LoopMonitor | None) -> None:
+    if monitor is None:
+        return
+    await monitor.stop()
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import re
+import time
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
+
+import aiohttp
+from sqlalchemy import event
+
+from service.metrics.registry import REGISTRY
+from service.metrics.slow_log import SLOW_LOG
+from service.tracing import STATUS_ERROR, STATUS_OK, get_tracer
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+OUTBOUND_LATENCY = REGISTRY.histogram(
+    'outbound_request_duration_seconds', 'Время внешнего вызова (amoCRM, БД, MAX API), секунды',
+    ('service', 'operation', 'status'))
+tracer = get_tracer(__name__)
+
+# Запросы бота к MAX API, которые удобнее видеть под человеческим именем
+_MAX_OPERATIONS = {
+    ('POST', '/messages'): 'send_message',
+    ('PUT', '/messages'): 'edit_message',
+    ('DELETE', '/messages'): 'delete_message',
+    ('POST', '/answers'): 'answer_callback',
+    ('POST', '/uploads'): 'get_upload_url',
+}
+
+_ID_SEGMENT_RE = re.compile(r'/(?:-?\d+|[0-9a-f]{8,}(?:-[0-9a-f]{4,})*)(?=/|$)', re.IGNORECASE)
+
+_SQL_COMMENT_RE = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+_SQL_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_SQL_PARAM_RE = re.compile(r'\$\d+|%\(\w+\)s|%s|(?<![:\w]):[a-zA-Z_]\w*|\?')
+_SQL_NUMBER_RE = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_SQL_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SQL_SPACE_RE = re.compile(r'\s+')
+_SQL_TABLE_RE = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+"?(\w+)"?', re.IGNORECASE)
+
+
+def record_outbound(service: str, operation: str, status: str | int, duration: float, detail: str = '') -> None:
+    failed = not (status == 'ok' or (isinstance(status, int) and status < 400))
+    status = str(status)
+    OUTBOUND_LATENCY.observe(duration, service=service, operation=operation, status=status)
+    SLOW_LOG.record(service, operation, status, duration, detail)
+    # Если вызов сделан в рамках обновления MAX, он попадает в его трейс дочерним спаном
+    tracer.record_span(
+        f'{service} {operation}', duration,
+        {'service': service, 'status': status, 'db.statement' if service == 'db' else 'detail': detail},
+        status=STATUS_ERROR if failed else STATUS_OK,
+    )
+
+
+def endpoint_label(path: str) -> str:
+    """/api/v4/leads/123/notes -> /api/v4/leads/{id}/notes: id в пути не должны плодить метки."""
+    return _ID_SEGMENT_RE.sub('/{id}', path.split('?', 1)[0])
+
+
+def sql_fingerprint(statement: str) -> str:
+    """Текст запроса без литералов и параметров: одинаковые запросы с разными значениями дают один отпечаток."""
+    sql = _SQL_COMMENT_RE.sub(' ', statement)
+    sql = _SQL_STRING_RE.sub('?', sql)
+    sql = _SQL_PARAM_RE.sub('?', sql)
+    sql = _SQL_NUMBER_RE.sub('?', sql)
+    sql = _SQL_IN_LIST_RE.sub('(?...)', sql)
+    return _SQL_SPACE_RE.sub(' ', sql).strip()
+
+
+def sql_operation_label(fingerprint: str) -> str:
+    """Короткая метка для гистограммы: 'SELECT users', 'INSERT amo_outbox'. Полный отпечаток - в отчёте."""
+    verb = fingerprint.split(' ', 1)[0].upper() if fingerprint else 'UNKNOWN'
+    table = _SQL_TABLE_RE.search(fingerprint)
+    return f'{verb} {table.group(1)}' if table else verb
+
+
+def install_sqlalchemy_timing(engine: AsyncEngine) -> None:
+    """Замеряет каждый SQL-запрос через события курсора синхронного движка под AsyncEngine."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        _record_statement(statement, context, 'ok')
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def _error(exception_context):
+        context = exception_context.execution_context
+        if context is not None and exception_context.statement:
+            _record_statement(exception_context.statement, context,
+                              type(exception_context.original_exception).__name__)
+
+
+def _record_statement(statement: str, context, status: str) -> None:
+    started = getattr(context, '_metrics_started', None)
+    if started is None:
+        return
+    context._metrics_started = None
+    duration = time.perf_counter() - started
+    fingerprint = sql_fingerprint(statement)
+    record_outbound('db', sql_operation_label(fingerprint), status, duration, fingerprint[:500])
+
+
+def create_max_trace_config() -> aiohttp.TraceConfig:
+    """TraceConfig для aiohttp-сессии бота: время каждого запроса к MAX API по методу и пути."""
+    trace_config = aiohttp.TraceConfig(trace_config_ctx_factory=lambda trace_request_ctx: SimpleNamespace(
+        trace_request_ctx=trace_request_ctx, started=None))
+
+    async def on_request_start(session, ctx, params):
+        ctx.started = time.perf_counter()
+
+    async def on_request_end(session, ctx, params):
+        _record_max_request(ctx, params.method, params.url, params.response.status)
+
+    async def on_request_exception(session, ctx, params):
+        _record_max_request(ctx, params.method, params.url, type(params.exception).__name__)
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+def _record_max_request(ctx, method: str, url, status) -> None:
+    if ctx.started is None:
+        return
+    duration = time.perf_counter() - ctx.started
+    path = endpoint_label(url.path)
+    operation = _MAX_OPERATIONS.get((method.upper(), path), f'{method.upper()} {path}')
+    record_outbound('max_api', operation, status, duration, f'{method.upper()} {path}')
@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+from config.config import BASE_DIR
+
+logger = logging.getLogger(__name__)
+
+PROFILE_INTERVAL = 0.01  # 100 снимков в секунду: заметной нагрузки на GIL не даёт
+PROFILE_DEFAULT_SECONDS = 30.0
+PROFILE_MAX_SECONDS = 120.0
+PROFILE_TOP = 25
+
+_PROJECT_DIR = str(BASE_DIR) + os.sep
+# Кадры, в которых поток ничего не делает: event loop ждёт сокеты, рабочие потоки ждут задачи
+_IDLE_FRAMES = {('selectors.py', 'select'), ('threading.py', 'wait'), ('queue.py', 'get'), ('thread.py', '_worker')}
+
+FrameKey = tuple[str, int, str]  # (файл, строка def, имя функции)
+
+
+class ProfilerBusyError(RuntimeError):
+    """Профиль уже снимается: одновременно разрешён только один."""
+
+
+def _frame_label(key: FrameKey) -> str:
+    filename, lineno, name = key
+    if filename.startswith(_PROJECT_DIR):
+        filename = filename[len(_PROJECT_DIR):]
+    else:
+        # Для библиотек оставляем хвост пути вида maxapi/bot.py
+        filename = os.path.join(*filename.split(os.sep)[-2:]) if os.sep in filename else filename
+    return f'{name} ({filename}:{lineno})'
+
+
+@dataclass
+class ProfileResult:
+    """Агрегированные снимки стеков: собственное время, время на стеке и корутины."""
+
+    seconds: float
+    interval: float
+    threads: str
+    samples: int = 0
+    busy_samples: int = 0
+    self_counts: Counter = field(default_factory=Counter)
+    total_counts: Counter = field(default_factory=Counter)
+    coroutine_counts: Counter = field(default_factory=Counter)
+    thread_counts: Counter = field(default_factory=Counter)
+    stacks: Counter = field(default_factory=Counter)
+
+    def add(self, thread_name: str, stack: list[FrameKey], coroutines: set[FrameKey]) -> None:
+        """stack - от внешнего кадра к внутреннему."""
+        self.busy_samples += 1
+        self.coroutine_counts.update(coroutines)
+        self.thread_counts[thread_name] += 1
+        self.self_counts[stack[-1]] += 1
+        seen = set()
+        for key in stack:
+            if key not in seen:
+                seen.add(key)
+                self.total_counts[key] += 1
+        self.stacks[(thread_name, *stack)] += 1
+
+    def render(self, top: int = PROFILE_TOP) -> str:
+        busy = self.busy_samples or 1
+        lines = [
+            f'Профиль за {self.seconds:.1f} с, интервал {self.interval * 1000:.0f} мс, потоки: {self.threads}',
+            f'Снимков: {self.samples}, из них с работой: {self.busy_samples} '
+            f'({self.busy_samples / max(self.samples, 1):.1%}), остальное - ожидание',
+            '',
+            'Потоки (снимков с работой):',
+        ]
+        lines += [f'  {count:>7}  {name}' for name, count in self.thread_counts.most_common()]
+
+        for title, counter in (('Собственное время (функция наверху стека)', self.self_counts),
+                               ('Время на стеке (включая вызванные функции)', self.total_counts),
+                               ('Корутины на стеке', self.coroutine_counts)):
+            lines += ['', f'{title}:', f'  {"снимков":>7}  {"% работы":>8}  функция']
+            for key, count in counter.most_common(top):
+                lines.append(f'  {count:>7}  {count / busy:>8.1%}  {_frame_label(key)}')
+        return '\n'.join(lines) + '\n'
+
+    def folded(self) -> str:
+        """Стеки в формате flamegraph.pl / speedscope: "поток;кадр;кадр количество"."""
+        lines = []
+        for (thread_name, *stack), count in self.stacks.most_common():
+            lines.append(';'.join([thread_name, *(_frame_label(key) for key in stack)]) + f' {count}')
+        return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """Статистический профилировщик: отдельный поток раз в interval снимает стеки через sys._current_frames().
+
+    В отличие от cProfile ничего не вешает на каждый вызов функции, поэтому его можно включать
+    на работающем боте под нагрузкой. Одновременно снимается только один профиль.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL) -> None:
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def profile(self, seconds: float = PROFILE_DEFAULT_SECONDS, threads: str = 'loop') -> ProfileResult:
+        """threads='loop' - только поток event loop, 'all' - ещё и рабочие потоки (запросы к amoCRM и т.п.)."""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError('Профиль уже снимается')
+        seconds = max(0.1, min(float(seconds), PROFILE_MAX_SECONDS))
+        future: Future = Future()
+        loop_thread_id = threading.get_ident()
+        thread = threading.Thread(target=self._run, args=(future, loop_thread_id, seconds, threads),
+                                  name='sampling-profiler', daemon=True)
+        logger.info('Запущен профиль на %.0f с, потоки: %s', seconds, threads)
+        try:
+            thread.start()
+        except BaseException:
+            self._lock.release()
+            raise
+        return await asyncio.wrap_future(future)
+
+    def _run(self, future: Future, loop_thread_id: int, seconds: float, threads: str) -> None:
+        # Блокировку отпускает сам поток: даже если ожидающий отменён, второй профиль не начнётся раньше времени
+        try:
+            result = self._sample(loop_thread_id, seconds, threads)
+        except BaseException as error:
+            if not future.cancelled():
+                future.set_exception(error)
+        else:
+            if not future.cancelled():
+                future.set_result(result)
+        finally:
+            self._lock.release()
+
+    def _sample(self, loop_thread_id: int, seconds: float, threads: str) -> ProfileResult:
+        result = ProfileResult(seconds=seconds, interval=self.interval, threads=threads)
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        next_tick = time.monotonic()
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (threads == 'loop' and thread_id != loop_thread_id):
+                    continue
+                result.samples += 1
+                self._add_stack(result, names.get(thread_id, str(thread_id)), frame, thread_id == loop_thread_id)
+            next_tick += self.interval
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+        return result
+
+    @staticmethod
+    def _add_stack(result: ProfileResult, thread_name: str, frame, is_loop: bool) -> None:
+        code = frame.f_code
+        if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+            return
+        stack: list[FrameKey] = []
+        coroutines: set[FrameKey] = set()
+        in_project = False
+        while frame is not None:
+            code = frame.f_code
+            key = (code.co_filename, code.co_firstlineno, code.co_name)
+            stack.append(key)
+            in_project = in_project or code.co_filename.startswith(_PROJECT_DIR)
+            if code.co_flags & inspect.CO_COROUTINE:
+                coroutines.add(key)
+            frame = frame.f_back
+        # В рабочих потоках интересна только работа нашего кода, а не служебные потоки библиотек
+        if not is_loop and not in_project:
+            return
+        stack.reverse()
+        result.add(thread_name, stack, coroutines)
+
+
+PROFILER = SamplingProfiler()
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import heapq
+import threading
+import time
+from dataclasses import dataclass, field
+
+SLOW_LOG_SIZE = 50  # Сколько самых медленных вызовов храним для отчёта
+
+
+@dataclass(order=True)
+class SlowOperation:
+    duration: float
+    service: str = field(compare=False)
+    operation: str = field(compare=False)
+    status: str = field(compare=False)
+    detail: str = field(compare=False, default='')
+    at: float = field(compare=False, default_factory=time.time)
+
+
+class SlowOperationsLog:
+    """Top-N самых медленных внешних вызовов и сводка по каждой операции (количество, сумма, максимум)."""
+
+    def __init__(self, size: int = SLOW_LOG_SIZE) -> None:
+        self.size = size
+        self._heap: list[SlowOperation] = []
+        # (service, operation) -> [count, total, max]
+        self._totals: dict[tuple[str, str], list] = {}
+        self._lock = threading.Lock()
+
+    def record(self, service: str, operation: str, status: str, duration: float, detail: str = '') -> None:
+        with self._lock:
+            totals = self._totals.get((service, operation))
+            if totals is None:
+                totals = self._totals[(service, operation)] = [0, 0.0, 0.0]
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] = max(totals[2], duration)
+
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, SlowOperation(duration, service, operation, status, detail))
+            elif duration > self._heap[0].duration:
+                heapq.heapreplace(self._heap, SlowOperation(duration, service, operation, status, detail))
+
+    def slowest(self, limit: int | None = None) -> list[SlowOperation]:
+        with self._lock:
+            items = sorted(self._heap, reverse=True)
+        return items[:limit] if limit else items
+
+    def totals(self, limit: int | None = None) -> list[tuple[str, str, int, float, float]]:
+        """Операции по убыванию суммарного времени: (service, operation, count, total, max)."""
+        with self._lock:
+            items = [(service, operation, count, total, max_duration)
+                     for (service, operation), (count, total, max_duration) in self._totals.items()]
+        items.sort(key=lambda item: item[3], reverse=True)
+        return items[:limit] if limit else items
+
+    def reset(self) -> None:
+        with self._lock:
+            self._heap.clear()
+            self._totals.clear()
+
+    def render(self, limit: int = 20) -> str:
+        lines = ['Операции по суммарному времени:',
+                 f'{"сервис":<8} {"операция":<48} {"вызовов":>8} {"всего, с":>10} {"среднее, мс":>12} {"макс, мс":>10}']
+        for service, operation, count, total, max_duration in self.totals(limit):
+            lines.append(f'{service:<8} {operation[:48]:<48} {count:>8} {total:>10.2f} '
+                         f'{total / count * 1000:>12.1f} {max_duration * 1000:>10.1f}')
+
+        lines.extend(['', f'Самые медленные вызовы (top {limit}):'])
+        for item in self.slowest(limit):
+            at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(item.at))
+            lines.append(f'{item.duration * 1000:>9.1f} мс  {at}  {item.service}  {item.operation}  [{item.status}]')
+            if item.detail:
+                lines.append(f'             {item.detail}')
+        return '\n'.join(lines) + '\n'
+
+
+SLOW_LOG = SlowOperationsLog()
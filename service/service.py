@@ -2,6 +2,7 @@ import logging
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from db import async_session_factory
 from db.models import User, HpLessonResult as LessonResult
@@ -9,6 +10,8 @@ from service.questions_lexicon import lessons
 
 logger = logging.getLogger(__name__)
 
+ADMIN_MAX_ID = 125744927  # Кому в главном меню показывается кабинет администратора
+
 
 
 # Функция определяет результаты прохождения уроков и выдаёт наименования кнопок в зависимости от результата
@@ -52,7 +55,7 @@ async def get_lessons_buttons(user: User, session: AsyncSession) -> dict:
                 else:
                     lessons_access[lesson['title']] = close_icon + lesson['descr']
 
-    if user.max_user_id == 125744927:
+    if user.max_user_id == ADMIN_MAX_ID:
         lessons_access['is_admin'] = True
     else:
         lessons_access['is_admin'] = False
@@ -127,4 +130,63 @@ async def lesson_access(user: User, session: AsyncSession, lesson_key: str) -> b
         )
         .limit(1)
     )
-    return result.scalar_one_or_none() is not None
\ No newline at end of file
+    return result.scalar_one_or_none() is not None
+
+
+async def get_user_stat_text(session: AsyncSession, max_id: int) -> str | None:
+    """Текст статистики по урокам для кнопки "Статистика". None, если пользователя нет в БД."""
+    result = await session.execute(
+        select(User)
+        .options(selectinload(User.lesson_results))
+        .where(User.max_user_id == max_id)
+    )
+    user = result.scalar_one_or_none()
+
+    lesson_names = {
+        "lesson_1": "Урок №1",
+        "lesson_2": "Урок №2",
+        "lesson_3": "Урок №3",
+        "lesson_4": "Урок №4",
+        "lesson_5": "Урок №5",
+        "lesson_6": "Урок №6",
+        "lesson_7": "Урок №7",
+        "exam": "Экзамен",
+    }
+
+    if user is None:
+        return None
+
+    results_by_key: dict[str, list[LessonResult]] = {}
+    for lesson in user.lesson_results or []:
+        results_by_key.setdefault(lesson.lesson_key, []).append(lesson)
+
+    lines: list[str] = []
+    for lesson_key in lesson_names.keys():
+        lesson_title = lesson_names.get(lesson_key, lesson_key)
+        lines.append(f"{lesson_title}:")
+
+        attempts = results_by_key.get(lesson_key, [])
+        attempts_sorted = sorted(attempts, key=lambda l: l.id or 0)
+        total_attempts = len(attempts_sorted)
+        successful_attempts = sum(1 for attempt in attempts_sorted if attempt.compleat)
+
+        completed_attempts = [attempt for attempt in attempts_sorted if attempt.completed_at is not None]
+        if completed_attempts:
+            last_completed_attempt = max(
+                completed_attempts,
+                key=lambda attempt: (attempt.completed_at, attempt.id or 0),
+            )
+            if last_completed_attempt.score is not None:
+                last_result_text = f"{last_completed_attempt.score} баллов."
+            else:
+                last_result_text = "нет данных."
+        else:
+            last_result_text = "нет данных."
+
+        lines.append(f"📖 Всего попыток - {total_attempts}")
+        lines.append(f"✅ Успешных - {successful_attempts}")
+        lines.append(f"⏩ Результат последней попытки - {last_result_text}")
+
+        lines.append("")
+    lines.append("Успешной попыткой считается результат: более 80% правильных ответов.")
+    return "\n".join(lines).strip()
@@ -0,0 +1,46 @@
+from service.tracing.exporters import InMemoryTraceCollector, JsonLinesSpanExporter
+from service.tracing.timeline import render_timeline, render_trace_list
+from service.tracing.tracer import (
+    STATUS_ERROR,
+    STATUS_OK,
+    TRACER_PROVIDER,
+    Span,
+    Tracer,
+    TracerProvider,
+    get_current_span,
+    get_tracer,
+)
+
+# Трейсы, которые отдаёт /metrics/traces; подключается к TRACER_PROVIDER в configure_tracing
+TRACE_COLLECTOR = InMemoryTraceCollector()
+
+
+def configure_tracing(enabled: bool = True, file_path: str | None = None) -> JsonLinesSpanExporter | None:
+    """Включает трейсинг обновлений: трейсы копятся в TRACE_COLLECTOR и, если задан file_path, пишутся в файл."""
+    TRACER_PROVIDER.enabled = enabled
+    if not enabled:
+        return None
+    TRACER_PROVIDER.add_exporter(TRACE_COLLECTOR)
+    if not file_path:
+        return None
+    file_exporter = JsonLinesSpanExporter(file_path)
+    TRACER_PROVIDER.add_exporter(file_exporter)
+    return file_exporter
+
+
+__all__ = [
+    "InMemoryTraceCollector",
+    "JsonLinesSpanExporter",
+    "STATUS_ERROR",
+    "STATUS_OK",
+    "Span",
+    "TRACER_PROVIDER",
+    "TRACE_COLLECTOR",
+    "Tracer",
+    "TracerProvider",
+    "configure_tracing",
+    "get_current_span",
+    "get_tracer",
+    "render_timeline",
+    "render_trace_list",
+]
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+from collections import deque
+from pathlib import Path
+
+from service.tracing.tracer import Span
+from services.json_codec import dumps
+
+logger = logging.getLogger(__name__)
+
+TRACE_COLLECTOR_SIZE = 200  # Сколько последних трейсов держим в памяти для /metrics/traces
+
+
+class InMemoryTraceCollector:
+    """Последние завершённые трейсы в памяти процесса: для просмотра без внешних сервисов."""
+
+    def __init__(self, size: int = TRACE_COLLECTOR_SIZE) -> None:
+        self._traces: deque[list[Span]] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[Span]) -> None:
+        if not spans:
+            return
+        with self._lock:
+            self._traces.append(list(spans))
+
+    def recent(self, limit: int = 20) -> list[list[Span]]:
+        with self._lock:
+            traces = list(self._traces)
+        return traces[::-1][:limit]
+
+    def slowest(self, limit: int = 20) -> list[list[Span]]:
+        with self._lock:
+            traces = list(self._traces)
+        return sorted(traces, key=lambda spans: spans[0].duration, reverse=True)[:limit]
+
+    def get(self, trace_id: str) -> list[Span] | None:
+        with self._lock:
+            for spans in self._traces:
+                if spans[0].trace_id == trace_id:
+                    return list(spans)
+        return None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._traces.clear()
+
+
+class JsonLinesSpanExporter:
+    """Пишет спаны в файл по одному JSON на строку. Запись идёт в отдельном потоке, чтобы не блокировать event loop."""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._queue: queue.SimpleQueue[list[Span] | None] = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write_loop, name='trace-file-exporter', daemon=True)
+        self._thread.start()
+
+    def export(self, spans: list[Span]) -> None:
+        self._queue.put(list(spans))
+
+    def _write_loop(self) -> None:
+        with self.path.open('ab') as file:
+            while True:
+                spans = self._queue.get()
+                if spans is None:
+                    break
+                try:
+                    file.write(b''.join(dumps(span.to_dict()) + b'\n' for span in spans))
+                    if self._queue.empty():
+                        file.flush()
+                except Exception:
+                    logger.exception('Не удалось записать трейс в %s', self.path)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout)
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from service.tracing.tracer import STATUS_ERROR, Span
+
+TIMELINE_WIDTH = 60  # Ширина полосы времени в символах
+
+
+def _depths(spans: list[Span]) -> dict[str, int]:
+    parents = {span.span_id: span.parent_id for span in spans}
+    depths: dict[str, int] = {}
+    for span in spans:
+        depth, parent_id = 0, span.parent_id
+        while parent_id is not None and parent_id in parents and depth < 50:
+            depth += 1
+            parent_id = parents[parent_id]
+        depths[span.span_id] = depth
+    return depths
+
+
+def render_timeline(spans: list[Span], width: int = TIMELINE_WIDTH) -> str:
+    """Текстовая диаграмма трейса: каждый спан - строка с отступом по вложенности и полосой на общей шкале."""
+    if not spans:
+        return 'Трейс пуст\n'
+
+    spans = sorted(spans, key=lambda span: span.start_ns)
+    started = min(span.start_ns for span in spans)
+    finished = max(span.end_ns or span.start_ns for span in spans)
+    total = max(finished - started, 1)
+    depths = _depths(spans)
+
+    root = next((span for span in spans if span.parent_id is None), spans[0])
+    lines = [f'trace {root.trace_id}  {root.name}  {total / 1e6:.1f} мс  спанов: {len(spans)}', '']
+    for span in spans:
+        offset = int((span.start_ns - started) / total * width)
+        length = max(1, int(((span.end_ns or finished) - span.start_ns) / total * width))
+        bar = ' ' * offset + '█' * min(length, width - offset)
+        name = '  ' * depths[span.span_id] + span.name
+        mark = ' !' if span.status == STATUS_ERROR else ''
+        lines.append(f'{name[:56]:<56} |{bar:<{width}}| {span.duration * 1000:>9.1f} мс{mark}')
+        detail = span.attributes.get('db.statement') or span.attributes.get('detail')
+        if detail:
+            lines.append(f'{"":<56}  {str(detail)[:120]}')
+    return '\n'.join(lines) + '\n'
+
+
+def render_trace_list(traces: list[list[Span]]) -> str:
+    lines = [f'{"trace_id":<32}  {"длительность, мс":>16}  {"спанов":>6}  корневой спан']
+    for spans in traces:
+        root = spans[0]
+        title = root.name
+        handler = next((span.attributes.get('handler') for span in spans if span.attributes.get('handler')), None)
+        if handler:
+            title = f'{title} -> {handler}'
+        lines.append(f'{root.trace_id:<32}  {root.duration * 1000:>16.1f}  {len(spans):>6}  {title}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import os
+import time
+import traceback
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Protocol
+
+MAX_SPANS_PER_TRACE = 500  # Защита от бесконечных циклов: лишние спаны трейса не записываем
+
+STATUS_UNSET = 'UNSET'
+STATUS_OK = 'OK'
+STATUS_ERROR = 'ERROR'
+
+_current_span: ContextVar[Span | None] = ContextVar('current_span', default=None)
+
+
+class SpanExporter(Protocol):
+    def export(self, spans: list[Span]) -> None: ...
+
+
+def _new_id(size: int) -> str:
+    return os.urandom(size).hex()
+
+
+class _Trace:
+    """Спаны одного обновления; отдаются экспортёрам целиком, когда закрывается корневой спан."""
+
+    __slots__ = ('trace_id', 'spans', 'dropped')
+
+    def __init__(self) -> None:
+        self.trace_id = _new_id(16)
+        self.spans: list[Span] = []
+        self.dropped = 0
+
+    def add(self, span: Span) -> bool:
+        if len(self.spans) >= MAX_SPANS_PER_TRACE:
+            self.dropped += 1
+            return False
+        self.spans.append(span)
+        return True
+
+
+class Span:
+    """Спан с полями и методами как у opentelemetry.trace.Span (в объёме, который нам нужен)."""
+
+    __slots__ = ('name', 'kind', 'span_id', 'parent_id', 'attributes', 'events', 'status', 'status_message',
+                 'start_ns', 'end_ns', '_trace')
+
+    def __init__(self, name: str, trace: _Trace, parent: Span | None, kind: str = 'INTERNAL',
+                 attributes: dict[str, Any] | None = None, start_ns: int | None = None) -> None:
+        self.name = name
+        self.kind = kind
+        self.span_id = _new_id(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes: dict[str, Any] = dict(attributes or {})
+        self.events: list[dict[str, Any]] = []
+        self.status = STATUS_UNSET
+        self.status_message = ''
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: int | None = None
+        self._trace = trace
+
+    @property
+    def trace_id(self) -> str:
+        return self._trace.trace_id
+
+    @property
+    def duration(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e9
+
+    def is_recording(self) -> bool:
+        return self.end_ns is None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: dict[str, Any]) -> None:
+        self.attributes.update(attributes)
+
+    def add_event(self, name: str, attributes: dict[str, Any] | None = None) -> None:
+        self.events.append({'name': name, 'time_unix_nano': time.time_ns(), 'attributes': dict(attributes or {})})
+
+    def set_status(self, status: str, description: str = '') -> None:
+        self.status = status
+        self.status_message = description
+
+    def record_exception(self, exception: BaseException) -> None:
+        self.add_event('exception', {
+            'exception.type': type(exception).__name__,
+            'exception.message': str(exception),
+            'exception.stacktrace': ''.join(traceback.format_exception(exception))[-4000:],
+        })
+
+    def end(self, end_ns: int | None = None) -> None:
+        if self.end_ns is None:
+            self.end_ns = end_ns if end_ns is not None else time.time_ns()
+
+    def to_dict(self) -> dict[str, Any]:
+        # Поля и имена как в OTLP/JSON, чтобы файл можно было загрузить в совместимые инструменты
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'start_time_unix_nano': self.start_ns,
+            'end_time_unix_nano': self.end_ns,
+            'attributes': self.attributes,
+            'events': self.events,
+            'status': {'code': self.status, 'message': self.status_message},
+        }
+
+
+class Tracer:
+    def __init__(self, name: str, provider: TracerProvider) -> None:
+        self.name = name
+        self._provider = provider
+
+    @contextmanager
+    def start_as_current_span(self, name: str, attributes: dict[str, Any] | None = None,
+                              kind: str = 'INTERNAL') -> Iterator[Span | None]:
+        """Открывает спан и делает его текущим. Без текущего трейса создаёт корневой спан нового трейса."""
+        if not self._provider.enabled:
+            yield None
+            return
+
+        parent = _current_span.get()
+        trace = parent._trace if parent is not None else _Trace()
+        span = Span(name, trace, parent, kind=kind, attributes=attributes)
+        recorded = trace.add(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as error:
+            span.record_exception(error)
+            span.set_status(STATUS_ERROR, type(error).__name__)
+            raise
+        finally:
+            span.end()
+            _current_span.reset(token)
+            if parent is None and recorded:
+                self._provider.export(trace)
+
+    def record_span(self, name: str, duration: float, attributes: dict[str, Any] | None = None,
+                    status: str = STATUS_OK, kind: str = 'CLIENT') -> Span | None:
+        """Добавляет в текущий трейс уже завершившуюся операцию (SQL, запрос к API), которая длилась duration секунд.
+        Вне трейса ничего не делает."""
+        parent = _current_span.get()
+        if parent is None or not self._provider.enabled:
+            return None
+        end_ns = time.time_ns()
+        span = Span(name, parent._trace, parent, kind=kind, attributes=attributes,
+                    start_ns=end_ns - int(duration * 1e9))
+        span.set_status(status)
+        span.end(end_ns)
+        parent._trace.add(span)
+        return span
+
+
+class TracerProvider:
+    def __init__(self) -> None:
+        # Включается в configure_tracing: пока экспортёров нет, спаны не создаются вовсе
+        self.enabled = False
+        self._exporters: list[SpanExporter] = []
+
+    def add_exporter(self, exporter: SpanExporter) -> None:
+        self._exporters.append(exporter)
+
+    def remove_exporter(self, exporter: SpanExporter) -> None:
+        if exporter in self._exporters:
+            self._exporters.remove(exporter)
+
+    def get_tracer(self, name: str) -> Tracer:
+        return Tracer(name, self)
+
+    def export(self, trace: _Trace) -> None:
+        for exporter in self._exporters:
+            exporter.export(trace.spans)
+
+
+TRACER_PROVIDER = TracerProvider()
+
+
+def get_tracer(name: str) -> Tracer:
+    return TRACER_PROVIDER.get_tracer(name)
+
+
+def get_current_span() -> Span | None:
+    return _current_span.get()
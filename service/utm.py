@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+import aiohttp
+
+from services.http_client import get_http_session
+
+logger = logging.getLogger(__name__)
+
+UTM_CACHE_TTL = 300  # Сколько секунд держим ответ UTM-сервиса для одного webhook_id
+UTM_CACHE_MAX_SIZE = 10_000
+UTM_REQUEST_TIMEOUT = 5
+
+# webhook_id -> (момент истечения, задача запроса). Храним задачу, а не результат,
+# чтобы параллельные обращения к одному webhook_id ждали один и тот же запрос.
+_utm_cache: dict[str, tuple[float, asyncio.Task]] = {}
+
+
+def _empty_utm_data() -> dict[str, str]:
+    return {
+        "utm_source": "",
+        "utm_medium": "",
+        "utm_campaign": "",
+        "utm_content": "",
+        "utm_term": "",
+        "yclid": "",
+    }
+
+
+async def _fetch_utm_data(webhook_url: str, webhook_id: str, utm_token: str) -> dict | None:
+    try:
+        async with get_http_session().get(
+            f"{webhook_url}{webhook_id}",
+            params={"utm_token": utm_token},
+            timeout=aiohttp.ClientTimeout(total=UTM_REQUEST_TIMEOUT),
+        ) as response:
+            response.raise_for_status()
+            payload = await response.json()
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as error:
+        logger.warning("Не удалось получить UTM метки для webhook_id=%s: %r", webhook_id, error)
+        return None
+
+    if not isinstance(payload, dict):
+        return None
+
+    logger.info(
+        "Получены UTM метки клиента: %s; %s; %s; %s; %s; %s",
+        payload.get("utm_source"),
+        payload.get("utm_medium"),
+        payload.get("utm_campaign"),
+        payload.get("utm_content"),
+        payload.get("utm_term"),
+        payload.get("yclid"),
+    )
+    return payload
+
+
+def _evict(now: float) -> None:
+    expired = [key for key, (expires_at, _) in _utm_cache.items() if expires_at <= now]
+    for key in expired:
+        del _utm_cache[key]
+    # Словарь упорядочен по времени вставки: при переполнении выкидываем самые старые записи
+    while len(_utm_cache) >= UTM_CACHE_MAX_SIZE:
+        del _utm_cache[next(iter(_utm_cache))]
+
+
+def prefetch_utm_data(webhook_url: str, webhook_id: str, utm_token: str) -> asyncio.Task:
+    """Запускает запрос UTM меток в фоне (или возвращает уже запущенный из кеша)."""
+    now = time.monotonic()
+    cached = _utm_cache.get(webhook_id)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    _evict(now)
+    task = asyncio.create_task(
+        _fetch_utm_data(webhook_url, webhook_id, utm_token),
+        name=f"utm-fetch-{webhook_id}",
+    )
+    _utm_cache[webhook_id] = (now + UTM_CACHE_TTL, task)
+    return task
+
+
+async def get_utm_data(webhook_url: str, webhook_id: str | None, utm_token: str) -> dict[str, str]:
+    utm_data = _empty_utm_data()
+    if webhook_id is None:
+        return utm_data
+
+    task = prefetch_utm_data(webhook_url, webhook_id, utm_token)
+    payload = await asyncio.shield(task)
+    if payload is None:
+        # Неудачный ответ не кешируем, чтобы следующий запрос попробовал ещё раз
+        cached = _utm_cache.get(webhook_id)
+        if cached is not None and cached[1] is task:
+            del _utm_cache[webhook_id]
+        return utm_data
+
+    utm_data.update(payload)
+    return utm_data
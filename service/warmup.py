@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from amo_api.amo_api import AmoCRMWrapper
+from db import warmup_db
+from services.http_client import get_http_session
+
+logger = logging.getLogger(__name__)
+
+
+async def _warmup_amo(amo_api: AmoCRMWrapper, connections: int) -> int:
+    # Запросы идут параллельно, поэтому requests-сессия открывает отдельное соединение на каждый
+    results = await asyncio.gather(
+        *(asyncio.to_thread(amo_api.check_connection) for _ in range(connections)),
+        return_exceptions=True,
+    )
+    ready = 0
+    for result in results:
+        if isinstance(result, BaseException):
+            logger.warning("amoCRM warmup request failed: %r", result)
+        elif not result:
+            logger.warning("amoCRM warmup request returned non-200 response")
+        else:
+            ready += 1
+    return ready
+
+
+async def _warmup_http(url: str, connections: int) -> int:
+    session = get_http_session()
+
+    async def _touch() -> None:
+        # Нам важен сам факт TCP/TLS-соединения, код ответа сервиса не проверяем
+        async with session.get(url) as response:
+            await response.read()
+
+    results = await asyncio.gather(*(_touch() for _ in range(connections)), return_exceptions=True)
+    ready = 0
+    for result in results:
+        if isinstance(result, BaseException):
+            logger.warning("HTTP warmup request to %s failed: %r", url, result)
+        else:
+            ready += 1
+    return ready
+
+
+async def warmup_connections(
+    amo_api: AmoCRMWrapper,
+    webhook_url: str,
+    db_connections: int,
+    http_connections: int,
+) -> dict[str, int]:
+    """Заранее открывает соединения с БД, amoCRM и UTM-сервисом, чтобы первые пользователи
+    после деплоя не платили за установку соединений."""
+    stats = {"db": 0, "amo": 0, "utm": 0}
+
+    results = await asyncio.gather(
+        warmup_db(db_connections),
+        _warmup_amo(amo_api, http_connections),
+        _warmup_http(webhook_url, http_connections),
+        return_exceptions=True,
+    )
+    for key, result in zip(stats.keys(), results):
+        if isinstance(result, BaseException):
+            logger.error("Warmup of %s failed: %r", key, result)
+            continue
+        stats[key] = result
+
+    logger.info(
+        "Connections warmup finished: db=%s/%s amo=%s/%s utm=%s/%s",
+        stats["db"],
+        db_connections,
+        stats["amo"],
+        http_connections,
+        stats["utm"],
+        http_connections,
+    )
+    return stats
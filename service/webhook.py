@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import logging
+import re
+from collections import OrderedDict
+from http import HTTPStatus
+from typing import Any
+from secrets import compare_digest
+
+from aiohttp import web
+from maxapi import Bot, Dispatcher
+from maxapi.webhook.aiohttp import AiohttpMaxWebhook
+
+from amo_api.lead_status import save_lead_status
+from db import async_session_factory
+from service.ingress import INGRESS_QUEUE_SIZE, INGRESS_SHED_AT, UpdateIngress
+from service.metrics import (PROFILE_DEFAULT_SECONDS, PROFILER, REGISTRY, SLOW_LOG, WEBHOOK_UPDATES,
+                             ProfilerBusyError)
+from service.tracing import TRACE_COLLECTOR, get_tracer, render_timeline, render_trace_list
+from services.json_codec import JSONDecodeError, dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# leads[status][0][status_id]=..., leads[add][0][id]=... и т.п.
+_LEAD_FIELD_RE = re.compile(r'^leads\[(status|add|update)\]\[(\d+)\]\[(\w+)\]$')
+
+UPDATE_DEDUP_SIZE = 10000  # Сколько последних обновлений MAX помним для отсева повторных доставок
+_OK_BODY = dumps({'ok': True})
+
+tracer = get_tracer(__name__)
+
+
+def parse_amo_lead_statuses(form: dict[str, str]) -> list[dict[str, int]]:
+    """Достаёт из формы вебхука amoCRM пары сделка -> этап."""
+    leads: dict[tuple[str, str], dict[str, str]] = {}
+    for key, value in form.items():
+        match = _LEAD_FIELD_RE.match(key)
+        if match is None:
+            continue
+        action, index, field = match.groups()
+        leads.setdefault((action, index), {})[field] = value
+
+    statuses = []
+    for lead in leads.values():
+        try:
+            statuses.append({
+                'lead_id': int(lead['id']),
+                'status_id': int(lead['status_id']),
+                'pipeline_id': int(lead['pipeline_id']) if lead.get('pipeline_id') else None,
+            })
+        except (KeyError, ValueError):
+            continue
+    return statuses
+
+
+def update_dedup_key(event: dict[str, Any]) -> tuple | None:
+    """Ключ обновления MAX для отсева повторов: mid сообщения, callback_id кнопки
+    или (тип, время, чат, пользователь) для остальных событий."""
+    update_type = event.get('update_type')
+    message = event.get('message') or {}
+    mid = (message.get('body') or {}).get('mid')
+    if mid:
+        return update_type, mid
+    callback_id = (event.get('callback') or {}).get('callback_id')
+    if callback_id:
+        return update_type, callback_id
+    timestamp = event.get('timestamp')
+    if timestamp is None:
+        return None
+    user_id = (event.get('user') or {}).get('user_id')
+    return update_type, timestamp, event.get('chat_id'), user_id
+
+
+class UpdateDeduplicator:
+    """Помнит ключи последних size обновлений; MAX повторяет доставку, если не дождался ответа."""
+
+    def __init__(self, size: int = UPDATE_DEDUP_SIZE) -> None:
+        self.size = size
+        self._seen: OrderedDict[tuple, None] = OrderedDict()
+
+    def is_duplicate(self, key: tuple | None) -> bool:
+        if key is None:
+            return False
+        if key in self._seen:
+            self._seen.move_to_end(key)
+            return True
+        self._seen[key] = None
+        if len(self._seen) > self.size:
+            self._seen.popitem(last=False)
+        return False
+
+    def forget(self, key: tuple | None) -> None:
+        # Обновление не принято (очередь полна): повторную доставку от MAX надо обработать, а не отсеять
+        if key is not None:
+            self._seen.pop(key, None)
+
+
+class BotWebhook(AiohttpMaxWebhook):
+    """Вебхук MAX + служебные маршруты бота на том же aiohttp-приложении."""
+
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        *,
+        secret: str | None = None,
+        amo_path: str = '/amo/leads',
+        amo_secret: str | None = None,
+        metrics_path: str = '/metrics',
+        metrics_token: str | None = None,
+        ingress_workers: int = 0,
+        ingress_queue_size: int = INGRESS_QUEUE_SIZE,
+        ingress_shed_at: float = INGRESS_SHED_AT,
+    ) -> None:
+        super().__init__(dp=dp, bot=bot, secret=secret)
+        self.amo_path = amo_path
+        self.amo_secret = amo_secret
+        self.metrics_path = metrics_path
+        self.metrics_token = metrics_token
+        self.dedup = UpdateDeduplicator()
+        # Без обработчиков очереди (ingress_workers=0) обновление обрабатывается прямо в HTTP-запросе, как раньше
+        self.ingress = None
+        if ingress_workers > 0:
+            self.ingress = UpdateIngress(self._process_update, workers=ingress_workers,
+                                         queue_size=ingress_queue_size, shed_at=ingress_shed_at)
+
+    def setup(self, app: web.Application, path: str = '/') -> None:
+        # Маршрут MAX регистрируем сами, а не через super(): тело разбираем быстрым JSON и отсеиваем повторы
+        app.router.add_post(path, self._max_update_handler)
+        if self.amo_secret:
+            app.router.add_post(self.amo_path, self._amo_leads_handler)
+        else:
+            # Без секрета кто угодно мог бы переписать локальное зеркало этапов сделок
+            logger.warning('AMOCRM_WEBHOOK_SECRET не задан: вебхук amoCRM %s отключён', self.amo_path)
+        if self.metrics_token:
+            app.router.add_get(self.metrics_path, self._metrics_handler)
+            app.router.add_get(f'{self.metrics_path.rstrip("/")}/slow', self._slow_report_handler)
+            app.router.add_get(f'{self.metrics_path.rstrip("/")}/traces', self._traces_handler)
+            app.router.add_get(f'{self.metrics_path.rstrip("/")}/traces/{{trace_id}}', self._trace_timeline_handler)
+            app.router.add_get(f'{self.metrics_path.rstrip("/")}/profile', self._profile_handler)
+        else:
+            # Метрики, трейсы и профиль раскрывают SQL, ошибки и стеки: без токена их не отдаём вовсе
+            logger.warning('METRICS_TOKEN не задан: %s, /slow, /traces и /profile отключены', self.metrics_path)
+        if self.ingress is not None:
+            app.on_startup.append(self._start_ingress)
+            # on_shutdown вызывается после закрытия сокета: новых обновлений уже нет, дорабатываем принятые
+            app.on_shutdown.append(self._stop_ingress)
+
+    async def _start_ingress(self, app: web.Application) -> None:
+        self.ingress.start()
+
+    async def _stop_ingress(self, app: web.Application) -> None:
+        await self.ingress.stop()
+
+    async def _max_update_handler(self, request: web.Request) -> web.Response:
+        if self.secret is not None:
+            incoming = request.headers.get('X-Max-Bot-Api-Secret')
+            if incoming is None or not compare_digest(incoming, self.secret):
+                return web.Response(status=HTTPStatus.FORBIDDEN, text='Forbidden')
+
+        try:
+            event_json = loads(await request.read())
+        except JSONDecodeError:
+            logger.warning('Вебхук MAX: тело запроса не является JSON')
+            return web.Response(status=HTTPStatus.BAD_REQUEST, text='Bad Request')
+        if not isinstance(event_json, dict):
+            return web.Response(status=HTTPStatus.BAD_REQUEST, text='Bad Request')
+
+        update_type = str(event_json.get('update_type'))
+        dedup_key = update_dedup_key(event_json)
+        if self.dedup.is_duplicate(dedup_key):
+            WEBHOOK_UPDATES.inc(update_type=update_type, result='duplicate')
+            logger.info(f'Вебхук MAX: повторная доставка {update_type} пропущена')
+        elif self.ingress is None:
+            WEBHOOK_UPDATES.inc(update_type=update_type, result='dispatched')
+            await self._process_update(event_json)
+        else:
+            result = self.ingress.submit(event_json, update_type)
+            WEBHOOK_UPDATES.inc(update_type=update_type, result=result)
+            if result == 'deferred':
+                self.dedup.forget(dedup_key)
+                logger.warning(f'Вебхук MAX: очередь заполнена ({self.ingress.depth}), {update_type} отложено')
+                return web.Response(status=HTTPStatus.SERVICE_UNAVAILABLE, text='Busy',
+                                    headers={'Retry-After': '1'})
+            if result == 'shed':
+                logger.info(f'Вебхук MAX: очередь перегружена, {update_type} пропущено')
+        return web.Response(body=_OK_BODY, content_type='application/json')
+
+    async def _process_update(self, event_json: dict[str, Any], queue_wait: float | None = None) -> None:
+        update_type = str(event_json.get('update_type'))
+        attributes = {'update_type': update_type}
+        if queue_wait is not None:
+            attributes['queue.wait_ms'] = round(queue_wait * 1000, 1)
+        # Корневой спан трейса обновления: разбор, middleware, хендлер и все его внешние вызовы.
+        # Из очереди обновление приходит в задачу обработчика без контекста запроса, поэтому трейс начинается здесь
+        with tracer.start_as_current_span('max.update', attributes, kind='SERVER'):
+            await self._dispatch(event_json)
+
+    def _metrics_allowed(self, request: web.Request) -> bool:
+        if not self.metrics_token:
+            return False
+        return compare_digest(request.headers.get('Authorization', ''), f'Bearer {self.metrics_token}')
+
+    async def _metrics_handler(self, request: web.Request) -> web.Response:
+        if not self._metrics_allowed(request):
+            return web.Response(status=HTTPStatus.FORBIDDEN, text='Forbidden')
+        return web.Response(body=REGISTRY.render().encode(),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    async def _slow_report_handler(self, request: web.Request) -> web.Response:
+        # Отчёт о самых медленных вызовах amoCRM, БД и MAX API: ?limit=N, ?reset=1 - начать замер заново
+        if not self._metrics_allowed(request):
+            return web.Response(status=HTTPStatus.FORBIDDEN, text='Forbidden')
+        try:
+            limit = max(1, min(int(request.query.get('limit', 20)), SLOW_LOG.size))
+        except ValueError:
+            limit = 20
+        report = SLOW_LOG.render(limit)
+        if request.query.get('reset') == '1':
+            SLOW_LOG.reset()
+        return web.Response(text=report)
+
+    async def _traces_handler(self, request: web.Request) -> web.Response:
+        # Список трейсов: ?sort=slow (по умолчанию) или ?sort=recent, ?limit=N
+        if not self._metrics_allowed(request):
+            return web.Response(status=HTTPStatus.FORBIDDEN, text='Forbidden')
+        try:
+            limit = max(1, int(request.query.get('limit', 20)))
+        except ValueError:
+            limit = 20
+        if request.query.get('sort') == 'recent':
+            traces = TRACE_COLLECTOR.recent(limit)
+        else:
+            traces = TRACE_COLLECTOR.slowest(limit)
+        return web.Response(text=render_trace_list(traces))
+
+    async def _trace_timeline_handler(self, request: web.Request) -> web.Response:
+        if not self._metrics_allowed(request):
+            return web.Response(status=HTTPStatus.FORBIDDEN, text='Forbidden')
+        spans = TRACE_COLLECTOR.get(request.match_info['trace_id'])
+        if spans is None:
+            return web.Response(status=HTTPStatus.NOT_FOUND, text='Trace not found')
+        return web.Response(text=render_timeline(spans))
+
+    async def _profile_handler(self, request: web.Request) -> web.Response:
+        # Профиль работающего бота: ?seconds=N, ?threads=all - ещё и рабочие потоки, ?format=folded - для flamegraph
+        if not self._metrics_allowed(request):
+            return web.Response(status=HTTPStatus.FORBIDDEN, text='Forbidden')
+        try:
+            seconds = float(request.query.get('seconds', PROFILE_DEFAULT_SECONDS))
+        except ValueError:
+            seconds = PROFILE_DEFAULT_SECONDS
+        threads = 'all' if request.query.get('threads') == 'all' else 'loop'
+        try:
+            result = await PROFILER.profile(seconds, threads=threads)
+        except ProfilerBusyError:
+            return web.Response(status=HTTPStatus.CONFLICT, text='Profile is already running')
+
+        folded = request.query.get('format') == 'folded'
+        filename = 'profile.folded.txt' if folded else 'profile.txt'
+        return web.Response(text=result.folded() if folded else result.render(),
+                            headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+    async def _amo_leads_handler(self, request: web.Request) -> web.Response:
+        # amoCRM не умеет подписывать вебхуки, поэтому секрет передаём в query-параметре URL
+        incoming = request.query.get('token', '')
+        if not self.amo_secret or not compare_digest(incoming, self.amo_secret):
+            return web.Response(status=HTTPStatus.FORBIDDEN, text='Forbidden')
+
+        form = await request.post()
+        statuses = parse_amo_lead_statuses(dict(form))
+        if not statuses:
+            return web.Response(status=HTTPStatus.OK, text='ok')
+
+        try:
+            async with async_session_factory() as session:
+                for lead in statuses:
+                    await save_lead_status(session, **lead)
+                await session.commit()
+        except Exception as error:
+            # Отвечаем ошибкой, чтобы amoCRM повторил доставку
+            logger.exception(f'Не удалось сохранить этапы сделок из вебхука amoCRM: {error}')
+            return web.Response(status=HTTPStatus.INTERNAL_SERVER_ERROR, text='error')
+
+        logger.info(f'Вебхук amoCRM: обновлены этапы {len(statuses)} сделок')
+        return web.Response(status=HTTPStatus.OK, text='ok')
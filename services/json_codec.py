@@ -0,0 +1,40 @@
+"""JSON для горячих путей: вебхуки MAX и запросы к amoCRM.
+
+Если установлен orjson - используем его, иначе стандартный json.
+dumps всегда возвращает bytes (готовое тело запроса), loads принимает bytes и str.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson необязателен
+    orjson = None
+
+if orjson is not None:
+    BACKEND = 'orjson'
+    # orjson.JSONDecodeError наследуется от json.JSONDecodeError, поэтому ловить можно любой из них
+    JSONDecodeError = orjson.JSONDecodeError
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(data: bytes | bytearray | memoryview | str) -> Any:
+        return orjson.loads(data)
+else:
+    BACKEND = 'json'
+    JSONDecodeError = json.JSONDecodeError
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode()
+
+    def loads(data: bytes | bytearray | memoryview | str) -> Any:
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+
+def dumps_str(obj: Any) -> str:
+    return dumps(obj).decode()
@@ -333,6 +333,28 @@ def extract_phone_from_vcf(vcf: str) -> str | None:
     return re.sub(r"[^\d+]", "", raw)
 
 
+def normalize_phone(phone: str | None) -> str | None:
+    """Приводит номер к виду 7XXXXXXXXXX: +7..., 8... и 10-значные номера считаются одним номером."""
+    if not phone:
+        return None
+    digits = re.sub(r"\D", "", str(phone))
+    if len(digits) == 10:
+        return '7' + digits
+    if len(digits) == 11 and digits[0] in '78':
+        return '7' + digits[1:]
+    return digits or None
+
+
+def phone_variants(phone: str | None) -> list[str]:
+    """Варианты записи номера, под которыми он может храниться в amoCRM (7... и 8...)."""
+    normalized = normalize_phone(phone)
+    if normalized is None:
+        return []
+    if len(normalized) == 11 and normalized.startswith('7'):
+        return [normalized, '8' + normalized[1:]]
+    return [normalized]
+
+
 
 async def get_main_menu(user: User, session: AsyncSession) -> InlineKeyboardBuilder:
     builder = InlineKeyboardBuilder()
@@ -1,5 +1,5 @@
 import asyncio
-from json import JSONDecodeError, loads
+from services.json_codec import JSONDecodeError, loads
 from maxapi import Bot
 from maxapi.enums.upload_type import UploadType
 from maxapi.types.attachments.upload import AttachmentUpload, AttachmentPayload